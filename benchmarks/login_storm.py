@@ -0,0 +1,99 @@
+"""Нагрузочный тест: задержка соседних запросов во время шторма логинов.
+
+Запускается против поднятого сервиса:
+
+    python -m benchmarks.login_storm --url http://0.0.0.0:8080
+
+Сначала измеряется задержка легкого эндпоинта без нагрузки, затем
+та же задержка во время параллельных запросов /auth. Если bcrypt
+выполняется в event loop, p99 под нагрузкой растет на сотни мс.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+PROBE_PATH = "/ping/db-pool"
+
+
+def percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * len(values))))
+    return values[index]
+
+
+async def probe(client: httpx.AsyncClient, count: int) -> list:
+    """Последовательно запросить легкий эндпоинт и вернуть задержки в мс."""
+    latencies = []
+    for _ in range(count):
+        start_time = time.perf_counter()
+        response = await client.get(PROBE_PATH)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return latencies
+
+
+async def login_storm(
+    client: httpx.AsyncClient, credentials: dict, concurrency: int, stop
+):
+    """Непрерывно логиниться в concurrency параллельных потоков."""
+
+    async def worker():
+        while not stop.is_set():
+            response = await client.post("/auth", data=credentials)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def report(title: str, latencies: list) -> None:
+    print(
+        f"{title}: p50={statistics.median(latencies):.1f} ms "
+        f"p99={percentile(latencies, 99):.1f} ms "
+        f"max={max(latencies):.1f} ms"
+    )
+
+
+async def main(url: str, concurrency: int, probes: int) -> None:
+    credentials = {
+        "username": f"storm-{uuid.uuid4().hex[:8]}@test.com",
+        "password": "storm-password",
+    }
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=60
+    ) as client:
+        response = await client.post(
+            "/register",
+            json={
+                "email": credentials["username"],
+                "password": credentials["password"],
+            },
+        )
+        response.raise_for_status()
+
+        report("без нагрузки", await probe(client, probes))
+
+        stop = asyncio.Event()
+        storm = asyncio.create_task(
+            login_storm(client, credentials, concurrency, stop)
+        )
+        # даем шторму разогнаться перед замером
+        await asyncio.sleep(1)
+        latencies = await probe(client, probes)
+        stop.set()
+        await storm
+        report(f"во время {concurrency} параллельных логинов", latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://0.0.0.0:8080")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--probes", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.concurrency, args.probes))
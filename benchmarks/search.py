@@ -0,0 +1,154 @@
+"""Задержка поиска файлов на таблице с миллионом файлов пользователя.
+
+Запускается против БД сервиса с примененными миграциями:
+
+    python -m benchmarks.search --rows 1000000 --runs 20
+
+Сначала для отдельного пользователя одним запросом INSERT ... SELECT
+generate_series создаются файлы (повторный запуск с тем же числом строк
+их переиспользует), затем каждый вариант поиска выполняется runs раз
+через FilesService.search_files. С --explain для каждого варианта
+печатается план запроса, в нем должны быть trigram индексы, а не
+Seq Scan по files. Счетчики папок и занятого места для этого
+пользователя не заполняются.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import func, select, text
+
+from src.db.db import async_session
+from src.models.file import File
+from src.models.user import User
+from src.services.files import FilesService
+
+BENCH_EMAIL = "search-bench@test.com"
+
+SEED_FILES = """
+INSERT INTO files (id, account_id, name, created_ad, path, folder, size)
+SELECT
+    gen_random_uuid(),
+    CAST(:email AS text),
+    name,
+    now() - make_interval(secs => num),
+    CAST(:email AS text) || '/folder-' || (num % 1000) || '/' || name,
+    CAST(:email AS text) || '/folder-' || (num % 1000),
+    (num * 7919) % 10000000
+FROM (
+    SELECT
+        num,
+        'file-' || md5(num::text) || '.'
+            || (ARRAY['txt', 'pdf', 'jpg', 'png', 'csv'])[num % 5 + 1]
+            AS name
+    FROM generate_series(1, :rows) AS num
+) AS seed
+"""
+
+SEARCHES = {
+    "подстрока в имени": {"name": "abc1"},
+    "начало имени": {"prefix": "file-abc"},
+    "подстрока в пути": {"path": "folder-42/file-1"},
+    "расширение и размер": {
+        "extension": "pdf",
+        "min_size": 1000,
+        "max_size": 50000,
+    },
+    "папка, сортировка по размеру": {
+        "folder": "folder-7",
+        "sort": "size",
+        "descending": False,
+    },
+}
+
+
+def percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * len(values))))
+    return values[index]
+
+
+def report(title: str, latencies: list) -> None:
+    print(
+        f"{title}: p50={statistics.median(latencies):.1f} ms "
+        f"p99={percentile(latencies, 99):.1f} ms "
+        f"max={max(latencies):.1f} ms"
+    )
+
+
+async def seed(rows: int) -> None:
+    """Создать пользователя и rows его файлов, если их еще нет."""
+    async with async_session() as session:
+        count = await session.scalar(
+            select(func.count()).where(File.account_id == BENCH_EMAIL)
+        )
+        if count == rows:
+            return
+
+        print(f"Создание {rows} файлов...")
+        await session.execute(
+            text("DELETE FROM files WHERE account_id = :email"),
+            {"email": BENCH_EMAIL},
+        )
+        if await session.get(User, BENCH_EMAIL) is None:
+            session.add(User(email=BENCH_EMAIL, password="-"))
+            await session.flush()
+        await session.execute(
+            text(SEED_FILES), {"email": BENCH_EMAIL, "rows": rows}
+        )
+        await session.commit()
+    async with async_session() as session:
+        await session.execute(text("ANALYZE files"))
+        await session.commit()
+
+
+async def explain(params: dict, limit: int) -> None:
+    """Напечатать план запроса поиска."""
+    filters = {
+        key: value
+        for key, value in params.items()
+        if key not in ("sort", "descending")
+    }
+    column = getattr(File, params.get("sort", "created_ad"))
+    query = (
+        select(File.id)
+        .where(*FilesService.get_search_conditions(BENCH_EMAIL, **filters))
+        .order_by(column, File.id)
+        .limit(limit)
+    )
+    async with async_session() as session:
+        connection = await session.connection()
+        sql = query.compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+        plan = await connection.exec_driver_sql(f"EXPLAIN {sql}")
+        for line in plan.scalars():
+            print(f"    {line}")
+
+
+async def main(rows: int, runs: int, limit: int, show_plan: bool) -> None:
+    await seed(rows)
+    for title, params in SEARCHES.items():
+        if show_plan:
+            await explain(params, limit)
+        latencies = []
+        for _ in range(runs):
+            start_time = time.perf_counter()
+            async with async_session() as session:
+                await FilesService.search_files(
+                    session, BENCH_EMAIL, limit=limit, **params
+                )
+            latencies.append((time.perf_counter() - start_time) * 1000)
+        report(title, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--explain", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.runs, args.limit, args.explain))
@@ -0,0 +1,72 @@
+"""Замер времени старта: импорт src.main:app и первый запрос.
+
+Каждый запуск выполняется в отдельном процессе, чтобы модули
+импортировались с нуля:
+
+    python -m benchmarks.startup --runs 10
+
+Нужны переменные окружения сервиса (.env), БД и хранилище не нужны:
+первый запрос идет к /ping/db-pool через TestClient без lifespan.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE_PATH = "/ping/db-pool"
+
+RUN_ONCE = f"""
+import json
+import time
+
+start_time = time.perf_counter()
+from src.main import app
+imported = time.perf_counter()
+
+from starlette.testclient import TestClient
+
+client = TestClient(app)
+request_start = time.perf_counter()
+response = client.get("{PROBE_PATH}")
+response.raise_for_status()
+finished = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start_time) * 1000,
+    "first_request_ms": (finished - request_start) * 1000,
+}}))
+"""
+
+
+def run_once() -> dict:
+    """Запустить приложение в новом процессе и получить замеры."""
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_ONCE],
+        capture_output=True,
+        check=True,
+        text=True,
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def report(title: str, values: list) -> None:
+    print(
+        f"{title}: median={statistics.median(values):.1f} ms "
+        f"min={min(values):.1f} ms max={max(values):.1f} ms"
+    )
+
+
+def main(runs: int) -> None:
+    results = [run_once() for _ in range(runs)]
+    report("импорт src.main:app", [r["import_ms"] for r in results])
+    report("первый запрос", [r["first_request_ms"] for r in results])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    main(args.runs)
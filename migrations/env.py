@@ -9,7 +9,12 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from src.core.config import get_settings
 from src.models.base import Base
+from src.models.blob import Blob  # noqa F401
 from src.models.file import File  # noqa F401
+from src.models.folder import Folder  # noqa F401
+from src.models.job import Job  # noqa F401
+from src.models.upload import DirectUpload, UploadSession  # noqa F401
+from src.models.usage import UserUsage  # noqa F401
 from src.models.user import User  # noqa F401
 
 # this is the Alembic Config object, which provides
@@ -1,15 +1,48 @@
 from alembic import command as alembic_command
 from alembic.config import Config as AlembicConfig
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from src.core.config import get_settings
 
 
-def upgrade_head() -> None:
-    """Выполнить миграции."""
+class MigrationsNotAppliedError(RuntimeError):
+    pass
+
+
+def get_alembic_config() -> AlembicConfig:
+    """Получить конфигурацию alembic для БД из настроек."""
     settings = get_settings()
     alembic_config = AlembicConfig(f"{settings.base_dir}/alembic.ini")
     alembic_config.set_main_option(
         "script_location", f"{(str(settings.base_dir))}/migrations"
     )
     alembic_config.set_main_option("sqlalchemy.url", str(settings.db_url))
-    alembic_command.upgrade(alembic_config, "head")
+    return alembic_config
+
+
+def upgrade_head() -> None:
+    """Выполнить миграции."""
+    alembic_command.upgrade(get_alembic_config(), "head")
+
+
+async def check_revision(engine: AsyncEngine) -> None:
+    """Проверить, что БД на последней ревизии, не выполняя миграций.
+
+    Читает только таблицу alembic_version, поэтому подходит для
+    проверки при старте каждого процесса сервиса.
+    """
+    script = ScriptDirectory.from_config(get_alembic_config())
+    heads = set(script.get_heads())
+    async with engine.connect() as connection:
+        current = await connection.run_sync(
+            lambda sync_connection: set(
+                MigrationContext.configure(sync_connection).get_current_heads()
+            )
+        )
+    if current != heads:
+        raise MigrationsNotAppliedError(
+            f"Ревизия БД {sorted(current)} не совпадает с последней "
+            f"{sorted(heads)}, выполните `python src migrate`"
+        )
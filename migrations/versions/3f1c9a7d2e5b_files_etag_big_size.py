@@ -0,0 +1,40 @@
+"""files etag column, bigint size
+
+Revision ID: 3f1c9a7d2e5b
+Revises: 6b91a5b56e4a
+Create Date: 2026-10-18 10:02:11.418305
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1c9a7d2e5b"
+down_revision: Union[str, None] = "6b91a5b56e4a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("files", sa.Column("etag", sa.String(), nullable=True))
+    op.alter_column(
+        "files",
+        "size",
+        existing_type=sa.Integer(),
+        type_=sa.BigInteger(),
+        existing_nullable=True,
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "files",
+        "size",
+        existing_type=sa.BigInteger(),
+        type_=sa.Integer(),
+        existing_nullable=True,
+    )
+    op.drop_column("files", "etag")
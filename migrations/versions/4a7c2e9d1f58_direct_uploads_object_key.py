@@ -0,0 +1,68 @@
+"""direct_uploads table and files.object_key for unique upload keys
+
+Revision ID: 4a7c2e9d1f58
+Revises: b38f6e2a9c15
+Create Date: 2026-10-18 21:14:06.318752
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4a7c2e9d1f58"
+down_revision: Union[str, None] = "b38f6e2a9c15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "files",
+        sa.Column("object_key", sa.String(length=300), nullable=True),
+    )
+    op.create_table(
+        "direct_uploads",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("account_id", sa.String(), nullable=False),
+        sa.Column("path", sa.String(length=300), nullable=False),
+        sa.Column("object_key", sa.String(length=300), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["users.email"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_direct_uploads_created_at"),
+        "direct_uploads",
+        ["created_at"],
+        unique=False,
+    )
+    # индекс строится без блокировки записи в большую таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_files_object_key"),
+            "files",
+            ["object_key"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_files_object_key"),
+            table_name="files",
+            postgresql_concurrently=True,
+        )
+    op.drop_index(
+        op.f("ix_direct_uploads_created_at"), table_name="direct_uploads"
+    )
+    op.drop_table("direct_uploads")
+    op.drop_column("files", "object_key")
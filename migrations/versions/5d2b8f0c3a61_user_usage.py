@@ -0,0 +1,47 @@
+"""user_usage table with per-user storage usage counters
+
+Revision ID: 5d2b8f0c3a61
+Revises: 0a6c8e2f71d4
+Create Date: 2026-10-18 17:12:48.530214
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5d2b8f0c3a61"
+down_revision: Union[str, None] = "0a6c8e2f71d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_usage",
+        sa.Column("account_id", sa.String(), nullable=False),
+        sa.Column("used_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("files_count", sa.BigInteger(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["users.email"],
+        ),
+        sa.PrimaryKeyConstraint("account_id"),
+    )
+    # счетчики для уже загруженных файлов
+    op.execute(
+        """
+        INSERT INTO user_usage
+            (account_id, used_bytes, files_count, updated_at)
+        SELECT account_id, COALESCE(SUM(size), 0), COUNT(*), now()
+        FROM files
+        GROUP BY account_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_usage")
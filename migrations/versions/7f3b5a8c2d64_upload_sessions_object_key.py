@@ -0,0 +1,39 @@
+"""upload_sessions object_key and status for unique multipart keys
+
+Revision ID: 7f3b5a8c2d64
+Revises: 4a7c2e9d1f58
+Create Date: 2026-10-18 22:02:41.775190
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7f3b5a8c2d64"
+down_revision: Union[str, None] = "4a7c2e9d1f58"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "upload_sessions",
+        sa.Column("object_key", sa.String(length=300), nullable=True),
+    )
+    op.add_column(
+        "upload_sessions",
+        sa.Column(
+            "status",
+            sa.String(),
+            nullable=False,
+            server_default="uploading",
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("upload_sessions", "status")
+    op.drop_column("upload_sessions", "object_key")
@@ -0,0 +1,49 @@
+"""files listing indexes
+
+Revision ID: 8d4e2b61c0a7
+Revises: 3f1c9a7d2e5b
+Create Date: 2026-10-18 11:24:37.902114
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8d4e2b61c0a7"
+down_revision: Union[str, None] = "3f1c9a7d2e5b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # индексы строятся без блокировки записи в большую таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_files_account_id_created_ad_id",
+            "files",
+            ["account_id", "created_ad", "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_files_path_pattern",
+            "files",
+            ["path"],
+            postgresql_ops={"path": "text_pattern_ops"},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_files_path_pattern",
+            table_name="files",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_files_account_id_created_ad_id",
+            table_name="files",
+            postgresql_concurrently=True,
+        )
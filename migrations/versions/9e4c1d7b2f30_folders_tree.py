@@ -0,0 +1,122 @@
+"""folders table and files.folder column for directory listing
+
+Revision ID: 9e4c1d7b2f30
+Revises: 5d2b8f0c3a61
+Create Date: 2026-10-18 18:05:19.662407
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4c1d7b2f30"
+down_revision: Union[str, None] = "5d2b8f0c3a61"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# строк files в одной транзакции заполнения files.folder
+BACKFILL_BATCH_SIZE = 10000
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+
+def backfill_files_folder() -> None:
+    """Заполнить files.folder пачками по диапазонам id.
+
+    Каждая пачка обновляется в своей транзакции, поэтому строки files
+    блокируются ненадолго и запись в таблицу не останавливается.
+    """
+    connection = op.get_bind()
+    last_id = NIL_UUID
+    while True:
+        upper_id = connection.execute(
+            sa.text(
+                "SELECT max(id) FROM ("
+                "SELECT id FROM files WHERE id > CAST(:last_id AS uuid) "
+                "ORDER BY id LIMIT :batch_size) AS batch"
+            ),
+            {"last_id": last_id, "batch_size": BACKFILL_BATCH_SIZE},
+        ).scalar()
+        if upper_id is None:
+            break
+        connection.execute(
+            sa.text(
+                "UPDATE files "
+                "SET folder = regexp_replace(path, '/[^/]*$', '') "
+                "WHERE id > CAST(:last_id AS uuid) "
+                "AND id <= CAST(:upper_id AS uuid) AND folder IS NULL"
+            ),
+            {"last_id": last_id, "upper_id": str(upper_id)},
+        )
+        last_id = str(upper_id)
+
+
+def upgrade() -> None:
+    op.add_column(
+        "files", sa.Column("folder", sa.String(length=300), nullable=True)
+    )
+    op.create_table(
+        "folders",
+        sa.Column("path", sa.String(length=300), nullable=False),
+        sa.Column("account_id", sa.String(), nullable=False),
+        sa.Column("parent", sa.String(length=300), nullable=True),
+        sa.Column("files_count", sa.BigInteger(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["users.email"],
+        ),
+        sa.PrimaryKeyConstraint("path"),
+    )
+    op.create_index(
+        op.f("ix_folders_parent"), "folders", ["parent"], unique=False
+    )
+    # большая таблица files заполняется и индексируется без блокировки
+    # записи в нее
+    with op.get_context().autocommit_block():
+        backfill_files_folder()
+        op.create_index(
+            "ix_files_folder_path",
+            "files",
+            ["folder", "path"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+    # каждая папка получает счетчики всех файлов на любой глубине
+    op.execute(
+        """
+        INSERT INTO folders (path, account_id, parent, files_count, size)
+        SELECT
+            ancestor,
+            account_id,
+            NULLIF(regexp_replace(ancestor, '/?[^/]*$', ''), ''),
+            COUNT(*),
+            COALESCE(SUM(size), 0)
+        FROM (
+            SELECT
+                files.account_id,
+                files.size,
+                array_to_string(
+                    (string_to_array(files.folder, '/'))[1:depth], '/'
+                ) AS ancestor
+            FROM files, generate_series(
+                1, array_length(string_to_array(files.folder, '/'), 1)
+            ) AS depth
+        ) AS ancestors
+        GROUP BY ancestor, account_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_folders_parent"), table_name="folders")
+    op.drop_table("folders")
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_files_folder_path",
+            table_name="files",
+            postgresql_concurrently=True,
+        )
+    op.drop_column("files", "folder")
@@ -0,0 +1,64 @@
+"""pg_trgm indexes for searching files by name and path
+
+Revision ID: b38f6e2a9c15
+Revises: 9e4c1d7b2f30
+Create Date: 2026-10-18 19:11:02.417583
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b38f6e2a9c15"
+down_revision: Union[str, None] = "9e4c1d7b2f30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # индексы строятся без блокировки записи в большую таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_files_name_trgm",
+            "files",
+            ["name"],
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_files_path_trgm",
+            "files",
+            ["path"],
+            postgresql_using="gin",
+            postgresql_ops={"path": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_files_account_id_size_id",
+            "files",
+            ["account_id", "size", "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_files_account_id_name_id",
+            "files",
+            ["account_id", "name", "id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index_name in (
+            "ix_files_account_id_name_id",
+            "ix_files_account_id_size_id",
+            "ix_files_path_trgm",
+            "ix_files_name_trgm",
+        ):
+            op.drop_index(
+                index_name, table_name="files", postgresql_concurrently=True
+            )
@@ -0,0 +1,53 @@
+"""blobs table for content-addressed storage
+
+Revision ID: c52a9e0f4b13
+Revises: 8d4e2b61c0a7
+Create Date: 2026-10-18 13:05:52.611040
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c52a9e0f4b13"
+down_revision: Union[str, None] = "8d4e2b61c0a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("digest", sa.String(length=64), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("etag", sa.String(), nullable=True),
+        sa.Column("ref_count", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("released_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("digest"),
+    )
+    op.create_index(
+        op.f("ix_blobs_released_at"), "blobs", ["released_at"], unique=False
+    )
+    # уже загруженные файлы остаются в хранилище по своему пути
+    op.add_column(
+        "files",
+        sa.Column("blob_digest", sa.String(length=64), nullable=True),
+    )
+    op.create_index(
+        op.f("ix_files_blob_digest"), "files", ["blob_digest"], unique=False
+    )
+    op.create_foreign_key(
+        "files_blob_digest_fkey", "files", "blobs", ["blob_digest"], ["digest"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("files_blob_digest_fkey", "files", type_="foreignkey")
+    op.drop_index(op.f("ix_files_blob_digest"), table_name="files")
+    op.drop_column("files", "blob_digest")
+    op.drop_index(op.f("ix_blobs_released_at"), table_name="blobs")
+    op.drop_table("blobs")
@@ -0,0 +1,51 @@
+"""upload sessions for resumable uploads
+
+Revision ID: e7a3f5d1b920
+Revises: c52a9e0f4b13
+Create Date: 2026-10-18 14:21:37.204518
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a3f5d1b920"
+down_revision: Union[str, None] = "c52a9e0f4b13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "upload_sessions",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("account_id", sa.String(), nullable=False),
+        sa.Column("path", sa.String(length=300), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("upload_id", sa.String(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("part_size", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["users.email"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_upload_sessions_updated_at"),
+        "upload_sessions",
+        ["updated_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_upload_sessions_updated_at"), table_name="upload_sessions"
+    )
+    op.drop_table("upload_sessions")
@@ -1,14 +1,62 @@
+import argparse
+import os
+
 import uvicorn
 
 from src.core.config import get_settings
 
 config = get_settings()
 
-if __name__ == "__main__":
+
+def serve() -> None:
+    """Запустить сервис.
+
+    В режиме разработки (APP_RELOAD) сервис работает в одном процессе
+    и перезапускается при изменении кода. Иначе запускается несколько
+    процессов (по умолчанию по одному на ядро) с uvloop и httptools;
+    при остановке новые соединения не принимаются, а начатые запросы,
+    в том числе загрузки, завершаются в пределах
+    graceful_shutdown_timeout.
+    """
+    if config.app_reload:
+        uvicorn.run(
+            "main:app",
+            host=config.host,
+            port=config.port,
+            reload=True,
+            loop="asyncio",
+        )
+        return
+
     uvicorn.run(
         "main:app",
         host=config.host,
         port=config.port,
-        reload=True,
-        loop="asyncio",
+        workers=config.app_workers or os.cpu_count(),
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        timeout_graceful_shutdown=config.graceful_shutdown_timeout,
+    )
+
+
+def migrate() -> None:
+    """Выполнить миграции БД до последней ревизии."""
+    from migrations.utils import upgrade_head
+
+    upgrade_head()
+
+
+COMMANDS = {"serve": serve, "migrate": migrate}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python src")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="serve",
+        choices=COMMANDS,
+        help="serve - запустить сервис, migrate - выполнить миграции",
     )
+    args = parser.parse_args()
+    COMMANDS[args.command]()
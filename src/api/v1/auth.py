@@ -2,9 +2,9 @@ from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_login import LoginManager
 from fastapi_login.exceptions import InvalidCredentialsException
-from passlib.hash import bcrypt
 
 from src.core.config import get_settings
+from src.core.security import verify_password
 from src.db.db import async_session
 from src.services.user import UserService
 
@@ -17,11 +17,10 @@ router = APIRouter(tags=["Authentication"])
 
 @login_manager.user_loader()
 async def load_user(email: str):
+    # сессия не берет соединение из пула, пока не выполнен запрос,
+    # поэтому при попадании в кэш обращения к БД не происходит
     async with async_session() as session:
-        user = await UserService.get_user_by_email(
-            session=session, email=email
-        )
-    return user
+        return await UserService.get_cached_user(session=session, email=email)
 
 
 @router.post("/auth")
@@ -31,7 +30,7 @@ async def login(data: OAuth2PasswordRequestForm = Depends()):
     user = await load_user(email)
     if not user:
         raise InvalidCredentialsException
-    elif not bcrypt.verify(password, user.password):
+    elif not await verify_password(password, user.password):
         raise InvalidCredentialsException
     access_token = login_manager.create_access_token(data=dict(sub=email))
     return {"access_token": access_token, "token_type": "bearer"}
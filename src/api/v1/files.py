@@ -1,16 +1,58 @@
+import datetime
+import email.utils
+import mimetypes
 import os
-from typing import List, Union
+import urllib.parse
+from typing import List, Literal, Optional, Union
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
-from fastapi.responses import ORJSONResponse
+from botocore.exceptions import ClientError
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    UploadFile,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from starlette import status
 
 from src.api.v1.auth import login_manager
+from src.core.config import get_settings
 from src.core.log import LoggerDependency
-from src.data_classes.files import DownloadResponse, FileItem
+from src.data_classes.files import (
+    BatchDeleteRequest,
+    BatchDeleteResponse,
+    BatchDownloadRequest,
+    BatchDownloadResponse,
+    BatchUploadResponse,
+    DirectUploadComplete,
+    DirectUploadRequest,
+    DirectUploadResponse,
+    DownloadResponse,
+    FileItem,
+    FilesPage,
+    FolderDeleteResponse,
+    FolderListing,
+    StorageUsage,
+)
 from src.db.db import SessionDependency
+from src.models.file import File as FileModel
 from src.models.user import User
-from src.services.files import FilesService
+from src.services.files import (
+    DELETE_FORBIDDEN_ERROR,
+    FORBIDDEN_ERROR,
+    WRONG_PATH_ERROR,
+    FilesService,
+)
+from src.services.folders import FoldersService
+from src.services.pagination import InvalidCursorError
+from src.services.usage import QuotaExceededError, UsageService
+
+settings = get_settings()
 
 router = APIRouter(tags=["Files"], prefix="/files")
 
@@ -27,6 +69,25 @@ def get_path(path, file) -> str:
     return str(os.path.join(*directory_parts, file.filename))
 
 
+async def get_file_object(path: str, session) -> FileModel:
+    """Найти файл по пути или идентификатору, иначе ответить 422."""
+    file_object = None
+    if FilesService.is_file_path(path):
+        file_object = await FilesService.get_file_by_path(
+            path=path, session=session
+        )
+    elif FilesService.is_uuid(path):
+        file_object = await FilesService.get_file_by_id(
+            id=path, session=session
+        )
+    if not file_object:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=WRONG_PATH_ERROR,
+        )
+    return file_object
+
+
 @router.post("/upload", response_model=FileItem, status_code=201)
 async def upload_file(
     session: SessionDependency,
@@ -40,11 +101,10 @@ async def upload_file(
 ) -> Union[FileItem, HTTPException]:
     """Загрузить файл в хранилище"""
     path = get_path(path, file)
-    data_bytes = await file.read()
     try:
         file_object = await FilesService.upload_file(
             path=path,
-            data=data_bytes,
+            file=file,
             email=user.email,
             session=session,
             filename=file.filename,
@@ -54,6 +114,11 @@ async def upload_file(
         )
         return upload_file_response
 
+    except QuotaExceededError as err:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(err),
+        )
     except Exception as upload_error:
         logger.error(f"Произошла ошибка при загрузке файла: {upload_error}")
         raise HTTPException(
@@ -61,21 +126,156 @@ async def upload_file(
         )
 
 
-@router.get("/files", response_model=List[FileItem], status_code=200)
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_files_batch(
+    session: SessionDependency,
+    logger: LoggerDependency,
+    path: str = Form("", description="<path-to-folder>"),
+    files: List[UploadFile] = File(...),
+    user=Depends(login_manager),
+) -> Union[BatchUploadResponse, HTTPException]:
+    """Загрузить список файлов в папку одним запросом.
+
+    Имя файла может содержать вложенные папки. Результат возвращается
+    по каждому файлу: ошибка одного файла не отменяет загрузку
+    остальных.
+    """
+    if len(files) > settings.upload_batch_max_files:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=(
+                f"Можно загрузить не больше "
+                f"{settings.upload_batch_max_files} файлов"
+            ),
+        )
+    try:
+        results = await FilesService.upload_files(
+            session=session, email=user.email, folder=path, files=files
+        )
+    except QuotaExceededError as err:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(err),
+        )
+    except Exception as err:
+        logger.error(f"Произошла ошибка при загрузке файлов: {err}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренняя ошибка сервера",
+        )
+    for result in results:
+        if "file" in result:
+            result["file"] = FilesService.check_download_permissions(
+                result["file"], user
+            )
+    return {"items": results}
+
+
+@router.post("/upload/direct", response_model=DirectUploadResponse)
+async def get_direct_upload_link(
+    request: DirectUploadRequest,
+    session: SessionDependency,
+    logger: LoggerDependency,
+    user: User = Depends(login_manager),
+) -> Union[DirectUploadResponse, HTTPException]:
+    """Получить ссылку для загрузки файла напрямую в хранилище.
+
+    После загрузки по ссылке нужно вызвать
+    POST /files/upload/direct/complete с идентификатором загрузки. Если
+    загрузка не подтверждена, объект удаляется сборщиком. Если передан
+    размер, квота проверяется до загрузки, а ссылка принимает только
+    файл этого размера.
+    """
+    if not FilesService.is_file_path(request.path):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=WRONG_PATH_ERROR,
+        )
+    try:
+        return await FilesService.get_upload_link(
+            session, request.path, user.email, size=request.size
+        )
+    except QuotaExceededError as err:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(err),
+        )
+    except Exception as err:
+        logger.error(f"Не удалось получить ссылку для загрузки: {err}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренняя ошибка сервера",
+        )
+
+
+@router.post(
+    "/upload/direct/complete", response_model=FileItem, status_code=201
+)
+async def complete_direct_upload(
+    request: DirectUploadComplete,
+    session: SessionDependency,
+    user: User = Depends(login_manager),
+) -> Union[FileItem, HTTPException]:
+    """Подтвердить загрузку файла по ссылке и сохранить его."""
+    try:
+        file_object = await FilesService.complete_direct_upload(
+            session, upload_id=request.id, email=user.email
+        )
+    except QuotaExceededError as err:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(err),
+        )
+    if file_object is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Загрузка не найдена или файл не загружен в хранилище",
+        )
+    return FilesService.check_download_permissions(file_object, user)
+
+
+@router.get("/usage", response_model=StorageUsage)
+async def get_usage(
+    session: SessionDependency,
+    user: User = Depends(login_manager),
+) -> StorageUsage:
+    """Получить занятое пользователем место и квоту."""
+    return await UsageService.get_usage(session, user.email)
+
+
+@router.get("/files", response_model=FilesPage, status_code=200)
 async def get_files_list(
     session: SessionDependency,
     logger: LoggerDependency,
+    owner: Optional[str] = Query(
+        None, description="Владелец файлов, по умолчанию текущий пользователь"
+    ),
+    prefix: Optional[str] = Query(
+        None, description="Папка владельца, файлы которой нужно получить"
+    ),
+    limit: int = Query(
+        settings.files_page_size, ge=1, le=settings.files_page_size_max
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из прошлого ответа"
+    ),
     user: User = Depends(login_manager),
-) -> Union[List[FileItem], HTTPException]:
-    """Получить список загруженных файлов."""
-    result_files = []
+) -> Union[FilesPage, HTTPException]:
+    """Получить список загруженных файлов постранично."""
     try:
-        files = await FilesService.get_files(session)
-        for file in files:
-            result_files.append(
-                FilesService.check_download_permissions(file, user)
-            )
-        return result_files
+        files, next_cursor = await FilesService.get_files(
+            session,
+            user_email=user.email,
+            owner=owner or user.email,
+            prefix=prefix,
+            limit=limit,
+            cursor=cursor,
+        )
+        return {"items": files, "next_cursor": next_cursor}
+    except InvalidCursorError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        )
     except Exception as err:
         logger.error(
             f"Произошла ошибка при получении списка файлов: {str(err)}"
@@ -86,41 +286,121 @@ async def get_files_list(
         )
 
 
-@router.get("/download", response_model=DownloadResponse)
-async def download_file(
-    path: str,
+@router.get("/search", response_model=FilesPage)
+async def search_files(
     session: SessionDependency,
     logger: LoggerDependency,
+    name: Optional[str] = Query(None, description="Подстрока в имени файла"),
+    path: Optional[str] = Query(None, description="Подстрока в пути файла"),
+    prefix: Optional[str] = Query(None, description="Начало имени файла"),
+    folder: Optional[str] = Query(
+        None, description="Папка, внутри которой искать"
+    ),
+    extension: Optional[str] = Query(
+        None, description="Расширение файла, например pdf"
+    ),
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
+    created_from: Optional[datetime.datetime] = Query(None),
+    created_to: Optional[datetime.datetime] = Query(None),
+    sort: Literal["created_ad", "name", "size"] = Query("created_ad"),
+    order: Literal["asc", "desc"] = Query("desc"),
+    limit: int = Query(
+        settings.files_page_size, ge=1, le=settings.files_page_size_max
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из прошлого ответа"
+    ),
     user: User = Depends(login_manager),
-) -> Union[DownloadResponse, HTTPException, ORJSONResponse]:
-    """Получить ссылку для скачивания файла."""
-    is_path: bool = FilesService.is_file_path(path)
-    is_uuid: bool = FilesService.is_uuid(path)
-    if is_path:
-        file_object = await FilesService.get_file_by_path(
-            path=path, session=session
+) -> Union[FilesPage, HTTPException]:
+    """Найти файлы пользователя.
+
+    Фильтры объединяются через И, подстроки ищутся без учета регистра.
+    """
+    try:
+        files, next_cursor = await FilesService.search_files(
+            session,
+            email=user.email,
+            sort=sort,
+            descending=order == "desc",
+            limit=limit,
+            cursor=cursor,
+            name=name,
+            path=path,
+            prefix=prefix,
+            folder=folder,
+            extension=extension,
+            min_size=min_size,
+            max_size=max_size,
+            created_from=created_from,
+            created_to=created_to,
         )
-    elif is_uuid:
-        file_object = await FilesService.get_file_by_id(
-            id=path, session=session
+        return {"items": files, "next_cursor": next_cursor}
+    except InvalidCursorError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
         )
-    else:
+    except Exception as err:
+        logger.error(f"Произошла ошибка при поиске файлов: {str(err)}")
         raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="Не правильно указан путь или идентификатор файла",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренняя ошибка сервера",
         )
-    if not file_object:
+
+
+@router.get("/ls", response_model=FolderListing)
+async def list_folder(
+    session: SessionDependency,
+    path: str = Query("", description="<path-to-folder>"),
+    limit: int = Query(
+        settings.files_page_size, ge=1, le=settings.files_page_size_max
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из прошлого ответа"
+    ),
+    user: User = Depends(login_manager),
+) -> Union[FolderListing, HTTPException]:
+    """Получить содержимое папки пользователя.
+
+    Возвращаются только вложенные папки (с числом и размером всех
+    файлов в них) и файлы, лежащие непосредственно в папке.
+    """
+    try:
+        listing = await FoldersService.list_folder(
+            session, owner=user.email, folder=path, limit=limit, cursor=cursor
+        )
+    except InvalidCursorError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        )
+    if listing is None:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="Не правильно указан путь или идентификатор файла",
+            detail="Папка не найдена",
         )
+    return listing
+
+
+@router.get("/download", response_model=DownloadResponse)
+async def download_file(
+    path: str,
+    session: SessionDependency,
+    logger: LoggerDependency,
+    user: User = Depends(login_manager),
+) -> Union[DownloadResponse, HTTPException, ORJSONResponse]:
+    """Получить ссылку для скачивания файла."""
+    file_object = await get_file_object(path, session)
+    etag = file_object.etag
+    object_key = FilesService.object_key(
+        file_object.path, file_object.blob_digest, file_object.object_key
+    )
     file_object = FilesService.check_download_permissions(
         file_object=file_object, user=user
     )
     if file_object.is_downloadable:
         try:
             download_link = await FilesService.get_download_link(
-                path=file_object.path
+                path=file_object.path, etag=etag, object_key=object_key
             )
             result = DownloadResponse(download_link=download_link)
             return result
@@ -135,5 +415,221 @@ async def download_file(
     else:
         return ORJSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
-            content="У вас нет прав на скачивания этого файла",
+            content=FORBIDDEN_ERROR,
+        )
+
+
+@router.get("/download/proxy", response_class=StreamingResponse)
+async def download_file_proxy(
+    path: str,
+    session: SessionDependency,
+    logger: LoggerDependency,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    user: User = Depends(login_manager),
+) -> Response:
+    """Скачать файл через сервис, без прямого доступа к хранилищу.
+
+    Поддерживаются запросы диапазона (Range, If-Range) и условные
+    запросы (If-None-Match, If-Modified-Since). Содержимое передается
+    кусками settings.download_chunk_size по мере того, как клиент
+    его принимает, и целиком в памяти не держится.
+    """
+    file_object = await get_file_object(path, session)
+    if file_object.account_id != user.email:
+        return ORJSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content=FORBIDDEN_ERROR,
+        )
+
+    headers = {"Accept-Ranges": "bytes"}
+    if file_object.etag:
+        headers["ETag"] = file_object.etag
+    if file_object.created_ad:
+        headers["Last-Modified"] = email.utils.format_datetime(
+            FilesService.last_modified(file_object), usegmt=True
+        )
+    if FilesService.is_not_modified(
+        file_object, if_none_match, if_modified_since
+    ):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+
+    byte_range = FilesService.get_byte_range(
+        range_header, if_range, file_object.etag
+    )
+    try:
+        response = await FilesService.open_object(file_object, byte_range)
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "InvalidRange":
+            logger.error(f"Не удалось получить файл {path}: {err}")
+            raise
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{file_object.size}"},
+        )
+
+    headers["Content-Length"] = str(response["ContentLength"])
+    headers["Content-Disposition"] = (
+        f"attachment; filename*=UTF-8''{urllib.parse.quote(file_object.name)}"
+    )
+    status_code = status.HTTP_200_OK
+    if response.get("ContentRange"):
+        headers["Content-Range"] = response["ContentRange"]
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+    return StreamingResponse(
+        FilesService.iter_object_body(response["Body"]),
+        status_code=status_code,
+        media_type=(
+            mimetypes.guess_type(file_object.name)[0]
+            or "application/octet-stream"
+        ),
+        headers=headers,
+    )
+
+
+@router.get("/download/folder", response_class=StreamingResponse)
+async def download_folder(
+    session: SessionDependency,
+    path: str = Query("", description="<path-to-folder>"),
+    user: User = Depends(login_manager),
+) -> StreamingResponse:
+    """Скачать папку пользователя zip архивом.
+
+    Архив собирается на лету из потоков объектов хранилища и сразу
+    отдается клиенту, без временных файлов и буферизации целиком.
+    """
+    path = path.strip("/")
+    if not await FilesService.folder_exists(
+        session=session, owner=user.email, folder=path
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Папка не найдена",
+        )
+    archive_name = f"{os.path.basename(path) or user.email}.zip"
+    return StreamingResponse(
+        FilesService.stream_folder_archive(owner=user.email, folder=path),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": (
+                "attachment; filename*=UTF-8''"
+                f"{urllib.parse.quote(archive_name)}"
+            )
+        },
+    )
+
+
+@router.post("/download/batch", response_model=BatchDownloadResponse)
+async def download_files_batch(
+    request: BatchDownloadRequest,
+    session: SessionDependency,
+    logger: LoggerDependency,
+    user: User = Depends(login_manager),
+) -> Union[BatchDownloadResponse, HTTPException]:
+    """Получить ссылки для скачивания списка файлов."""
+    if len(request.items) > settings.download_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=(
+                f"Можно запросить не больше "
+                f"{settings.download_batch_max_items} файлов"
+            ),
+        )
+    try:
+        results = await FilesService.get_download_links(
+            session=session, items=request.items, user=user
+        )
+        return {"items": results}
+    except Exception as err:
+        logger.error(f"Не удалось получить ссылки из-за ошибки: {str(err)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренняя ошибка сервера",
+        )
+
+
+@router.delete("/delete", status_code=204)
+async def delete_file(
+    session: SessionDependency,
+    path: str = Query(..., description="<full-path-to-file>||<file-id>"),
+    user: User = Depends(login_manager),
+) -> Response:
+    """Удалить файл пользователя."""
+    (result,) = await FilesService.delete_files(
+        session=session, items=[path], user=user
+    )
+    if result.get("error") == DELETE_FORBIDDEN_ERROR:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail=result["error"]
+        )
+    if result.get("error"):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=result["error"],
+        )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/delete/batch", response_model=BatchDeleteResponse)
+async def delete_files_batch(
+    request: BatchDeleteRequest,
+    session: SessionDependency,
+    logger: LoggerDependency,
+    user: User = Depends(login_manager),
+) -> Union[BatchDeleteResponse, HTTPException]:
+    """Удалить список файлов пользователя."""
+    if len(request.items) > settings.delete_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=(
+                f"Можно удалить не больше "
+                f"{settings.delete_batch_max_items} файлов"
+            ),
+        )
+    try:
+        results = await FilesService.delete_files(
+            session=session, items=request.items, user=user
+        )
+        return {"items": results}
+    except Exception as err:
+        logger.error(f"Не удалось удалить файлы из-за ошибки: {str(err)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренняя ошибка сервера",
+        )
+
+
+@router.delete("/delete/folder", response_model=FolderDeleteResponse)
+async def delete_folder(
+    response: Response,
+    session: SessionDependency,
+    path: str = Query(..., description="<path-to-folder>"),
+    user: User = Depends(login_manager),
+) -> Union[FolderDeleteResponse, HTTPException]:
+    """Удалить папку пользователя со всеми вложенными файлами.
+
+    Большая папка удаляется в фоне: ответ 202 означает, что первая
+    пачка файлов удалена, а остальные будут удалены позже. Корневую
+    папку пользователя удалить нельзя.
+    """
+    folder = path.strip("/")
+    if not folder:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Не указана папка",
+        )
+    deleted, completed = await FilesService.delete_folder(
+        session=session, owner=user.email, folder=folder
+    )
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Папка не найдена",
         )
+    if not completed:
+        response.status_code = status.HTTP_202_ACCEPTED
+    return {"deleted": deleted, "completed": completed}
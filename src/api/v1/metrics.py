@@ -0,0 +1,43 @@
+import os
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+
+from src.core.metrics import DBPoolCollector
+from src.db.db import engine
+
+db_pool_collector = DBPoolCollector(engine)
+REGISTRY.register(db_pool_collector)
+
+
+def get_registry() -> CollectorRegistry:
+    """Получить реестр метрик.
+
+    Если сервис запущен в несколько процессов и задан
+    PROMETHEUS_MULTIPROC_DIR, метрики собираются со всех процессов,
+    состояние пула БД - текущего процесса.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(db_pool_collector)
+    return registry
+
+
+router = APIRouter(tags=["Check health"])
+
+
+@router.get("/metrics")
+async def metrics() -> Response:
+    """Получить метрики сервиса в формате Prometheus."""
+    return Response(
+        content=generate_latest(get_registry()),
+        media_type=CONTENT_TYPE_LATEST,
+    )
@@ -1,13 +1,26 @@
+import asyncio
 import time
+from typing import Awaitable, Callable, Optional
 
-import aiohttp
-import asyncpg
 from fastapi import APIRouter
 from fastapi.responses import ORJSONResponse
+from sqlalchemy import text
 
+from src.clients.s3 import s3_client
+from src.core.cache import CacheBackend, MemoryCache
 from src.core.config import get_settings
+from src.core.log import get_logger
+from src.db.db import engine
+from src.db.pool import get_pool_status
 
 settings = get_settings()
+logger = get_logger()
+
+# результат проверок переиспользуется частыми пробами балансировщика
+health_cache: CacheBackend = MemoryCache(
+    maxsize=1, ttl=settings.health_cache_ttl
+)
+_health_lock: Optional[asyncio.Lock] = None
 
 
 def seconds_to_milliseconds(seconds):
@@ -15,35 +28,61 @@ def seconds_to_milliseconds(seconds):
     return f"{ms} milliseconds"
 
 
-async def check_minio():
-    """Проверить отклик от хранилища minio."""
-    start_time = time.time()
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://minio:9001/") as response:
-                if response.status == 200:
-                    return seconds_to_milliseconds(time.time() - start_time)
-                else:
-                    return None
-    except aiohttp.ClientError:
-        return None
+async def check_minio() -> bool:
+    """Проверить отклик от хранилища minio общим клиентом."""
+    return await s3_client.ping(settings.s3_bucket_name)
+
 
+async def check_db() -> bool:
+    """Проверить есть ли отклик от БД через пул соединений."""
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    return True
 
-async def check_db():
-    """Проверить есть ли отклик от БД."""
-    start_time = time.time()
+
+async def run_check(
+    name: str, check: Callable[[], Awaitable[bool]]
+) -> Optional[str]:
+    """Выполнить проверку с таймаутом и получить время отклика."""
+    start_time = time.perf_counter()
     try:
-        conn = await asyncpg.connect(
-            host=settings.db_host,
-            port=settings.db_port,
-            user=settings.db_user,
-            password=settings.db_pass,
-            database=settings.db_name,
+        is_alive = await asyncio.wait_for(
+            check(), timeout=settings.health_check_timeout
         )
-        await conn.close()
-        return seconds_to_milliseconds(time.time() - start_time)
-    except asyncpg.exceptions.ConnectionFailureError:
+    except asyncio.TimeoutError:
+        logger.warning(f"Проверка {name} не уложилась в таймаут")
+        return None
+    except Exception as err:
+        logger.warning(f"Проверка {name} завершилась ошибкой: {err}")
+        return None
+    if not is_alive:
         return None
+    return seconds_to_milliseconds(time.perf_counter() - start_time)
+
+
+async def get_services_status() -> dict:
+    """Получить состояние сервисов, проверив их параллельно.
+
+    Пока результат в кэше, проверки не выполняются. Одновременные
+    запросы после его истечения дожидаются одной общей проверки.
+    """
+    global _health_lock
+
+    services = await health_cache.get("services")
+    if services is not None:
+        return services
+    if _health_lock is None:
+        _health_lock = asyncio.Lock()
+    async with _health_lock:
+        services = await health_cache.get("services")
+        if services is not None:
+            return services
+        db, minio = await asyncio.gather(
+            run_check("db", check_db), run_check("minio", check_minio)
+        )
+        services = {"db": db, "minio": minio}
+        await health_cache.set("services", services)
+        return services
 
 
 router = APIRouter(tags=["Check health"])
@@ -51,5 +90,11 @@ router = APIRouter(tags=["Check health"])
 
 @router.get("/ping")
 async def ping() -> ORJSONResponse:
-    services = {"db": await check_db(), "minio": await check_minio()}
+    services = await get_services_status()
     return ORJSONResponse(content=services, status_code=200)
+
+
+@router.get("/ping/db-pool")
+async def db_pool_status() -> ORJSONResponse:
+    """Получить состояние пула соединений с БД."""
+    return ORJSONResponse(content=get_pool_status(engine), status_code=200)
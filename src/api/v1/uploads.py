@@ -0,0 +1,173 @@
+import uuid
+from typing import Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from starlette import status
+
+from src.api.v1.auth import login_manager
+from src.core.log import LoggerDependency
+from src.data_classes.files import (
+    FileItem,
+    PartUploadLink,
+    UploadPart,
+    UploadSessionCreate,
+    UploadSessionStatus,
+)
+from src.db.db import SessionDependency
+from src.models.user import User
+from src.services.files import FilesService
+from src.services.uploads import UploadSessionError, UploadsService
+from src.services.usage import QuotaExceededError
+
+router = APIRouter(tags=["Files"], prefix="/files/uploads")
+
+UPLOAD_NOT_FOUND_ERROR = "Загрузка не найдена"
+
+
+@router.post("", response_model=UploadSessionStatus, status_code=201)
+async def create_upload(
+    request: UploadSessionCreate,
+    session: SessionDependency,
+    logger: LoggerDependency,
+    user: User = Depends(login_manager),
+) -> Union[UploadSessionStatus, HTTPException]:
+    """Начать загрузку файла по частям.
+
+    Файл загружается частями размером part_size по смещениям, кратным
+    part_size, после загрузки всех частей файл собирается запросом
+    POST /files/uploads/{id}/complete.
+    """
+    try:
+        upload = await UploadsService.create_session(
+            session, email=user.email, path=request.path, size=request.size
+        )
+    except UploadSessionError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        )
+    except QuotaExceededError as err:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(err),
+        )
+    except Exception as err:
+        logger.error(f"Не удалось начать загрузку: {err}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренняя ошибка сервера",
+        )
+    return {
+        "id": upload.id,
+        "path": upload.path,
+        "size": upload.size,
+        "part_size": upload.part_size,
+        "parts_count": UploadsService.parts_count(
+            upload.size, upload.part_size
+        ),
+        "uploaded_size": 0,
+    }
+
+
+@router.put("/{upload_id}", response_model=UploadPart)
+async def upload_part(
+    upload_id: uuid.UUID,
+    request: Request,
+    session: SessionDependency,
+    offset: int = Query(..., ge=0, description="Смещение части в файле"),
+    user: User = Depends(login_manager),
+) -> Union[UploadPart, HTTPException]:
+    """Загрузить часть файла, тело запроса - содержимое части.
+
+    Части можно загружать параллельно и повторно: часть с тем же
+    смещением заменяет ранее загруженную.
+    """
+    upload = await UploadsService.touch_session(session, user.email, upload_id)
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=UPLOAD_NOT_FOUND_ERROR,
+        )
+    try:
+        _, part_size = UploadsService.part_bounds(upload, offset)
+        data = await UploadsService.read_part(request.stream(), part_size)
+    except UploadSessionError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        )
+    return await UploadsService.upload_part(upload, offset, data)
+
+
+@router.get("/{upload_id}/link", response_model=PartUploadLink)
+async def get_part_upload_link(
+    upload_id: uuid.UUID,
+    session: SessionDependency,
+    offset: int = Query(..., ge=0, description="Смещение части в файле"),
+    user: User = Depends(login_manager),
+) -> Union[PartUploadLink, HTTPException]:
+    """Получить ссылку для загрузки части напрямую в хранилище."""
+    upload = await UploadsService.touch_session(session, user.email, upload_id)
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=UPLOAD_NOT_FOUND_ERROR,
+        )
+    try:
+        return await UploadsService.get_part_upload_link(upload, offset)
+    except UploadSessionError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        )
+
+
+@router.get("/{upload_id}", response_model=UploadSessionStatus)
+async def get_upload(
+    upload_id: uuid.UUID,
+    session: SessionDependency,
+    user: User = Depends(login_manager),
+) -> Union[UploadSessionStatus, HTTPException]:
+    """Получить состояние загрузки и список уже загруженных частей."""
+    upload = await UploadsService.get_session(session, user.email, upload_id)
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=UPLOAD_NOT_FOUND_ERROR,
+        )
+    return await UploadsService.get_status(upload)
+
+
+@router.post("/{upload_id}/complete", response_model=FileItem)
+async def complete_upload(
+    upload_id: uuid.UUID,
+    session: SessionDependency,
+    user: User = Depends(login_manager),
+) -> Union[FileItem, HTTPException]:
+    """Собрать файл из загруженных частей."""
+    try:
+        file_object = await UploadsService.complete(
+            session, user.email, upload_id
+        )
+    except UploadSessionError as err:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+        )
+    if file_object is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=UPLOAD_NOT_FOUND_ERROR,
+        )
+    return FilesService.check_download_permissions(file_object, user)
+
+
+@router.delete("/{upload_id}", status_code=204)
+async def abort_upload(
+    upload_id: uuid.UUID,
+    session: SessionDependency,
+    user: User = Depends(login_manager),
+) -> Response:
+    """Отменить загрузку и удалить загруженные части."""
+    if not await UploadsService.abort(session, user.email, upload_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=UPLOAD_NOT_FOUND_ERROR,
+        )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
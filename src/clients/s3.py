@@ -1,12 +1,23 @@
+import asyncio
+import urllib.parse
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, List, Optional, Union
+
+from aiobotocore.config import AioConfig
 from aiobotocore.session import AioSession
 from botocore.exceptions import ClientError
 
 from src.core.config import get_settings
-from src.core.log import LoggerDependency
+from src.core.log import LoggerDependency, get_logger
+from src.core.metrics import S3_LATENCY, UPLOADED_BYTES, instrument
 
 settings = get_settings()
 
+# ограничение S3 на число ключей в одном запросе DeleteObjects
+DELETE_OBJECTS_LIMIT = 1000
+
 
+@instrument(S3_LATENCY, exclude=("start", "close", "get_client"))
 class S3Client:
     def __init__(
         self,
@@ -17,6 +28,8 @@ class S3Client:
         session_token: str = None,
         secure: bool = True,
         region: str = None,
+        max_pool_connections: int = 10,
+        keepalive_timeout: float = 15,
     ):
 
         self.logger = logger
@@ -35,7 +48,50 @@ class S3Client:
             "region_name": self.region,
             "endpoint_url": self.endpoint,
             "verify": self.secure,
+            "config": AioConfig(
+                max_pool_connections=max_pool_connections,
+                connector_args={"keepalive_timeout": keepalive_timeout},
+            ),
         }
+        self._client = None
+        self._exit_stack = None
+        self._lock = None
+
+    async def start(self) -> None:
+        """Создать клиент с общим пулом соединений к хранилищу.
+
+        Клиент создается один раз на процесс и переиспользуется всеми
+        запросами, пока не будет вызван close().
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._client is not None:
+                return
+
+            exit_stack = AsyncExitStack()
+            self._client = await exit_stack.enter_async_context(
+                self.session.create_client("s3", **self.client_config)
+            )
+            self._exit_stack = exit_stack
+            if self.logger:
+                self.logger.info(f"Создан клиент хранилища: {self.endpoint}")
+
+    async def close(self) -> None:
+        """Закрыть клиент и его пул соединений."""
+        if self._exit_stack is None:
+            return
+
+        exit_stack, self._exit_stack = self._exit_stack, None
+        self._client = None
+        await exit_stack.aclose()
+
+    async def get_client(self):
+        """Получить общий клиент, создав его при первом обращении."""
+        if self._client is None:
+            await self.start()
+        return self._client
 
     async def create_bucket(
         self, bucket_name: str, suppress_already_owned_error: bool = True
@@ -46,18 +102,15 @@ class S3Client:
                 f"Создание бакета: '{bucket_name}'.",
             )
 
-        async with self.session.create_client(
-            "s3",
-            **self.client_config,
-        ) as client:
-            try:
-                return await client.create_bucket(Bucket=bucket_name)
+        client = await self.get_client()
+        try:
+            return await client.create_bucket(Bucket=bucket_name)
 
-            except client.exceptions.BucketAlreadyOwnedByYou as e:
-                if suppress_already_owned_error:
-                    return None
+        except client.exceptions.BucketAlreadyOwnedByYou as e:
+            if suppress_already_owned_error:
+                return None
 
-                raise e
+            raise e
 
     async def put_object(
         self, bucket_name: str, object_name: str, data: bytes
@@ -69,53 +122,272 @@ class S3Client:
                 body={"bucket": bucket_name, "object_name": object_name},
             )
 
-        async with self.session.create_client(
-            "s3", **self.client_config
-        ) as client:
-            try:
-                await client.put_object(
-                    Bucket=bucket_name,
-                    Key=object_name,
-                    Body=data,
-                )
+        UPLOADED_BYTES.inc(len(data))
+        client = await self.get_client()
+        try:
+            return await client.put_object(
+                Bucket=bucket_name,
+                Key=object_name,
+                Body=data,
+            )
+
+        except client.exceptions.NoSuchBucket:
+            await self.create_bucket(bucket_name=bucket_name)
+            self.logger.info(f"Новый бакет с именем {bucket_name} создан")
+            return await client.put_object(
+                Bucket=bucket_name, Key=object_name, Body=data
+            )
 
-            except client.exceptions.NoSuchBucket:
-                await self.create_bucket(bucket_name=bucket_name)
-                self.logger.info(f"Новый бакет с именем {bucket_name} создан")
-                return await client.put_object(
-                    Bucket=bucket_name, Key=object_name, Body=data
+    async def upload_stream(
+        self, bucket_name: str, object_name: str, parts: AsyncIterator[bytes]
+    ) -> dict:
+        """Загрузить файл в хранилище потоково.
+
+        Части читаются из итератора по одной. Чтобы выбрать способ
+        загрузки, заранее читается вторая часть, поэтому в памяти
+        держится не больше двух частей файла. Если файл уместился в одну
+        часть, он загружается обычным put_object, иначе через multipart
+        upload. При ошибке незавершенная multipart загрузка отменяется.
+
+        Возвращает ETag записанного объекта и его размер, посчитанный
+        при чтении частей, чтобы не запрашивать метаданные повторно.
+        """
+        first_part = await self._next_part(parts)
+        second_part = await self._next_part(parts)
+        if second_part is None:
+            data = first_part or b""
+            response = await self.put_object(bucket_name, object_name, data)
+            return {"ETag": response["ETag"], "ContentLength": len(data)}
+
+        if self.logger:
+            self.logger.info(
+                f"Multipart загрузка файла в бакет: "
+                f"'{bucket_name}/{object_name}'.",
+            )
+
+        upload_id = await self.create_multipart_upload(
+            bucket_name, object_name
+        )
+
+        try:
+            uploaded_parts = []
+            size = 0
+            part_number = 1
+            part = first_part
+            while part is not None:
+                size += len(part)
+                etag = await self.upload_part(
+                    bucket_name, object_name, upload_id, part_number, part
+                )
+                uploaded_parts.append(
+                    {"ETag": etag, "PartNumber": part_number}
+                )
+                part_number += 1
+                part = (
+                    second_part
+                    if part_number == 2
+                    else await self._next_part(parts)
                 )
 
-    async def get_download_url(
+            response = await self.complete_multipart_upload(
+                bucket_name, object_name, upload_id, uploaded_parts
+            )
+            return {"ETag": response["ETag"], "ContentLength": size}
+
+        except BaseException:
+            self.logger.error(
+                f"Не удалось загрузить файл {object_name}, "
+                f"multipart загрузка {upload_id} отменена"
+            )
+            await self.abort_multipart_upload(
+                bucket_name, object_name, upload_id
+            )
+            raise
+
+    async def create_multipart_upload(
         self, bucket_name: str, object_name: str
     ) -> str:
-        """Получить ссылку запрашиваемого объекта для скачивания."""
-        async with self.session.create_client(
-            "s3", **self.client_config
-        ) as client:
-            try:
-                request_url = await client.generate_presigned_url(
-                    ClientMethod="get_object",
-                    Params={"Bucket": bucket_name, "Key": object_name},
-                    ExpiresIn=settings.default_url_lifetime,
-                )
-                return request_url
+        """Начать multipart загрузку и получить ее идентификатор."""
+        client = await self.get_client()
+        try:
+            upload = await client.create_multipart_upload(
+                Bucket=bucket_name, Key=object_name
+            )
+        except client.exceptions.NoSuchBucket:
+            await self.create_bucket(bucket_name=bucket_name)
+            self.logger.info(f"Новый бакет с именем {bucket_name} создан")
+            upload = await client.create_multipart_upload(
+                Bucket=bucket_name, Key=object_name
+            )
+        return upload["UploadId"]
+
+    async def upload_part(
+        self,
+        bucket_name: str,
+        object_name: str,
+        upload_id: str,
+        part_number: int,
+        data: bytes,
+    ) -> str:
+        """Загрузить часть multipart загрузки и получить ее ETag."""
+        UPLOADED_BYTES.inc(len(data))
+        client = await self.get_client()
+        response = await client.upload_part(
+            Bucket=bucket_name,
+            Key=object_name,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return response["ETag"]
+
+    async def list_parts(
+        self, bucket_name: str, object_name: str, upload_id: str
+    ) -> List[dict]:
+        """Получить все загруженные части multipart загрузки.
+
+        Хранилище отдает части страницами, они запрашиваются по очереди,
+        пока не будет получен весь список.
+        """
+        client = await self.get_client()
+        parts = []
+        params = {}
+        while True:
+            response = await client.list_parts(
+                Bucket=bucket_name,
+                Key=object_name,
+                UploadId=upload_id,
+                **params,
+            )
+            parts.extend(response.get("Parts", []))
+            if not response.get("IsTruncated"):
+                return parts
+            params["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+    async def complete_multipart_upload(
+        self,
+        bucket_name: str,
+        object_name: str,
+        upload_id: str,
+        parts: List[dict],
+    ) -> dict:
+        """Собрать объект из загруженных частей."""
+        client = await self.get_client()
+        return await client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=object_name,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    async def abort_multipart_upload(
+        self, bucket_name: str, object_name: str, upload_id: str
+    ) -> None:
+        """Отменить multipart загрузку и удалить ее части."""
+        client = await self.get_client()
+        await client.abort_multipart_upload(
+            Bucket=bucket_name, Key=object_name, UploadId=upload_id
+        )
+
+    @staticmethod
+    async def _next_part(parts: AsyncIterator[bytes]) -> Union[bytes, None]:
+        """Получить следующую непустую часть файла или None."""
+        try:
+            part = await parts.__anext__()
+        except StopAsyncIteration:
+            return None
+        return part or None
+
+    async def get_download_url(
+        self, bucket_name: str, object_name: str, filename: str = None
+    ) -> str:
+        """Получить ссылку запрашиваемого объекта для скачивания.
 
-            except client.exceptions as err:
-                self.logger.info(f"Не удалось получить ссылку: {err}")
+        Если передано имя файла, оно подставляется в Content-Disposition
+        ответа, иначе файл скачается под именем объекта.
+        """
+        params = {"Bucket": bucket_name, "Key": object_name}
+        if filename:
+            params["ResponseContentDisposition"] = (
+                "attachment; filename*=UTF-8''"
+                f"{urllib.parse.quote(filename)}"
+            )
+        client = await self.get_client()
+        try:
+            request_url = await client.generate_presigned_url(
+                ClientMethod="get_object",
+                Params=params,
+                ExpiresIn=settings.default_url_lifetime,
+            )
+            return request_url
+
+        except ClientError as err:
+            self.logger.info(f"Не удалось получить ссылку: {err}")
+
+    async def get_upload_url(
+        self,
+        bucket_name: str,
+        object_name: str,
+        expires_in: int,
+        content_length: Optional[int] = None,
+    ) -> str:
+        """Получить подписанную ссылку для загрузки объекта запросом PUT.
+
+        Если передан content_length, размер входит в подпись и запрос
+        с другим Content-Length хранилище отклонит.
+        """
+        params = {"Bucket": bucket_name, "Key": object_name}
+        if content_length is not None:
+            params["ContentLength"] = content_length
+        client = await self.get_client()
+        return await client.generate_presigned_url(
+            ClientMethod="put_object", Params=params, ExpiresIn=expires_in
+        )
+
+    async def get_upload_part_url(
+        self,
+        bucket_name: str,
+        object_name: str,
+        upload_id: str,
+        part_number: int,
+        expires_in: int,
+    ) -> str:
+        """Получить подписанную ссылку для загрузки части multipart."""
+        client = await self.get_client()
+        return await client.generate_presigned_url(
+            ClientMethod="upload_part",
+            Params={
+                "Bucket": bucket_name,
+                "Key": object_name,
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+            },
+            ExpiresIn=expires_in,
+        )
+
+    async def get_object(
+        self, bucket_name: str, object_name: str, **params
+    ) -> dict:
+        """Получить объект из хранилища.
+
+        Тело объекта (Body) не читается заранее: это поток, который
+        нужно прочитать частями и закрыть.
+        """
+        client = await self.get_client()
+        return await client.get_object(
+            Bucket=bucket_name, Key=object_name, **params
+        )
 
     async def delete_object(self, bucket_name: str, object_name: str) -> None:
         """Удалить объект из бакета."""
+        client = await self.get_client()
         try:
-            async with self.session.create_client(
-                "s3", **self.client_config
-            ) as client:
-                response = await client.delete_object(
-                    Bucket=bucket_name, Key=object_name
-                )
-                self.logger.info(f"Файл {object_name} удален!")
+            response = await client.delete_object(
+                Bucket=bucket_name, Key=object_name
+            )
+            self.logger.info(f"Файл {object_name} удален!")
 
-        except client.exceptions as err:
+        except ClientError as err:
             self.logger.error(
                 f"Не удалось удалить файл {object_name} из-за ошибки: {err}"
             )
@@ -123,6 +395,48 @@ class S3Client:
 
         return response
 
+    async def delete_objects(
+        self, bucket_name: str, object_names: List[str]
+    ) -> List[str]:
+        """Удалить объекты из бакета запросами DeleteObjects.
+
+        Ключи удаляются пачками по DELETE_OBJECTS_LIMIT. Возвращает
+        ключи, которые хранилище удалить не смогло.
+        """
+        client = await self.get_client()
+        failed = []
+        for start in range(0, len(object_names), DELETE_OBJECTS_LIMIT):
+            end = start + DELETE_OBJECTS_LIMIT
+            batch = object_names[start:end]
+            response = await client.delete_objects(
+                Bucket=bucket_name,
+                Delete={
+                    "Objects": [{"Key": name} for name in batch],
+                    "Quiet": True,
+                },
+            )
+            for error in response.get("Errors", []):
+                if self.logger:
+                    self.logger.error(
+                        f"Не удалось удалить файл {error['Key']}: "
+                        f"{error.get('Code')} {error.get('Message')}"
+                    )
+                failed.append(error["Key"])
+        return failed
+
+    async def ping(self, bucket_name: str) -> bool:
+        """Проверить, что хранилище отвечает, запросом HEAD к бакету.
+
+        Отсутствие бакета не считается ошибкой: он создается при первой
+        загрузке файла.
+        """
+        client = await self.get_client()
+        try:
+            await client.head_bucket(Bucket=bucket_name)
+        except ClientError as err:
+            return err.response["Error"]["Code"] in ("404", "NoSuchBucket")
+        return True
+
     async def object_exists(
         self, bucket_name: str, object_name: str
     ) -> tuple[bool, dict]:
@@ -132,12 +446,10 @@ class S3Client:
         """
         try:
             self.logger.info(f"Пытаюсь получить информацию по: {object_name}")
-            async with self.session.create_client(
-                "s3", **self.client_config
-            ) as client:
-                meta = await client.head_object(
-                    Bucket=bucket_name, Key=object_name
-                )
+            client = await self.get_client()
+            meta = await client.head_object(
+                Bucket=bucket_name, Key=object_name
+            )
             return True, meta
 
         except ClientError as e:
@@ -148,3 +460,13 @@ class S3Client:
             else:
                 # Другие ошибки могут быть обработаны по необходимости
                 raise
+
+
+s3_client = S3Client(
+    logger=get_logger(),
+    endpoint=f"{settings.s3_protocol}://{settings.s3_host}:{settings.s3_port}",
+    access_key=settings.s3_access_key_id,
+    secret_key=settings.s3_secret_access_key,
+    max_pool_connections=settings.s3_max_pool_connections,
+    keepalive_timeout=settings.s3_keepalive_timeout,
+)
@@ -0,0 +1,74 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class CacheBackend(ABC):
+    """Интерфейс кэша.
+
+    Реализация в памяти процесса - MemoryCache. Для общего кэша между
+    процессами и инстансами (например, Redis) достаточно реализовать
+    этот интерфейс и подставить объект вместо MemoryCache.
+    """
+
+    @abstractmethod
+    async def get(self, key: Hashable) -> Optional[Any]:
+        """Получить значение или None, если его нет или оно устарело."""
+
+    @abstractmethod
+    async def set(
+        self, key: Hashable, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        """Сохранить значение на ttl секунд."""
+
+    @abstractmethod
+    async def delete(self, key: Hashable) -> None:
+        """Удалить значение."""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Очистить кэш."""
+
+
+class MemoryCache(CacheBackend):
+    """LRU кэш в памяти процесса с ограничением размера и временем жизни."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    async def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    async def set(
+        self, key: Hashable, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        if self.maxsize <= 0:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
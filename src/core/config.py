@@ -1,9 +1,13 @@
+import functools
 import os
 from typing import Annotated
 
 from fastapi import Depends
 from pydantic import Field, PostgresDsn
-from pydantic.v1 import BaseSettings
+from pydantic.v1 import BaseSettings, validator
+
+# минимальный размер части multipart загрузки по протоколу S3
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
 
 
 class Settings(BaseSettings):
@@ -11,13 +15,36 @@ class Settings(BaseSettings):
 
     host: str
     port: int
+    # число процессов сервиса, 0 - по одному на ядро
+    app_workers: int = 0
+    # один процесс с перезапуском при изменении кода (для разработки)
+    app_reload: bool = False
+    # сколько ждать завершения начатых запросов при остановке
+    graceful_shutdown_timeout: int = 60
     db_name: str
     db_user: str
     db_pass: str
     db_host: str
     db_port: int
     db_driver: str
+    db_echo: bool = False
+    # без пула каждое обращение открывает новое соединение (для тестов)
+    db_pool_enabled: bool = True
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # размер кэша подготовленных выражений asyncpg, 0 - отключить
+    db_statement_cache_size: int = 100
     auth_secret: str
+    # миграции выполняются командой `python src migrate`, при старте
+    # сервиса можно только проверить, что БД на последней ревизии
+    check_migrations_on_startup: bool = False
+    # логирование: уровень, вывод в JSON и запись фоновым потоком
+    log_level: str = "INFO"
+    log_json: bool = False
+    log_enqueue: bool = True
     current_dir: str = os.path.dirname(os.path.abspath(__file__))
     base_dir: str = os.path.dirname(os.path.dirname(current_dir))
     tests_dir: str = os.path.join(base_dir, "tests")
@@ -29,6 +56,55 @@ class Settings(BaseSettings):
     s3_secret_access_key: str
     s3_port: int
     default_url_lifetime: int = 86400
+    # доля времени жизни ссылки, в течение которой она переиспользуется
+    download_link_reuse_fraction: float = 0.5
+    download_link_cache_size: int = 100000
+    download_batch_max_items: int = 5000
+    download_batch_concurrency: int = 32
+    # скачивание папки архивом: параллельные GET и размер куска потока
+    folder_download_concurrency: int = 4
+    download_chunk_size: int = 64 * 1024
+    # загрузка списка файлов одним запросом
+    upload_batch_max_files: int = 1000
+    upload_batch_concurrency: int = 16
+    # место на пользователя в байтах, 0 - без ограничения
+    storage_quota: int = 0
+    # удаление: число файлов в одном DELETE и в одном запросе к API,
+    # папка больше delete_batch_size удаляется в фоновой задаче
+    delete_batch_size: int = 1000
+    delete_batch_max_items: int = 1000
+    files_page_size: int = 100
+    files_page_size_max: int = 1000
+    # кэш пользователей для авторизации по токену
+    user_cache_ttl: float = 60
+    user_cache_size: int = 10000
+    # стоимость bcrypt и число потоков для хеширования паролей
+    password_hash_rounds: int = 12
+    password_hash_workers: int = 4
+    # размер части multipart загрузки в S3 (не меньше 5 МБ по протоколу S3)
+    s3_multipart_part_size: int = 8 * 1024 * 1024
+    # blob без ссылок удаляются из хранилища после grace периода
+    blob_orphan_grace_period: int = 3600
+    blob_reaper_interval: int = 300
+    # незавершенные загрузки по частям отменяются после простоя
+    upload_session_ttl: int = 86400
+    upload_session_reaper_interval: int = 600
+    # время жизни подписанных ссылок для загрузки напрямую в хранилище
+    upload_url_lifetime: int = 3600
+    # очередь фоновых задач: postgres или memory (в пределах процесса)
+    job_backend: str = "postgres"
+    job_workers: int = 4
+    job_max_attempts: int = 5
+    job_retry_delay: float = 1
+    job_retry_delay_max: float = 300
+    job_poll_interval: float = 1
+    job_lease_timeout: int = 300
+    # проверки /ping: таймаут каждой проверки и время жизни результата
+    health_check_timeout: float = 2
+    health_cache_ttl: float = 5
+    # пул соединений общего клиента S3
+    s3_max_pool_connections: int = 50
+    s3_keepalive_timeout: float = 60
 
     class Config:
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -36,6 +112,15 @@ class Settings(BaseSettings):
             os.path.dirname(os.path.dirname(current_dir)), ".env"
         )
 
+    @validator("s3_multipart_part_size")
+    def check_part_size(cls, value: int) -> int:
+        """Проверить, что хранилище примет части такого размера."""
+        if value < S3_MIN_PART_SIZE:
+            raise ValueError(
+                f"Размер части должен быть не меньше {S3_MIN_PART_SIZE} байт"
+            )
+        return value
+
     @property
     def db_url(self) -> PostgresDsn:
         """Получить ссылку для подключению к БД."""
@@ -50,8 +135,12 @@ class Settings(BaseSettings):
         return db_url
 
 
+@functools.lru_cache
 def get_settings() -> Settings:
-    """Получить настройки проекта."""
+    """Получить настройки проекта.
+
+    Настройки читаются из окружения и .env один раз на процесс.
+    """
     return Settings()
 
 
@@ -0,0 +1,347 @@
+import asyncio
+import datetime
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, event, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+
+from src.core.config import get_settings
+from src.core.log import get_logger
+from src.db.db import async_session
+from src.models.job import Job
+
+settings = get_settings()
+logger = get_logger()
+
+JobHandler = Callable[..., Awaitable[None]]
+
+
+@dataclass
+class QueuedJob:
+    """Задача, выбранная из очереди для выполнения."""
+
+    name: str
+    payload: dict
+    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    attempts: int = 0
+    run_at: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+
+
+class JobBackend(ABC):
+    """Хранилище очереди фоновых задач."""
+
+    @abstractmethod
+    async def enqueue(
+        self,
+        name: str,
+        payload: dict,
+        session: Optional[AsyncSession] = None,
+        delay: float = 0,
+    ) -> None:
+        """Добавить задачу.
+
+        Если передана сессия, задача добавляется в ее транзакцию и
+        станет доступной только после commit.
+        """
+
+    @abstractmethod
+    async def fetch(self, limit: int) -> List[QueuedJob]:
+        """Выбрать готовые к выполнению задачи, увеличив attempts."""
+
+    @abstractmethod
+    async def complete(self, job: QueuedJob) -> None:
+        """Отметить задачу выполненной."""
+
+    @abstractmethod
+    async def retry(self, job: QueuedJob, delay: float, error: str) -> None:
+        """Вернуть задачу в очередь с задержкой."""
+
+    @abstractmethod
+    async def fail(self, job: QueuedJob, error: str) -> None:
+        """Отметить задачу как окончательно неудавшуюся."""
+
+
+class MemoryJobBackend(JobBackend):
+    """Очередь в памяти процесса, задачи теряются при перезапуске.
+
+    Задачи, добавленные в транзакцию сессии, откладываются до ее
+    commit и отбрасываются, если транзакция откатилась.
+    """
+
+    def __init__(self):
+        self.pending: Dict[uuid.UUID, QueuedJob] = {}
+        self.failed: Dict[uuid.UUID, QueuedJob] = {}
+        self.deferred: Dict[Session, List[QueuedJob]] = {}
+
+    async def enqueue(self, name, payload, session=None, delay=0) -> None:
+        job = QueuedJob(
+            name=name,
+            payload=payload,
+            run_at=datetime.datetime.utcnow()
+            + datetime.timedelta(seconds=delay),
+        )
+        if session is None:
+            self.pending[job.id] = job
+            return
+        sync_session = session.sync_session
+        if not event.contains(sync_session, "after_commit", self._on_commit):
+            event.listen(sync_session, "after_commit", self._on_commit)
+            event.listen(
+                sync_session, "after_transaction_end", self._on_transaction_end
+            )
+        self.deferred.setdefault(sync_session, []).append(job)
+
+    def _on_commit(self, sync_session: Session) -> None:
+        for job in self.deferred.pop(sync_session, []):
+            self.pending[job.id] = job
+
+    def _on_transaction_end(
+        self, sync_session: Session, transaction: SessionTransaction
+    ) -> None:
+        # после commit задач уже нет, иначе транзакция откатилась
+        if transaction.parent is None:
+            self.deferred.pop(sync_session, None)
+
+    async def fetch(self, limit: int) -> List[QueuedJob]:
+        now = datetime.datetime.utcnow()
+        due = sorted(
+            (job for job in self.pending.values() if job.run_at <= now),
+            key=lambda job: job.run_at,
+        )[:limit]
+        for job in due:
+            del self.pending[job.id]
+            job.attempts += 1
+        return due
+
+    async def complete(self, job: QueuedJob) -> None:
+        pass
+
+    async def retry(self, job: QueuedJob, delay: float, error: str) -> None:
+        job.run_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=delay
+        )
+        self.pending[job.id] = job
+
+    async def fail(self, job: QueuedJob, error: str) -> None:
+        self.failed[job.id] = job
+
+
+class PostgresJobBackend(JobBackend):
+    """Очередь в таблице jobs, общая для всех процессов сервиса.
+
+    Задачи выбираются запросом с FOR UPDATE SKIP LOCKED, поэтому
+    обработчики разных процессов не получают одну задачу дважды.
+    Задача, обработчик которой не успел за job_lease_timeout (например,
+    процесс упал), снова становится доступной.
+    """
+
+    async def enqueue(self, name, payload, session=None, delay=0) -> None:
+        query = insert(Job).values(
+            name=name,
+            payload=payload,
+            status="pending",
+            attempts=0,
+            run_at=datetime.datetime.utcnow()
+            + datetime.timedelta(seconds=delay),
+        )
+        if session is not None:
+            await session.execute(query)
+            return
+        async with async_session() as own_session:
+            await own_session.execute(query)
+            await own_session.commit()
+
+    async def fetch(self, limit: int) -> List[QueuedJob]:
+        now = datetime.datetime.utcnow()
+        due = (
+            select(Job.id)
+            .where(
+                or_(
+                    and_(Job.status == "pending", Job.run_at <= now),
+                    and_(Job.status == "running", Job.locked_until < now),
+                )
+            )
+            .order_by(Job.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        query = (
+            update(Job)
+            .where(Job.id.in_(due.scalar_subquery()))
+            .values(
+                status="running",
+                attempts=Job.attempts + 1,
+                locked_until=now
+                + datetime.timedelta(seconds=settings.job_lease_timeout),
+            )
+            .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.run_at)
+        )
+        async with async_session() as session:
+            result = await session.execute(query)
+            jobs = [QueuedJob(**row._mapping) for row in result]
+            await session.commit()
+        return jobs
+
+    async def _update(self, job: QueuedJob, **values) -> None:
+        async with async_session() as session:
+            await session.execute(
+                update(Job).where(Job.id == job.id).values(**values)
+            )
+            await session.commit()
+
+    async def complete(self, job: QueuedJob) -> None:
+        async with async_session() as session:
+            await session.execute(delete(Job).where(Job.id == job.id))
+            await session.commit()
+
+    async def retry(self, job: QueuedJob, delay: float, error: str) -> None:
+        await self._update(
+            job,
+            status="pending",
+            run_at=datetime.datetime.utcnow()
+            + datetime.timedelta(seconds=delay),
+            locked_until=None,
+            last_error=error,
+        )
+
+    async def fail(self, job: QueuedJob, error: str) -> None:
+        await self._update(
+            job, status="failed", locked_until=None, last_error=error
+        )
+
+
+class JobQueue:
+    """Очередь фоновых задач с обработчиками в event loop сервиса.
+
+    Обработчики регистрируются по имени задачи. Неудавшаяся задача
+    повторяется с экспоненциально растущей задержкой, после
+    max_attempts попыток она отмечается как неудавшаяся.
+    """
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        max_attempts: int = settings.job_max_attempts,
+        retry_delay: float = settings.job_retry_delay,
+        retry_delay_max: float = settings.job_retry_delay_max,
+        poll_interval: float = settings.job_poll_interval,
+    ):
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_delay_max = retry_delay_max
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def register(self, name: str) -> Callable[[JobHandler], JobHandler]:
+        """Декоратор, регистрирующий обработчик задачи."""
+
+        def decorator(handler: JobHandler) -> JobHandler:
+            self.handlers[name] = handler
+            return handler
+
+        return decorator
+
+    def handles(self, name: str) -> bool:
+        """Проверить, есть ли обработчик задачи."""
+        return name in self.handlers
+
+    async def enqueue(
+        self,
+        name: str,
+        payload: dict,
+        session: Optional[AsyncSession] = None,
+        delay: float = 0,
+    ) -> None:
+        """Добавить задачу в очередь."""
+        await self.backend.enqueue(name, payload, session=session, delay=delay)
+        if self._wakeup is not None and session is None and not delay:
+            self._wakeup.set()
+
+    def get_retry_delay(self, attempts: int) -> float:
+        """Получить задержку перед следующей попыткой."""
+        return min(
+            self.retry_delay * 2 ** (attempts - 1), self.retry_delay_max
+        )
+
+    async def run_job(self, job: QueuedJob) -> None:
+        """Выполнить задачу и сохранить результат в очереди."""
+        handler = self.handlers.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError(f"Нет обработчика задачи {job.name}")
+            await handler(**job.payload)
+        except Exception as err:
+            if job.attempts >= self.max_attempts:
+                logger.error(
+                    f"Задача {job.name} {job.id} не выполнена "
+                    f"за {job.attempts} попыток: {err}"
+                )
+                await self.backend.fail(job, str(err))
+            else:
+                delay = self.get_retry_delay(job.attempts)
+                logger.warning(
+                    f"Задача {job.name} {job.id} будет повторена "
+                    f"через {delay} с: {err}"
+                )
+                await self.backend.retry(job, delay, str(err))
+        else:
+            await self.backend.complete(job)
+
+    async def run_worker(self) -> None:
+        """Выбирать и выполнять задачи по одной до отмены."""
+        while True:
+            try:
+                jobs = await self.backend.fetch(1)
+                for job in jobs:
+                    await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.error(f"Ошибка очереди задач: {err}")
+                jobs = []
+            if jobs:
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self.poll_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, concurrency: int = settings.job_workers) -> None:
+        """Запустить обработчики задач в текущем event loop."""
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self.run_worker()) for _ in range(concurrency)
+        ]
+
+    async def stop(self) -> None:
+        """Остановить обработчики.
+
+        Прерванная задача в Postgres станет доступной после истечения
+        аренды и будет выполнена заново.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+
+
+def get_job_backend() -> JobBackend:
+    """Получить хранилище очереди из настроек."""
+    if settings.job_backend == "memory":
+        return MemoryJobBackend()
+    return PostgresJobBackend()
+
+
+job_queue = JobQueue(get_job_backend())
@@ -1,20 +1,98 @@
 import sys
+import uuid
+from contextvars import ContextVar
 from typing import Annotated
 
 import loguru
 from fastapi import Depends
 from loguru import logger
 
+from src.core.config import get_settings
 
-def get_logger() -> "loguru.Logger":
-    """Получить логгер."""
+REQUEST_ID_HEADER = "X-Request-ID"
+TEXT_FORMAT = (
+    "{time:YYYY-MM-DD HH:mm:ss} | {level} | {extra[request_id]} | {message}"
+)
+
+# идентификатор текущего запроса, подставляется в каждую запись лога
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_is_configured = False
+
+
+def add_request_id(record: dict) -> None:
+    """Добавить в запись лога идентификатор текущего запроса."""
+    record["extra"]["request_id"] = request_id_var.get()
+
+
+def setup_logging(force: bool = False) -> None:
+    """Настроить логирование один раз на процесс.
+
+    Записи кладутся в очередь и пишутся в stdout фоновым потоком
+    (enqueue), поэтому запись лога не блокирует event loop. При
+    log_json записи выводятся в JSON, по одной на строку.
+    """
+    global _is_configured
+    if _is_configured and not force:
+        return
+
+    settings = get_settings()
+    logger.remove()
+    logger.configure(patcher=add_request_id)
     logger.add(
         sys.stdout,
-        colorize=True,
-        level="DEBUG",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
+        level=settings.log_level,
+        format=TEXT_FORMAT,
+        serialize=settings.log_json,
+        colorize=False if settings.log_json else None,
+        enqueue=settings.log_enqueue,
     )
+    _is_configured = True
+
+
+def get_logger() -> "loguru.Logger":
+    """Получить логгер."""
+    setup_logging()
     return logger
 
 
+class RequestIdMiddleware:
+    """ASGI middleware, связывающий записи лога с запросом.
+
+    Идентификатор берется из заголовка X-Request-ID или создается,
+    хранится в contextvar на время запроса и возвращается в ответе.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        header = REQUEST_ID_HEADER.lower().encode()
+        request_id = next(
+            (
+                value.decode("latin-1")
+                for name, value in scope["headers"]
+                if name == header
+            ),
+            None,
+        )
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((header, request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
+
+
 LoggerDependency = Annotated["loguru.Logger", Depends(get_logger)]
@@ -0,0 +1,145 @@
+import functools
+import inspect
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from src.db.pool import get_pool_status
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP запроса",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Число HTTP запросов в обработке",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+S3_LATENCY = Histogram(
+    "s3_operation_duration_seconds",
+    "Время выполнения операций с хранилищем",
+    ["method"],
+)
+SERVICE_LATENCY = Histogram(
+    "service_call_duration_seconds",
+    "Время выполнения методов сервисов (запросов к БД)",
+    ["service", "method"],
+)
+UPLOADED_BYTES = Counter(
+    "storage_uploaded_bytes_total",
+    "Байт передано в хранилище через сервис",
+)
+DOWNLOADED_BYTES = Counter(
+    "storage_downloaded_bytes_total",
+    "Байт передано из хранилища клиентам через сервис",
+)
+
+
+def _timed(func, observer):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            observer.observe(time.perf_counter() - start_time)
+
+    return wrapper
+
+
+def instrument(histogram: Histogram, exclude: tuple = (), **labels):
+    """Декоратор класса, замеряющий время его асинхронных методов.
+
+    Оборачиваются публичные корутины, включая classmethod и
+    staticmethod, метка method - имя метода. Дочерние метрики
+    создаются при декорировании, поэтому на каждый вызов приходится
+    только замер времени и observe.
+    """
+
+    def decorator(cls):
+        for name, attribute in list(vars(cls).items()):
+            if name.startswith("_") or name in exclude:
+                continue
+            wrapper_type = None
+            func = attribute
+            if isinstance(attribute, (classmethod, staticmethod)):
+                wrapper_type = type(attribute)
+                func = attribute.__func__
+            if not inspect.iscoroutinefunction(func):
+                continue
+            timed = _timed(func, histogram.labels(method=name, **labels))
+            if wrapper_type is not None:
+                timed = wrapper_type(timed)
+            setattr(cls, name, timed)
+        return cls
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware с временем обработки запросов по маршрутам.
+
+    Метка route - шаблон пути, а не сам путь, чтобы число рядов
+    не росло с числом файлов и идентификаторов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method=method)
+        in_progress.inc()
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method=method,
+                route=getattr(route, "path", "unmatched"),
+                status=status_code,
+            ).observe(time.perf_counter() - start_time)
+
+
+class DBPoolCollector(Collector):
+    """Состояние пула соединений с БД, читается при каждом сборе."""
+
+    counters = {
+        "connects",
+        "checkouts",
+        "checkins",
+        "invalidations",
+        "timeouts",
+        "wait_seconds_total",
+    }
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        for name, value in get_pool_status(self.engine).items():
+            family = (
+                CounterMetricFamily
+                if name in self.counters
+                else GaugeMetricFamily
+            )
+            yield family(
+                f"db_pool_{name}", f"Пул соединений с БД: {name}", value=value
+            )
@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+from passlib.hash import bcrypt
+
+from src.core.config import get_settings
+
+settings = get_settings()
+
+password_hasher = bcrypt.using(rounds=settings.password_hash_rounds)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_password_executor() -> ThreadPoolExecutor:
+    """Получить пул потоков для хеширования паролей.
+
+    bcrypt отпускает GIL, поэтому в потоках хеширование идет параллельно
+    и не блокирует event loop. Размер пула ограничивает число
+    одновременных вычислений.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            thread_name_prefix="password-hash",
+        )
+    return _executor
+
+
+def shutdown_password_executor() -> None:
+    """Остановить пул потоков хеширования паролей."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def hash_password(password: str) -> str:
+    """Получить хеш пароля, не блокируя event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_password_executor(), partial(password_hasher.hash, password)
+    )
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """Проверить пароль по хешу, не блокируя event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_password_executor(),
+        partial(bcrypt.verify, password, password_hash),
+    )
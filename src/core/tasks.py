@@ -0,0 +1,23 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from src.core.log import get_logger
+
+logger = get_logger()
+
+
+async def run_periodically(
+    func: Callable[[], Awaitable], interval: float
+) -> None:
+    """Выполнять фоновую задачу с заданным интервалом до отмены.
+
+    Ошибка одного запуска логируется и не останавливает задачу.
+    """
+    while True:
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            logger.error(f"Ошибка фоновой задачи {func.__qualname__}: {err}")
+        await asyncio.sleep(interval)
@@ -1,5 +1,6 @@
 # from fastapi import File, UploadFile, Form
 from datetime import datetime
+from typing import List, Literal, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field
@@ -19,5 +20,167 @@ class FileItem(BaseModel):
         ignore_extra = True
 
 
+class FilesPage(BaseModel):
+    items: List[FileItem] = Field(description="Файлы на странице")
+    next_cursor: Optional[str] = Field(
+        None, description="Курсор следующей страницы, если она есть"
+    )
+
+
+class FolderEntry(BaseModel):
+    type: Literal["folder", "file"] = Field(description="Папка или файл")
+    name: Optional[str] = Field(description="Имя папки или файла")
+    path: str = Field(description="Полный путь в хранилище")
+    size: Optional[int] = Field(
+        description="Размер файла или всех файлов папки в байтах"
+    )
+    files_count: Optional[int] = Field(
+        None, description="Число файлов в папке на любой глубине"
+    )
+    id: Optional[UUID] = Field(None, description="Идентификатор файла")
+    created_ad: Optional[datetime] = Field(
+        None, description="Дата создания файла"
+    )
+
+
+class FolderListing(BaseModel):
+    path: str = Field(description="Полный путь папки в хранилище")
+    files_count: int = Field(description="Число файлов на любой глубине")
+    size: int = Field(description="Размер всех файлов папки в байтах")
+    items: List[FolderEntry] = Field(
+        description="Вложенные папки, затем файлы папки"
+    )
+    next_cursor: Optional[str] = Field(
+        None, description="Курсор следующей страницы, если она есть"
+    )
+
+
 class DownloadResponse(BaseModel):
     download_link: str = Field(description="Ссылка для скачивания")
+
+
+class BatchDownloadRequest(BaseModel):
+    items: List[str] = Field(
+        description="Пути или идентификаторы файлов", min_length=1
+    )
+
+
+class BatchDownloadItem(BaseModel):
+    item: str = Field(description="Путь или идентификатор из запроса")
+    download_link: Optional[str] = Field(
+        None, description="Ссылка для скачивания"
+    )
+    error: Optional[str] = Field(
+        None, description="Причина, по которой ссылка не получена"
+    )
+
+
+class BatchDownloadResponse(BaseModel):
+    items: List[BatchDownloadItem] = Field(
+        description="Результаты в порядке запроса"
+    )
+
+
+class StorageUsage(BaseModel):
+    used_bytes: int = Field(description="Занято байт")
+    files_count: int = Field(description="Число файлов")
+    quota_bytes: Optional[int] = Field(
+        None, description="Квота в байтах, если место ограничено"
+    )
+
+
+class BatchDeleteRequest(BaseModel):
+    items: List[str] = Field(
+        description="Пути или идентификаторы файлов", min_length=1
+    )
+
+
+class BatchDeleteItem(BaseModel):
+    item: str = Field(description="Путь или идентификатор из запроса")
+    error: Optional[str] = Field(
+        None, description="Причина, по которой файл не удален"
+    )
+
+
+class BatchDeleteResponse(BaseModel):
+    items: List[BatchDeleteItem] = Field(
+        description="Результаты в порядке запроса"
+    )
+
+
+class FolderDeleteResponse(BaseModel):
+    deleted: int = Field(description="Число удаленных файлов")
+    completed: bool = Field(
+        description="Удалены ли все файлы, иначе остальные удаляются в фоне"
+    )
+
+
+class BatchUploadItem(BaseModel):
+    filename: Optional[str] = Field(description="Имя файла из запроса")
+    path: Optional[str] = Field(
+        None, description="Полный путь до файла в хранилище"
+    )
+    file: Optional[FileItem] = Field(None, description="Загруженный файл")
+    error: Optional[str] = Field(
+        None, description="Причина, по которой файл не загружен"
+    )
+
+
+class BatchUploadResponse(BaseModel):
+    items: List[BatchUploadItem] = Field(
+        description="Результаты в порядке запроса"
+    )
+
+
+class UploadSessionCreate(BaseModel):
+    path: str = Field(description="<full-path-to-file> в папке пользователя")
+    size: int = Field(description="Размер файла в байтах", gt=0)
+
+
+class UploadPart(BaseModel):
+    part_number: int = Field(description="Номер части, начиная с 1")
+    offset: int = Field(description="Смещение части в файле")
+    size: int = Field(description="Размер части в байтах")
+    etag: str = Field(description="ETag части в хранилище")
+
+
+class UploadSessionStatus(BaseModel):
+    id: UUID = Field(description="Идентификатор загрузки")
+    path: str = Field(description="Полный путь до файла в хранилище")
+    size: int = Field(description="Размер файла в байтах")
+    part_size: int = Field(
+        description="Размер части, каждая часть кроме последней такая"
+    )
+    parts_count: int = Field(description="Число частей файла")
+    uploaded_size: int = Field(description="Сколько байт уже загружено")
+    parts: List[UploadPart] = Field(
+        default_factory=list, description="Уже загруженные части"
+    )
+
+
+class DirectUploadRequest(BaseModel):
+    path: str = Field(description="<full-path-to-file> в папке пользователя")
+    size: Optional[int] = Field(
+        None,
+        description="Размер файла в байтах, если известен заранее",
+        ge=0,
+    )
+
+
+class DirectUploadComplete(BaseModel):
+    id: UUID = Field(description="Идентификатор загрузки из ссылки")
+
+
+class DirectUploadResponse(BaseModel):
+    id: UUID = Field(description="Идентификатор загрузки для подтверждения")
+    path: str = Field(description="Полный путь до файла в хранилище")
+    upload_link: str = Field(description="Ссылка для загрузки запросом PUT")
+    expires_in: int = Field(description="Время жизни ссылки в секундах")
+
+
+class PartUploadLink(BaseModel):
+    part_number: int = Field(description="Номер части, начиная с 1")
+    offset: int = Field(description="Смещение части в файле")
+    size: int = Field(description="Ожидаемый размер части в байтах")
+    upload_link: str = Field(description="Ссылка для загрузки запросом PUT")
+    expires_in: int = Field(description="Время жизни ссылки в секундах")
@@ -9,13 +9,44 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.pool import NullPool
 
-from src.core.config import get_settings
+from src.core.config import Settings, get_settings
+from src.db.pool import InstrumentedQueuePool, instrument_engine
 
 config = get_settings()
 
+
+def get_connect_args(settings: Settings) -> dict:
+    """Получить параметры подключения для драйвера БД."""
+    if "asyncpg" not in settings.db_driver:
+        return {}
+    return {
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": settings.db_statement_cache_size,
+    }
+
+
+def get_pool_args(settings: Settings) -> dict:
+    """Получить параметры пула соединений с БД."""
+    if not settings.db_pool_enabled:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
 engine = create_async_engine(
-    str(config.db_url), echo=True, future=True, poolclass=NullPool
+    str(config.db_url),
+    echo=config.db_echo,
+    future=True,
+    connect_args=get_connect_args(config),
+    **get_pool_args(config),
 )
+instrument_engine(engine)
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 metadata = sqlalchemy.MetaData()
@@ -1,19 +1,75 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
-from migrations.utils import upgrade_head
-from src.api.v1 import auth, files, statuses, users
-from src.core.log import get_logger
+from migrations.utils import check_revision
+from src.api.v1 import auth, files, metrics, statuses, uploads, users
+from src.clients.s3 import s3_client
+from src.core.config import get_settings
+from src.core.jobs import job_queue
+from src.core.log import RequestIdMiddleware, get_logger, setup_logging
+from src.core.metrics import MetricsMiddleware
+from src.core.security import shutdown_password_executor
+from src.core.tasks import run_periodically
+from src.db.db import engine
+from src.services.blobs import BlobService
+from src.services.files import FilesService
+from src.services.uploads import UploadsService
 
-app = FastAPI(default_response_class=ORJSONResponse)
-app.include_router(auth.router)
-app.include_router(users.router)
-app.include_router(statuses.router)
-app.include_router(files.router)
+settings = get_settings()
 
 
-@app.on_event("startup")
-def start():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     logger = get_logger()
     logger.info("Сервер запущен")
-    upgrade_head()
+    # соединения, унаследованные от родительского процесса, не
+    # используются: каждый процесс открывает свой пул и свой клиент S3
+    await engine.dispose(close=False)
+    if settings.check_migrations_on_startup:
+        await check_revision(engine)
+    await s3_client.start()
+    background_tasks = [
+        asyncio.create_task(
+            run_periodically(
+                BlobService.reap_orphans, settings.blob_reaper_interval
+            )
+        ),
+        asyncio.create_task(
+            run_periodically(
+                UploadsService.reap_stale_sessions,
+                settings.upload_session_reaper_interval,
+            )
+        ),
+        asyncio.create_task(
+            run_periodically(
+                FilesService.reap_direct_uploads,
+                settings.upload_session_reaper_interval,
+            )
+        ),
+    ]
+    job_queue.start(settings.job_workers)
+    yield
+    await job_queue.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await s3_client.close()
+    await engine.dispose()
+    shutdown_password_executor()
+    logger.info("Сервер остановлен")
+    await logger.complete()
+
+
+setup_logging()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.include_router(auth.router)
+app.include_router(users.router)
+app.include_router(statuses.router)
+app.include_router(metrics.router)
+app.include_router(files.router)
+app.include_router(uploads.router)
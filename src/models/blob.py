@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, String
+
+from src.models.base import Base
+
+
+class Blob(Base):
+    """Содержимое файла в хранилище, адресуемое по SHA-256.
+
+    Один объект хранилища может использоваться несколькими файлами,
+    ref_count - число файлов, ссылающихся на него. Объекты без ссылок
+    удаляются сборщиком после released_at + grace период.
+    """
+
+    __tablename__ = "blobs"
+    digest = Column(String(length=64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    etag = Column(String)
+    ref_count = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    released_at = Column(DateTime, index=True)
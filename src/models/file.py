@@ -1,7 +1,15 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    String,
+)
 from sqlalchemy.dialects.postgresql import UUID
 
 from src.models.base import Base
@@ -9,10 +17,52 @@ from src.models.base import Base
 
 class File(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        Index(
+            "ix_files_account_id_created_ad_id",
+            "account_id",
+            "created_ad",
+            "id",
+        ),
+        Index(
+            "ix_files_path_pattern",
+            "path",
+            postgresql_ops={"path": "text_pattern_ops"},
+        ),
+        Index("ix_files_folder_path", "folder", "path"),
+        # поиск по подстроке в имени и пути (pg_trgm)
+        Index(
+            "ix_files_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_files_path_trgm",
+            "path",
+            postgresql_using="gin",
+            postgresql_ops={"path": "gin_trgm_ops"},
+        ),
+        # сортировка результатов поиска по размеру и имени
+        Index("ix_files_account_id_size_id", "account_id", "size", "id"),
+        Index("ix_files_account_id_name_id", "account_id", "name", "id"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     account_id = Column(String, ForeignKey("users.email"), nullable=False)
     name = Column(String)
     created_ad = Column(DateTime, default=datetime.utcnow)
     path = Column(String(length=300), unique=True)
-    size = Column(Integer)
+    # папка, в которой непосредственно лежит файл (путь без имени)
+    folder = Column(String(length=300))
+    size = Column(BigInteger)
+    etag = Column(String)
+    blob_digest = Column(
+        String(length=64),
+        ForeignKey("blobs.digest"),
+        nullable=True,
+        index=True,
+    )
+    # ключ объекта в хранилище для файлов, загруженных не как blob,
+    # у файлов, загруженных раньше, пустой: объект лежит по пути
+    object_key = Column(String(length=300), index=True)
     is_downloadable = Column(Boolean, default=False)
@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger, Column, ForeignKey, String
+
+from src.models.base import Base
+
+
+class Folder(Base):
+    """Папка пользователя с числом и размером всех вложенных файлов.
+
+    Папки не хранятся отдельно от файлов: строка есть, пока в папке
+    (на любой глубине) есть хотя бы один файл. Счетчики меняются в тех
+    же транзакциях, что и таблица files. Корневая папка пользователя -
+    его email, у нее нет parent.
+    """
+
+    __tablename__ = "folders"
+    path = Column(String(length=300), primary_key=True)
+    account_id = Column(String, ForeignKey("users.email"), nullable=False)
+    parent = Column(String(length=300), index=True)
+    files_count = Column(BigInteger, nullable=False, default=0)
+    size = Column(BigInteger, nullable=False, default=0)
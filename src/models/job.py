@@ -0,0 +1,28 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from src.models.base import Base
+
+
+class Job(Base):
+    """Фоновая задача в очереди.
+
+    Выбранная обработчиком задача получает статус running и срок
+    аренды locked_until: если процесс упал, по его истечении задача
+    снова становится доступной. Выполненные задачи удаляются.
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+    status = Column(String(length=16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,51 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, String
+from sqlalchemy.dialects.postgresql import UUID
+
+from src.models.base import Base
+
+
+class UploadSession(Base):
+    """Незавершенная загрузка файла по частям (S3 multipart upload).
+
+    Загруженные части хранятся только в хранилище, здесь лежит то,
+    что нужно для их дозагрузки и сборки файла. updated_at обновляется
+    при каждой части, по нему сборщик отменяет брошенные загрузки.
+    Объект собирается под уникальным ключом загрузки, а не по пути
+    файла.
+    """
+
+    __tablename__ = "upload_sessions"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    account_id = Column(String, ForeignKey("users.email"), nullable=False)
+    path = Column(String(length=300), nullable=False)
+    # уникальный ключ объекта загрузки, у старых загрузок пустой
+    object_key = Column(String(length=300))
+    name = Column(String)
+    upload_id = Column(String, nullable=False)
+    # uploading, completing - объект собирается в хранилище
+    status = Column(String, nullable=False, default="uploading")
+    size = Column(BigInteger, nullable=False)
+    part_size = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class DirectUpload(Base):
+    """Выданная ссылка на загрузку файла напрямую в хранилище.
+
+    Объект загружается под своим уникальным ключом, а не по пути файла,
+    поэтому неподтвержденная загрузка не затрагивает уже сохраненный
+    файл. Загрузки, не подтвержденные за upload_session_ttl, удаляет
+    сборщик вместе с объектами.
+    """
+
+    __tablename__ = "direct_uploads"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    account_id = Column(String, ForeignKey("users.email"), nullable=False)
+    path = Column(String(length=300), nullable=False)
+    object_key = Column(String(length=300), nullable=False)
+    size = Column(BigInteger)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
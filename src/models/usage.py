@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, String
+
+from src.models.base import Base
+
+
+class UserUsage(Base):
+    """Объем хранилища, занятый файлами пользователя.
+
+    Счетчики меняются в тех же транзакциях, что и таблица files,
+    поэтому использование читается одной строкой, без SUM по файлам.
+    """
+
+    __tablename__ = "user_usage"
+    account_id = Column(String, ForeignKey("users.email"), primary_key=True)
+    used_bytes = Column(BigInteger, nullable=False, default=0)
+    files_count = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,66 @@
+import datetime
+import io
+import zipfile
+from typing import AsyncIterator, Tuple
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Неперематываемый поток, накапливающий байты, записанные zipfile.
+
+    Так как поток не поддерживает seek, zipfile пишет размеры и
+    контрольные суммы в дескриптор после данных файла, и архив можно
+    отдавать клиенту по мере записи.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        """Забрать накопленные байты."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+ArchiveEntry = Tuple[str, datetime.datetime, AsyncIterator[bytes]]
+
+
+async def stream_zip(
+    entries: AsyncIterator[ArchiveEntry],
+) -> AsyncIterator[bytes]:
+    """Собрать zip архив на лету из потоков файлов.
+
+    Файлы записываются без сжатия, поэтому в памяти держится только
+    текущий кусок файла, а процессорное время не тратится на сжатие
+    уже сжатых данных (картинки, архивы, видео).
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode="w") as archive:
+        async for name, modified_at, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time=_zip_date_time(modified_at))
+            info.compress_type = zipfile.ZIP_STORED
+            with archive.open(info, mode="w", force_zip64=True) as entry:
+                async for chunk in chunks:
+                    entry.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            data = buffer.pop()
+            if data:
+                yield data
+    yield buffer.pop()
+
+
+def _zip_date_time(modified_at: datetime.datetime) -> tuple:
+    """Получить дату изменения в формате zip (не раньше 1980 года)."""
+    if modified_at is None or modified_at.year < 1980:
+        modified_at = datetime.datetime(1980, 1, 1)
+    return modified_at.timetuple()[:6]
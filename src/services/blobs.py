@@ -0,0 +1,250 @@
+import asyncio
+import datetime
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    BigInteger,
+    String,
+    any_,
+    bindparam,
+    case,
+    column,
+    delete,
+    or_,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.clients.s3 import s3_client
+from src.core.config import get_settings
+from src.core.log import get_logger
+from src.core.metrics import SERVICE_LATENCY, instrument
+from src.db.db import async_session
+from src.models.blob import Blob
+
+settings = get_settings()
+logger = get_logger()
+
+
+@instrument(SERVICE_LATENCY, service="blobs")
+class BlobService:
+    """Хранение содержимого файлов по SHA-256 с подсчетом ссылок."""
+
+    s3_client = s3_client
+    s3_bucket_name = settings.s3_bucket_name
+
+    @staticmethod
+    def blob_key(digest: str) -> str:
+        """Получить ключ объекта в хранилище по хешу содержимого."""
+        return f"blobs/{digest[:2]}/{digest}"
+
+    @staticmethod
+    async def hash_file(file) -> Tuple[str, int]:
+        """Посчитать SHA-256 и размер загружаемого файла.
+
+        Файл читается частями, хеш считается в потоке (hashlib отпускает
+        GIL), после чего файл перематывается в начало для загрузки.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        while True:
+            part = await file.read(settings.s3_multipart_part_size)
+            if not part:
+                break
+            size += len(part)
+            await asyncio.to_thread(hasher.update, part)
+        await file.seek(0)
+        return hasher.hexdigest(), size
+
+    @classmethod
+    async def get_live_blob(
+        cls, session: AsyncSession, digest: str
+    ) -> Optional[Blob]:
+        """Получить blob, который можно переиспользовать без загрузки.
+
+        Blob без ссылок, который скоро заберет сборщик, считается
+        отсутствующим: содержимое загружается заново, чтобы сборщик
+        не удалил объект сразу после того, как на него сослались.
+        """
+        blobs = await cls.get_live_blobs(session, [digest])
+        return blobs.get(digest)
+
+    @classmethod
+    async def get_live_blobs(
+        cls, session: AsyncSession, digests: List[str]
+    ) -> Dict[str, Blob]:
+        """Получить переиспользуемые blob по списку хешей одним запросом.
+
+        Blob без etag занят загрузкой, которая еще не завершилась, и
+        переиспользовать его нельзя.
+        """
+        reusable_until = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=settings.blob_orphan_grace_period / 2
+        )
+        query = select(Blob).where(
+            Blob.digest == any_(bindparam("digests", digests, ARRAY(String))),
+            Blob.etag.isnot(None),
+            or_(Blob.ref_count > 0, Blob.released_at > reusable_until),
+        )
+        result = await session.execute(query)
+        return {blob.digest: blob for blob in result.scalars()}
+
+    @classmethod
+    async def claim(cls, session: AsyncSession, blobs: Dict[str, int]) -> None:
+        """Занять blob перед загрузкой их содержимого в хранилище.
+
+        blobs - словарь digest -> размер. Отсутствующие blob создаются
+        без ссылок, у blob без ссылок обновляется released_at, поэтому
+        сборщик не удалит объект, пока идет загрузка (не дольше grace
+        периода). Если blob в этот момент удаляет сборщик, запрос ждет
+        его commit и создает blob заново. Сессию нужно закоммитить до
+        загрузки.
+        """
+        if not blobs:
+            return
+
+        now = datetime.datetime.utcnow()
+        query = insert(Blob).values(
+            [
+                {
+                    "digest": digest,
+                    "ref_count": 0,
+                    "size": size,
+                    "created_at": now,
+                    "released_at": now,
+                }
+                # одинаковый порядок строк не дает транзакциям
+                # заблокировать друг друга
+                for digest, size in sorted(blobs.items())
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[Blob.digest],
+            set_={"released_at": query.excluded.released_at},
+            where=Blob.ref_count <= 0,
+        )
+        await session.execute(query)
+
+    @classmethod
+    async def store(cls, digest: str, parts) -> dict:
+        """Записать содержимое в хранилище под ключом его хеша."""
+        return await cls.s3_client.upload_stream(
+            cls.s3_bucket_name, cls.blob_key(digest), parts
+        )
+
+    @classmethod
+    async def add_references(
+        cls, session: AsyncSession, blobs: Dict[str, Tuple[int, int, str]]
+    ) -> None:
+        """Увеличить счетчики ссылок, создав недостающие blob.
+
+        blobs - словарь digest -> (число новых ссылок, размер, etag).
+        """
+        if not blobs:
+            return
+
+        query = insert(Blob).values(
+            [
+                {
+                    "digest": digest,
+                    "ref_count": count,
+                    "size": size,
+                    "etag": etag,
+                    "created_at": datetime.datetime.utcnow(),
+                }
+                for digest, (count, size, etag) in blobs.items()
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[Blob.digest],
+            set_={
+                "ref_count": Blob.ref_count + query.excluded.ref_count,
+                "etag": query.excluded.etag,
+                "released_at": None,
+            },
+        )
+        await session.execute(query)
+
+    @classmethod
+    async def release_references(
+        cls, session: AsyncSession, blobs: Dict[str, int]
+    ) -> None:
+        """Уменьшить счетчики ссылок одним запросом.
+
+        blobs - словарь digest -> число освобожденных ссылок. У blob без
+        ссылок проставляется released_at, их удалит сборщик.
+        """
+        if not blobs:
+            return
+
+        deltas = values(
+            column("digest", String),
+            column("delta", BigInteger),
+            name="deltas",
+        ).data(list(blobs.items()))
+        new_ref_count = Blob.ref_count - deltas.c.delta
+        query = (
+            update(Blob)
+            .where(Blob.digest == deltas.c.digest)
+            .values(
+                ref_count=new_ref_count,
+                released_at=case(
+                    (new_ref_count <= 0, datetime.datetime.utcnow()),
+                    else_=None,
+                ),
+            )
+        )
+        await session.execute(query)
+
+    @classmethod
+    async def reap_orphans(cls, limit: int = 1000) -> List[str]:
+        """Удалить blob без ссылок, освобожденные дольше grace периода.
+
+        Строки выбираются с FOR UPDATE SKIP LOCKED, поэтому сборщики
+        нескольких процессов не мешают друг другу и загрузкам. Объекты
+        удаляются из хранилища, пока строки заблокированы, и только
+        потом удаляются строки: загрузка того же содержимого (claim)
+        ждет commit сборщика и записывает объект заново.
+        """
+        released_before = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=settings.blob_orphan_grace_period
+        )
+        orphans = (
+            select(Blob.digest)
+            .where(Blob.ref_count <= 0, Blob.released_at < released_before)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with async_session() as session:
+            digests = (await session.scalars(orphans)).all()
+            if not digests:
+                return digests
+            try:
+                failed = await cls.s3_client.delete_objects(
+                    cls.s3_bucket_name,
+                    [cls.blob_key(digest) for digest in digests],
+                )
+            except Exception as err:
+                logger.error(f"Не удалось удалить blob из хранилища: {err}")
+                return []
+            # не удаленные из хранилища blob остаются до следующего запуска
+            failed = set(failed)
+            digests = [
+                digest
+                for digest in digests
+                if cls.blob_key(digest) not in failed
+            ]
+            await session.execute(
+                delete(Blob).where(
+                    Blob.digest
+                    == any_(bindparam("digests", digests, ARRAY(String)))
+                )
+            )
+            await session.commit()
+
+        logger.info(f"Удалено неиспользуемых blob: {len(digests)}")
+        return digests
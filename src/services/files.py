@@ -1,17 +1,50 @@
+import asyncio
+import collections
 import datetime
+import email.utils
+import itertools
 import os
+import posixpath
 import urllib.parse
 import uuid
-from typing import Union
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
-from sqlalchemy import select, update
+from sqlalchemy import (
+    String,
+    any_,
+    bindparam,
+    delete,
+    literal,
+    or_,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.clients.s3 import S3Client
+from src.clients.s3 import s3_client
+from src.core.cache import CacheBackend, MemoryCache
 from src.core.config import get_settings
+from src.core.jobs import job_queue
 from src.core.log import get_logger
+from src.core.metrics import DOWNLOADED_BYTES, SERVICE_LATENCY, instrument
 from src.data_classes.files import FileItem
+from src.db.db import async_session
 from src.models.file import File
+from src.models.upload import DirectUpload
+from src.services.archive import ArchiveEntry, stream_zip
+from src.services.blobs import BlobService
+from src.services.folders import FoldersService
+from src.services.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    encode_cursor,
+)
+from src.services.usage import QuotaExceededError, UsageService
 
 settings = get_settings()
 logger = get_logger()
@@ -21,14 +54,56 @@ class S3UploadFileExceptiom(Exception):
     pass
 
 
+@dataclass
+class FileRecord:
+    """Данные о записанном в хранилище файле для сохранения в БД."""
+
+    path: str
+    account_id: str
+    name: str
+    size: int
+    etag: str
+    blob_digest: Optional[str] = None
+    object_key: Optional[str] = None
+
+
+WRONG_PATH_ERROR = "Не правильно указан путь или идентификатор файла"
+# задача после сохранения файла, ставится, если у нее есть обработчик
+FILE_UPLOADED_JOB = "files.uploaded"
+DELETE_OBJECTS_JOB = "storage.delete_objects"
+DELETE_FOLDER_JOB = "files.delete_folder"
+FORBIDDEN_ERROR = "У вас нет прав на скачивания этого файла"
+DELETE_FORBIDDEN_ERROR = "У вас нет прав на удаление этого файла"
+DUPLICATE_PATH_ERROR = "Файл с тем же путем есть дальше в запросе"
+UPLOAD_ERROR = "Не удалось загрузить файл в хранилище"
+# блокировки путей до конца транзакции, ключи берутся по возрастанию,
+# чтобы транзакции с пересекающимися путями не ждали друг друга по кругу
+LOCK_PATHS_QUERY = text(
+    "SELECT pg_advisory_xact_lock(key) FROM ("
+    "SELECT DISTINCT hashtext(path) AS key FROM unnest(:paths) AS path "
+    "ORDER BY key) AS keys"
+).bindparams(bindparam("paths", type_=ARRAY(String)))
+
+# колонки, по которым можно сортировать результаты поиска
+SEARCH_SORT_COLUMNS = {
+    "created_ad": File.created_ad,
+    "name": File.name,
+    "size": File.size,
+}
+# типы значений ключа сортировки в курсоре поиска
+SEARCH_CURSOR_TYPES = {"created_ad": str, "name": str, "size": int}
+
+
+@instrument(SERVICE_LATENCY, service="files")
 class FilesService:
-    s3_client = S3Client(
-        logger=logger,
-        endpoint=f"{settings.s3_protocol}://{settings.s3_host}:{settings.s3_port}",
-        access_key=settings.s3_access_key_id,
-        secret_key=settings.s3_secret_access_key,
-    )
+    s3_client = s3_client
     s3_bucket_name = settings.s3_bucket_name
+    # подписанные ссылки на скачивание по (бакет, путь)
+    download_links_cache: CacheBackend = MemoryCache(
+        maxsize=settings.download_link_cache_size,
+        ttl=settings.default_url_lifetime
+        * settings.download_link_reuse_fraction,
+    )
 
     @staticmethod
     def is_uuid(input_string):
@@ -53,32 +128,409 @@ class FilesService:
         """
         return f"{email}/{path}"
 
+    @staticmethod
+    def object_key(
+        path: str, blob_digest: Optional[str], stored_key: Optional[str] = None
+    ) -> str:
+        """Получить ключ объекта файла в хранилище.
+
+        Содержимое, загруженное через сервис, хранится по хешу (blob),
+        загруженное напрямую в хранилище - под уникальным ключом
+        загрузки (stored_key). Файлы, загруженные до этого, лежат в
+        хранилище по своему пути.
+        """
+        if blob_digest:
+            return BlobService.blob_key(blob_digest)
+        return stored_key or path
+
+    @staticmethod
+    def staging_key(upload_id: uuid.UUID) -> str:
+        """Получить уникальный ключ объекта для загрузки мимо сервиса."""
+        return f"uploads/{upload_id}"
+
+    @classmethod
+    def prepare_folder_by_user(cls, folder: str, email: str) -> str:
+        """Подготовить префикс путей файлов внутри папки пользователя."""
+        folder = folder.strip("/")
+        if not folder:
+            return cls.prepare_path_by_user("", email)
+        return cls.prepare_path_by_user(f"{folder}/", email)
+
+    @staticmethod
+    def like_prefix(prefix: str) -> str:
+        """Получить шаблон LIKE для поиска путей по префиксу.
+
+        Шаблон передается целиком одним параметром, чтобы Postgres мог
+        использовать для поиска индекс path text_pattern_ops.
+        """
+        return f"{FilesService.escape_like(prefix)}%"
+
+    @staticmethod
+    def escape_like(value: str) -> str:
+        """Экранировать спецсимволы LIKE в значении из запроса."""
+        for char in ("\\", "%", "_"):
+            value = value.replace(char, f"\\{char}")
+        return value
+
+    @staticmethod
+    async def read_parts(file, part_size: int) -> AsyncIterator[bytes]:
+        """Читать загружаемый файл частями фиксированного размера."""
+        while True:
+            part = await file.read(part_size)
+            if not part:
+                break
+            yield part
+
     @classmethod
-    async def get_files(cls, session: AsyncSession):
-        """Получить все файлы хранилища."""
-        query = select(File)
+    async def get_files(
+        cls,
+        session: AsyncSession,
+        user_email: str,
+        owner: str,
+        prefix: Optional[str] = None,
+        limit: int = settings.files_page_size,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Получить страницу файлов владельца.
+
+        Используется пагинация по ключу (created_ad, id): следующая
+        страница начинается сразу после последней записи предыдущей,
+        поэтому стоимость запроса не зависит от номера страницы.
+        Признак is_downloadable вычисляется в запросе.
+        """
+        query = select(
+            File.id,
+            File.created_ad,
+            File.name,
+            File.path,
+            File.size,
+            File.blob_digest,
+            File.object_key,
+            (File.account_id == user_email).label("is_downloadable"),
+        ).where(File.account_id == owner)
+        if prefix:
+            query = query.where(
+                File.path.like(
+                    cls.like_prefix(cls.prepare_folder_by_user(prefix, owner)),
+                    escape="\\",
+                )
+            )
+        if cursor:
+            created_ad, file_id = decode_cursor(cursor, size=2)
+            try:
+                bound = tuple_(
+                    datetime.datetime.fromisoformat(created_ad),
+                    uuid.UUID(file_id),
+                )
+            except (TypeError, ValueError) as err:
+                raise InvalidCursorError(
+                    f"Некорректный курсор: {cursor}"
+                ) from err
+            query = query.where(tuple_(File.created_ad, File.id) > bound)
+        query = query.order_by(File.created_ad, File.id).limit(limit + 1)
         result = await session.execute(query)
-        return result.scalars().all()
+        rows = [dict(row._mapping) for row in result]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(
+                rows[-1]["created_ad"].isoformat(), rows[-1]["id"]
+            )
+        return rows, next_cursor
+
+    @classmethod
+    async def apply_counters(
+        cls, session: AsyncSession, changes: List[Tuple[str, str, int, int]]
+    ) -> None:
+        """Изменить занятое место пользователей и счетчики папок.
+
+        changes - список (account_id, путь файла, изменение байт,
+        изменение числа файлов). Изменения должны быть посчитаны по
+        строкам, заблокированным в той же транзакции (пути в
+        record_files, удаленные строки в delete_where), иначе
+        параллельные запросы учтут один файл дважды.
+        """
+        usage = collections.defaultdict(lambda: (0, 0))
+        folders = collections.defaultdict(lambda: (0, 0))
+        for account_id, path, size, files_count in changes:
+            for counters, key in (
+                (usage, account_id),
+                (folders, (account_id, FoldersService.get_folder(path))),
+            ):
+                total_size, total_count = counters[key]
+                counters[key] = (total_size + size, total_count + files_count)
+        await UsageService.apply(session, usage)
+        await FoldersService.apply(session, folders)
+
+    @staticmethod
+    def to_naive_utc(value: datetime.datetime) -> datetime.datetime:
+        """Привести дату из запроса к UTC без пояса, как в created_ad."""
+        if value.tzinfo is None:
+            return value
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    @classmethod
+    def get_search_conditions(
+        cls,
+        email: str,
+        name: Optional[str] = None,
+        path: Optional[str] = None,
+        prefix: Optional[str] = None,
+        folder: Optional[str] = None,
+        extension: Optional[str] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        created_from: Optional[datetime.datetime] = None,
+        created_to: Optional[datetime.datetime] = None,
+    ) -> list:
+        """Получить условия поиска по файлам пользователя.
+
+        Подстроки ищутся без учета регистра через ILIKE, такие условия
+        используют trigram индексы на name и path.
+        """
+        filters = (
+            (
+                folder,
+                lambda value: File.path.like(
+                    cls.like_prefix(cls.prepare_folder_by_user(value, email)),
+                    escape="\\",
+                ),
+            ),
+            (
+                name,
+                lambda value: File.name.ilike(
+                    f"%{cls.escape_like(value)}%", escape="\\"
+                ),
+            ),
+            (
+                path,
+                lambda value: File.path.ilike(
+                    f"{cls.escape_like(email)}/%{cls.escape_like(value)}%",
+                    escape="\\",
+                ),
+            ),
+            (
+                prefix,
+                lambda value: File.name.ilike(
+                    cls.like_prefix(value), escape="\\"
+                ),
+            ),
+            (
+                extension,
+                lambda value: File.name.ilike(
+                    f"%.{cls.escape_like(value.lstrip('.'))}", escape="\\"
+                ),
+            ),
+            (min_size, lambda value: File.size >= value),
+            (max_size, lambda value: File.size <= value),
+            (
+                created_from,
+                lambda value: File.created_ad >= cls.to_naive_utc(value),
+            ),
+            (
+                created_to,
+                lambda value: File.created_ad < cls.to_naive_utc(value),
+            ),
+        )
+        return [File.account_id == email] + [
+            condition(value)
+            for value, condition in filters
+            if value is not None and value != ""
+        ]
+
+    @staticmethod
+    def get_search_cursor_bound(cursor: str, sort: str, sort_key: str):
+        """Получить из курсора поиска ключ, после которого идет страница.
+
+        Курсор действителен только для той же сортировки, значение ключа
+        должно иметь тип колонки сортировки.
+        """
+        cursor_key, value, file_id = decode_cursor(cursor, size=3)
+        if cursor_key != sort_key or isinstance(value, bool):
+            raise InvalidCursorError(f"Некорректный курсор: {cursor}")
+        try:
+            if not isinstance(value, SEARCH_CURSOR_TYPES[sort]):
+                raise TypeError(f"Некорректное значение ключа: {value!r}")
+            if sort == "created_ad":
+                value = datetime.datetime.fromisoformat(value)
+            return tuple_(value, uuid.UUID(file_id))
+        except (TypeError, ValueError) as err:
+            raise InvalidCursorError(f"Некорректный курсор: {cursor}") from err
 
     @classmethod
-    async def insert_file_info(
+    async def search_files(
         cls,
         session: AsyncSession,
-        path: str,
-        account_id: str,
-        name: str,
-        s3_data: dict,
-    ) -> File:
-        """Добавить информацию о загруженном файле в БД."""
-        file_object = File(
-            path=path,
-            account_id=account_id,
-            name=name,
-            size=s3_data["ContentLength"],
+        email: str,
+        sort: str = "created_ad",
+        descending: bool = True,
+        limit: int = settings.files_page_size,
+        cursor: Optional[str] = None,
+        **filters,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Найти файлы пользователя по фильтрам.
+
+        Результаты сортируются по sort и id, следующая страница
+        начинается после последней записи предыдущей (пагинация по
+        ключу). Курсор действителен только для той же сортировки.
+        Файлы без значения ключа сортировки не находятся.
+        """
+        column = SEARCH_SORT_COLUMNS[sort]
+        sort_key = f"{sort}:{'desc' if descending else 'asc'}"
+        conditions = cls.get_search_conditions(email, **filters)
+        # сравнение с курсором не пропускает NULL, поэтому файлы без
+        # значения ключа сортировки не попадают ни на одну страницу
+        conditions.append(column.is_not(None))
+        if cursor:
+            bound = cls.get_search_cursor_bound(cursor, sort, sort_key)
+            key = tuple_(column, File.id)
+            conditions.append(key < bound if descending else key > bound)
+
+        order_by = [column, File.id]
+        if descending:
+            order_by = [column.desc(), File.id.desc()]
+        query = (
+            select(
+                File.id,
+                File.created_ad,
+                File.name,
+                File.path,
+                File.size,
+                literal(True).label("is_downloadable"),
+            )
+            .where(*conditions)
+            .order_by(*order_by)
+            .limit(limit + 1)
         )
-        session.add(file_object)
+        result = await session.execute(query)
+        rows = [dict(row._mapping) for row in result]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            value = rows[-1][sort]
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            next_cursor = encode_cursor(sort_key, value, rows[-1]["id"])
+        return rows, next_cursor
+
+    @classmethod
+    async def record_files(
+        cls, session: AsyncSession, records: List[FileRecord]
+    ) -> List[File]:
+        """Добавить или обновить информацию о файлах в БД.
+
+        В одной транзакции блокируются пути файлов (advisory lock, так
+        как FOR UPDATE не блокирует еще не созданные строки), читаются
+        прежние записи, пересчитываются ссылки на blob и выполняется
+        один запрос INSERT ... ON CONFLICT (path) DO UPDATE ... RETURNING
+        на все файлы. В той же транзакции меняются занятое
+        пользователями место и счетчики папок, ставятся фоновые задачи:
+        удаление объектов, которые больше не нужны, и обработка новых
+        файлов. Параллельные загрузки по одному пути выполняются по
+        очереди и видят результат друг друга. Задача удаления перед
+        удалением проверяет, что на ключ снова не сослался новый файл
+        (см. delete_unreferenced_objects).
+        """
+        paths = [record.path for record in records]
+        await session.execute(LOCK_PATHS_QUERY, {"paths": paths})
+        previous = await session.execute(
+            select(File.path, File.blob_digest, File.object_key, File.size)
+            .where(File.path == any_(bindparam("paths", paths, ARRAY(String))))
+            .with_for_update()
+        )
+        previous_files = {row.path: row for row in previous}
+
+        added: Dict[str, Tuple[int, int, str]] = {}
+        released: Dict[str, int] = {}
+        changes = []
+        superseded_keys = []
+        for record in records:
+            previous_file = previous_files.get(record.path)
+            if previous_file is None:
+                changes.append(
+                    (record.account_id, record.path, record.size, 1)
+                )
+            else:
+                changes.append(
+                    (
+                        record.account_id,
+                        record.path,
+                        record.size - (previous_file.size or 0),
+                        0,
+                    )
+                )
+                old_digest = previous_file.blob_digest
+                old_key = cls.object_key(
+                    record.path, old_digest, previous_file.object_key
+                )
+                if old_key == cls.object_key(
+                    record.path, record.blob_digest, record.object_key
+                ):
+                    continue
+                if old_digest:
+                    released[old_digest] = released.get(old_digest, 0) + 1
+                else:
+                    # старый объект не blob и больше не используется
+                    superseded_keys.append(old_key)
+            if record.blob_digest:
+                count, _, _ = added.get(record.blob_digest, (0, 0, ""))
+                added[record.blob_digest] = (
+                    count + 1,
+                    record.size,
+                    record.etag,
+                )
+
+        await BlobService.add_references(session, added)
+        await cls.apply_counters(session, changes)
+        query = insert(File).returning(File, sort_by_parameter_order=True)
+        query = query.on_conflict_do_update(
+            index_elements=[File.path],
+            set_={
+                "name": query.excluded.name,
+                "size": query.excluded.size,
+                "etag": query.excluded.etag,
+                "blob_digest": query.excluded.blob_digest,
+                "object_key": query.excluded.object_key,
+                "created_ad": query.excluded.created_ad,
+            },
+        )
+        created_ad = datetime.datetime.utcnow()
+        result = await session.scalars(
+            query,
+            [
+                {
+                    "path": record.path,
+                    "folder": FoldersService.get_folder(record.path),
+                    "account_id": record.account_id,
+                    "name": record.name,
+                    "size": record.size,
+                    "etag": record.etag,
+                    "blob_digest": record.blob_digest,
+                    "object_key": record.object_key,
+                    "created_ad": created_ad,
+                }
+                for record in records
+            ],
+            execution_options={"populate_existing": True},
+        )
+        file_objects = result.all()
+        await BlobService.release_references(session, released)
+        if superseded_keys:
+            await job_queue.enqueue(
+                DELETE_OBJECTS_JOB, {"keys": superseded_keys}, session=session
+            )
+        if job_queue.handles(FILE_UPLOADED_JOB):
+            for record in records:
+                await job_queue.enqueue(
+                    FILE_UPLOADED_JOB, asdict(record), session=session
+                )
         await session.commit()
-        return file_object
+
+        for path in paths:
+            await cls.invalidate_download_link(path)
+        return file_objects
 
     @classmethod
     async def get_file_by_path(
@@ -99,22 +551,425 @@ class FilesService:
         return result.scalar_one_or_none()
 
     @classmethod
-    async def update_file_info(
-        cls, session: AsyncSession, path: str, s3_data: dict
-    ) -> File:
-        """Обновить информацию о файле."""
-        query = (
-            update(File)
-            .where(File.path == path)
-            .values(
-                size=s3_data["ContentLength"],
-                created_ad=datetime.datetime.utcnow(),
+    async def get_files_by_paths_or_ids(
+        cls, session: AsyncSession, paths: List[str], ids: List[uuid.UUID]
+    ) -> List[File]:
+        """Получить из БД файлы по спискам путей и идентификаторов.
+
+        Списки передаются массивами (= ANY(...)), поэтому текст запроса
+        не зависит от их длины и подготовленное выражение переиспользуется.
+        """
+        query = select(File).where(
+            or_(
+                File.path == any_(bindparam("paths", paths, ARRAY(String))),
+                File.id
+                == any_(bindparam("ids", ids, ARRAY(PG_UUID(as_uuid=True)))),
             )
         )
-        await session.execute(query)
+        result = await session.execute(query)
+        return result.scalars().all()
+
+    @classmethod
+    async def get_download_links(
+        cls, session: AsyncSession, items: List[str], user
+    ) -> List[dict]:
+        """Получить ссылки для скачивания списка файлов.
+
+        Файлы ищутся одним запросом, права проверяются по владельцу,
+        ссылки подписываются параллельно с ограничением
+        settings.download_batch_concurrency. Результат возвращается
+        по каждому элементу запроса в исходном порядке.
+        """
+        paths = [item for item in items if cls.is_file_path(item)]
+        ids = [uuid.UUID(item) for item in items if cls.is_uuid(item)]
+        files = await cls.get_files_by_paths_or_ids(session, paths, ids)
+        files_by_item = {}
+        for file_object in files:
+            files_by_item[file_object.path] = file_object
+            files_by_item[str(file_object.id)] = file_object
+
+        semaphore = asyncio.Semaphore(settings.download_batch_concurrency)
+
+        async def resolve(item: str) -> dict:
+            file_object = None
+            if cls.is_file_path(item):
+                file_object = files_by_item.get(item)
+            elif cls.is_uuid(item):
+                file_object = files_by_item.get(str(uuid.UUID(item)))
+            if file_object is None:
+                return {"item": item, "error": WRONG_PATH_ERROR}
+            if file_object.account_id != user.email:
+                return {"item": item, "error": FORBIDDEN_ERROR}
+
+            async with semaphore:
+                try:
+                    download_link = await cls.get_download_link(
+                        path=file_object.path,
+                        etag=file_object.etag,
+                        object_key=cls.object_key(
+                            file_object.path,
+                            file_object.blob_digest,
+                            file_object.object_key,
+                        ),
+                    )
+                except Exception as err:
+                    logger.error(
+                        f"Не удалось получить ссылку на {item}: {str(err)}"
+                    )
+                    return {"item": item, "error": "Внутренняя ошибка сервера"}
+            return {"item": item, "download_link": download_link}
+
+        return await asyncio.gather(*(resolve(item) for item in items))
+
+    @classmethod
+    async def delete_where(cls, session: AsyncSession, *criteria) -> list:
+        """Удалить файлы по условию и освободить их содержимое.
+
+        Строки удаляются одним запросом DELETE ... RETURNING, ссылки на
+        blob и занятое место освобождаются в той же транзакции (сами
+        blob удалит сборщик). Объекты, лежащие не в blob, удаляются
+        после commit (см. delete_unreferenced_objects), а не удаленные -
+        фоновой задачей.
+        """
+        result = await session.execute(
+            delete(File)
+            .where(*criteria)
+            .returning(
+                File.id,
+                File.account_id,
+                File.path,
+                File.size,
+                File.blob_digest,
+                File.object_key,
+            )
+        )
+        rows = result.all()
+        await BlobService.release_references(
+            session,
+            collections.Counter(
+                row.blob_digest for row in rows if row.blob_digest
+            ),
+        )
+        await cls.apply_counters(
+            session,
+            [(row.account_id, row.path, -(row.size or 0), -1) for row in rows],
+        )
+        await session.commit()
+
+        for row in rows:
+            await cls.invalidate_download_link(row.path)
+        keys = [
+            cls.object_key(row.path, None, row.object_key)
+            for row in rows
+            if not row.blob_digest
+        ]
+        if keys:
+            try:
+                keys = await cls.delete_unreferenced_objects(session, keys)
+            except Exception as err:
+                await session.rollback()
+                logger.error(f"Не удалось удалить объекты: {err}")
+            if keys:
+                await job_queue.enqueue(DELETE_OBJECTS_JOB, {"keys": keys})
+        return rows
+
+    @classmethod
+    async def delete_unreferenced_objects(
+        cls, session: AsyncSession, keys: List[str]
+    ) -> List[str]:
+        """Удалить из хранилища объекты, на которые не ссылаются файлы.
+
+        Пока ключ ждал удаления, по тому же пути мог быть сохранен новый
+        файл. Поэтому в транзакции ключи блокируются так же, как пути в
+        record_files, ключи, на которые еще ссылаются файлы, пропускаются,
+        а остальные удаляются до commit, пока блокировки держатся.
+        Возвращает ключи, которые не удалось удалить.
+        """
+        await session.execute(LOCK_PATHS_QUERY, {"paths": keys})
+        keys_param = bindparam("keys", keys, ARRAY(String))
+        referenced = await session.scalars(
+            select(File.object_key)
+            .where(File.object_key == any_(keys_param))
+            .union(
+                select(File.path).where(
+                    File.path == any_(keys_param),
+                    File.object_key.is_(None),
+                    File.blob_digest.is_(None),
+                )
+            )
+        )
+        referenced_keys = set(referenced)
+        keys = [key for key in keys if key not in referenced_keys]
+        failed = []
+        if keys:
+            failed = await cls.s3_client.delete_objects(
+                cls.s3_bucket_name, keys
+            )
         await session.commit()
+        return failed
+
+    @classmethod
+    async def delete_files(
+        cls, session: AsyncSession, items: List[str], user
+    ) -> List[dict]:
+        """Удалить список файлов пользователя.
+
+        Файлы ищутся и удаляются по одному запросу на весь список.
+        Результат возвращается по каждому элементу запроса в исходном
+        порядке.
+        """
+        paths = [item for item in items if cls.is_file_path(item)]
+        ids = [uuid.UUID(item) for item in items if cls.is_uuid(item)]
+        files = await cls.get_files_by_paths_or_ids(session, paths, ids)
+        files_by_item = {}
+        for file_object in files:
+            files_by_item[file_object.path] = file_object
+            files_by_item[str(file_object.id)] = file_object
+
+        results = []
+        for item in items:
+            file_object = None
+            if cls.is_file_path(item):
+                file_object = files_by_item.get(item)
+            elif cls.is_uuid(item):
+                file_object = files_by_item.get(str(uuid.UUID(item)))
+            if file_object is None:
+                results.append({"item": item, "error": WRONG_PATH_ERROR})
+            elif file_object.account_id != user.email:
+                results.append({"item": item, "error": DELETE_FORBIDDEN_ERROR})
+            else:
+                results.append({"item": item, "id": file_object.id})
+
+        ids = list({result["id"] for result in results if "id" in result})
+        rows = await cls.delete_where(
+            session,
+            File.id
+            == any_(bindparam("ids", ids, ARRAY(PG_UUID(as_uuid=True)))),
+            File.account_id == user.email,
+        )
+        deleted_ids = {row.id for row in rows}
+        for result in results:
+            file_id = result.pop("id", None)
+            if file_id is not None and file_id not in deleted_ids:
+                # файл удалили параллельным запросом
+                result["error"] = WRONG_PATH_ERROR
+        return results
+
+    @classmethod
+    async def delete_folder_batch(
+        cls, session: AsyncSession, owner: str, folder: str
+    ) -> int:
+        """Удалить не больше settings.delete_batch_size файлов папки."""
+        batch = (
+            select(File.id)
+            .where(
+                File.account_id == owner,
+                File.path.like(
+                    cls.like_prefix(cls.prepare_folder_by_user(folder, owner)),
+                    escape="\\",
+                ),
+            )
+            .limit(settings.delete_batch_size)
+        )
+        rows = await cls.delete_where(
+            session, File.id.in_(batch.scalar_subquery())
+        )
+        return len(rows)
+
+    @classmethod
+    async def delete_folder(
+        cls, session: AsyncSession, owner: str, folder: str
+    ) -> Tuple[int, bool]:
+        """Удалить папку владельца со всеми вложенными файлами.
+
+        В запросе удаляется первая пачка файлов. Если файлов больше,
+        остальные удаляет фоновая задача, а второй элемент результата
+        (удаление завершено) равен False.
+        """
+        deleted = await cls.delete_folder_batch(session, owner, folder)
+        if deleted < settings.delete_batch_size:
+            return deleted, True
+        await job_queue.enqueue(
+            DELETE_FOLDER_JOB, {"owner": owner, "folder": folder}
+        )
+        return deleted, False
 
-        return await cls.get_file_by_path(session=session, path=path)
+    @classmethod
+    async def folder_exists(
+        cls, session: AsyncSession, owner: str, folder: str
+    ) -> bool:
+        """Проверить, есть ли у владельца файлы в папке."""
+        files, _ = await cls.get_files(
+            session, user_email=owner, owner=owner, prefix=folder, limit=1
+        )
+        return bool(files)
+
+    @classmethod
+    async def iter_folder_files(
+        cls, owner: str, folder: str
+    ) -> AsyncIterator[dict]:
+        """Перебрать файлы папки владельца постранично.
+
+        Каждая страница читается в своей короткой сессии, чтобы не
+        держать соединение с БД, пока архив передается клиенту.
+        """
+        cursor = None
+        while True:
+            async with async_session() as session:
+                files, cursor = await cls.get_files(
+                    session,
+                    user_email=owner,
+                    owner=owner,
+                    prefix=folder,
+                    limit=settings.files_page_size_max,
+                    cursor=cursor,
+                )
+            for file in files:
+                yield file
+            if cursor is None:
+                break
+
+    @classmethod
+    async def iter_object_body(cls, body) -> AsyncIterator[bytes]:
+        """Читать тело объекта хранилища кусками и закрыть его."""
+        try:
+            while True:
+                chunk = await body.read(settings.download_chunk_size)
+                if not chunk:
+                    break
+                DOWNLOADED_BYTES.inc(len(chunk))
+                yield chunk
+        finally:
+            body.close()
+
+    @staticmethod
+    def last_modified(file_object: File) -> datetime.datetime:
+        """Получить время изменения файла с точностью HTTP даты."""
+        return file_object.created_ad.replace(
+            microsecond=0, tzinfo=datetime.timezone.utc
+        )
+
+    @classmethod
+    def is_not_modified(
+        cls,
+        file_object: File,
+        if_none_match: Optional[str],
+        if_modified_since: Optional[str],
+    ) -> bool:
+        """Проверить, что у клиента уже есть актуальная версия файла.
+
+        If-None-Match сравнивается с etag файла и, если передан, имеет
+        приоритет над If-Modified-Since.
+        """
+        if if_none_match is not None:
+            tags = [
+                tag.strip().removeprefix("W/")
+                for tag in if_none_match.split(",")
+            ]
+            return "*" in tags or (
+                file_object.etag is not None and file_object.etag in tags
+            )
+        if if_modified_since is None or file_object.created_ad is None:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return cls.last_modified(file_object) <= since
+
+    @staticmethod
+    def get_byte_range(
+        range_header: Optional[str],
+        if_range: Optional[str],
+        etag: Optional[str],
+    ) -> Optional[str]:
+        """Получить диапазон байт для запроса к хранилищу.
+
+        Поддерживается один диапазон. Несколько диапазонов и If-Range,
+        не совпадающий с etag файла, игнорируются: отдается весь файл.
+        """
+        if not range_header:
+            return None
+        if if_range is not None and (etag is None or if_range != etag):
+            return None
+        unit, _, ranges = range_header.partition("=")
+        if unit.strip() != "bytes" or not ranges or "," in ranges:
+            return None
+        return f"bytes={ranges.strip()}"
+
+    @classmethod
+    async def open_object(
+        cls, file_object: File, byte_range: Optional[str] = None
+    ) -> dict:
+        """Запросить содержимое файла из хранилища, целиком или диапазон.
+
+        Тело ответа - поток, его нужно прочитать iter_object_body.
+        """
+        params = {"Range": byte_range} if byte_range else {}
+        return await cls.s3_client.get_object(
+            cls.s3_bucket_name,
+            cls.object_key(
+                file_object.path,
+                file_object.blob_digest,
+                file_object.object_key,
+            ),
+            **params,
+        )
+
+    @classmethod
+    async def iter_folder_entries(
+        cls, owner: str, folder: str
+    ) -> AsyncIterator[ArchiveEntry]:
+        """Перебрать файлы папки вместе с потоками их содержимого.
+
+        Запросы GET к хранилищу для следующих файлов отправляются
+        заранее, но не больше settings.folder_download_concurrency
+        одновременно; тела объектов читаются строго по очереди.
+        """
+        root = cls.prepare_folder_by_user(folder or "", owner)
+        pending = collections.deque()
+
+        async def next_entry() -> ArchiveEntry:
+            file, request = pending.popleft()
+            response = await request
+            name = file["path"].removeprefix(root)
+            body = cls.iter_object_body(response["Body"])
+            return name, file["created_ad"], body
+
+        try:
+            async for file in cls.iter_folder_files(owner, folder):
+                request = asyncio.ensure_future(
+                    cls.s3_client.get_object(
+                        cls.s3_bucket_name,
+                        cls.object_key(
+                            file["path"],
+                            file["blob_digest"],
+                            file["object_key"],
+                        ),
+                    )
+                )
+                pending.append((file, request))
+                if len(pending) >= settings.folder_download_concurrency:
+                    yield await next_entry()
+            while pending:
+                yield await next_entry()
+        finally:
+            # клиент мог прервать скачивание: отменяем начатые запросы
+            # и закрываем уже открытые потоки объектов
+            for _, request in pending:
+                if not request.done():
+                    request.cancel()
+                elif not request.cancelled() and request.exception() is None:
+                    request.result()["Body"].close()
+
+    @classmethod
+    def stream_folder_archive(
+        cls, owner: str, folder: str
+    ) -> AsyncIterator[bytes]:
+        """Получить поток zip архива с файлами папки владельца."""
+        return stream_zip(cls.iter_folder_entries(owner, folder))
 
     @classmethod
     def check_download_permissions(cls, file_object, user):
@@ -130,56 +985,396 @@ class FilesService:
 
     @classmethod
     async def upload_file(
-        cls, path: str, data, email: str, session: AsyncSession, filename
+        cls, path: str, file, email: str, session: AsyncSession, filename
     ):
         """Загрузить файл в хранилище.
 
-        Если файла не существует, то записываем файл в хранилище
-        и записываем данные о нем в БД.
-        Если файл существует, то файл в хранилище перезаписывается
-        и данные о нем обновляются в БД.
+        Сначала считается SHA-256 содержимого. Если такое содержимое уже
+        есть в хранилище, файл не загружается повторно, а ссылается на
+        существующий blob. Иначе содержимое передается в хранилище
+        частями размером settings.s3_multipart_part_size под ключом хеша.
+        Затем данные о файле добавляются или обновляются в БД. Квота
+        проверяется до передачи содержимого в хранилище.
         """
         try:
             path = cls.prepare_path_by_user(path, email)
-            is_object_exists, response_data = (
-                await cls.s3_client.object_exists(cls.s3_bucket_name, path)
-            )
-            if not is_object_exists:
-                await cls.s3_client.put_object(cls.s3_bucket_name, path, data)
-                is_object_exists, response_data = (
-                    await cls.s3_client.object_exists(cls.s3_bucket_name, path)
-                )
-                file_object = await cls.insert_file_info(
-                    session=session,
-                    path=path,
-                    account_id=email,
-                    name=filename,
-                    s3_data=response_data,
+            digest, size = await BlobService.hash_file(file)
+            await UsageService.check_quota(session, email, size, [path])
+            blob = await BlobService.get_live_blob(session, digest)
+            if blob is None:
+                await BlobService.claim(session, {digest: size})
+            # не держим соединение с БД, пока идет загрузка в хранилище
+            await session.commit()
+            if blob is None:
+                response_data = await BlobService.store(
+                    digest,
+                    cls.read_parts(file, settings.s3_multipart_part_size),
                 )
+                etag = response_data["ETag"]
             else:
-                await cls.s3_client.put_object(cls.s3_bucket_name, path, data)
-                is_object_exists, response_data = (
-                    await cls.s3_client.object_exists(cls.s3_bucket_name, path)
-                )
-                file_object = await cls.update_file_info(
-                    session=session, path=path, s3_data=response_data
-                )
+                logger.info(f"Содержимое {path} уже есть в хранилище")
+                etag = blob.etag
+
+            (file_object,) = await cls.record_files(
+                session,
+                [
+                    FileRecord(
+                        path=path,
+                        account_id=email,
+                        name=filename,
+                        size=size,
+                        etag=etag,
+                        blob_digest=digest,
+                    )
+                ],
+            )
             return file_object
 
+        except QuotaExceededError:
+            raise
         except Exception as err:
             logger.error("Не удалось загрузить файл в хранилище")
             raise S3UploadFileExceptiom(err)
 
+    @staticmethod
+    def get_upload_path(folder: str, filename: Optional[str]) -> Optional[str]:
+        """Получить путь файла внутри папки по имени из запроса.
+
+        Имя может содержать вложенные папки, выход за пределы папки
+        не допускается.
+        """
+        if not filename:
+            return None
+        root = posixpath.normpath(posixpath.join("/", folder)).rstrip("/")
+        path = posixpath.normpath(f"{root}/{filename}")
+        if not path.startswith(f"{root}/") or filename.endswith("/"):
+            return None
+        return path.lstrip("/")
+
+    @classmethod
+    def get_upload_paths(
+        cls, folder: str, files: list, email: str
+    ) -> Tuple[List[dict], Dict[str, int]]:
+        """Получить пути файлов из запроса на загрузку списка файлов.
+
+        Возвращает результаты по файлам (с ошибкой для неверных путей)
+        и номера файлов по путям. Если путь повторяется, загружается
+        последний файл с этим путем.
+        """
+        results = [{"filename": file.filename} for file in files]
+        indexes: Dict[str, int] = {}
+        for index, file in enumerate(files):
+            path = cls.get_upload_path(folder, file.filename)
+            if path is not None:
+                path = cls.prepare_path_by_user(path, email)
+            if path is None or len(path) > File.path.type.length:
+                results[index]["error"] = WRONG_PATH_ERROR
+                continue
+            results[index]["path"] = path
+            if path in indexes:
+                results[indexes[path]]["error"] = DUPLICATE_PATH_ERROR
+            indexes[path] = index
+        return results, indexes
+
     @classmethod
-    async def get_download_link(cls, path: str) -> str:
-        """Получить ссылку для скачивания поменяв в ней хост наружу."""
+    async def store_blobs(
+        cls, files: dict, semaphore: asyncio.Semaphore
+    ) -> Dict[str, Optional[str]]:
+        """Загрузить содержимое файлов как blob параллельно.
+
+        files - словарь digest -> файл. Возвращает etag по хешу или
+        None, если содержимое загрузить не удалось.
+        """
+
+        async def store(digest: str, file) -> Optional[str]:
+            async with semaphore:
+                try:
+                    response_data = await BlobService.store(
+                        digest,
+                        cls.read_parts(file, settings.s3_multipart_part_size),
+                    )
+                except Exception as err:
+                    logger.error(f"Не удалось загрузить blob {digest}: {err}")
+                    return None
+            return response_data["ETag"]
+
+        etags = await asyncio.gather(*itertools.starmap(store, files.items()))
+        return dict(zip(files, etags))
+
+    @classmethod
+    async def upload_files(
+        cls, session: AsyncSession, email: str, folder: str, files: list
+    ) -> List[dict]:
+        """Загрузить список файлов в папку пользователя.
+
+        Хеши считаются и содержимое загружается параллельно, не больше
+        settings.upload_batch_concurrency файлов одновременно. Готовые
+        blob ищутся одним запросом, одинаковое содержимое загружается
+        один раз, а информация о файлах сохраняется одним вызовом
+        record_files. Результат возвращается по каждому файлу в
+        порядке запроса, ошибка одного файла не отменяет остальные.
+        """
+        results, indexes = cls.get_upload_paths(folder, files, email)
+        semaphore = asyncio.Semaphore(settings.upload_batch_concurrency)
 
+        async def hash_file(index: int) -> Tuple[str, int]:
+            async with semaphore:
+                return await BlobService.hash_file(files[index])
+
+        hashes = dict(
+            zip(
+                indexes.values(),
+                await asyncio.gather(*map(hash_file, indexes.values())),
+            )
+        )
+        await UsageService.check_quota(
+            session,
+            email,
+            sum(size for _, size in hashes.values()),
+            list(indexes),
+        )
+        blobs = await BlobService.get_live_blobs(
+            session, list({digest for digest, _ in hashes.values()})
+        )
+        missing, sizes = {}, {}
+        for index, (digest, size) in hashes.items():
+            if digest not in blobs:
+                missing.setdefault(digest, files[index])
+                sizes[digest] = size
+        await BlobService.claim(session, sizes)
+        # не держим соединение с БД, пока идет загрузка в хранилище
+        await session.commit()
+
+        etags = {digest: blob.etag for digest, blob in blobs.items()}
+        etags.update(await cls.store_blobs(missing, semaphore))
+
+        records = []
+        for index, (digest, size) in hashes.items():
+            if etags[digest] is None:
+                results[index]["error"] = UPLOAD_ERROR
+                continue
+            records.append(
+                FileRecord(
+                    path=results[index]["path"],
+                    account_id=email,
+                    name=os.path.basename(results[index]["path"]),
+                    size=size,
+                    etag=etags[digest],
+                    blob_digest=digest,
+                )
+            )
+        if records:
+            file_objects = await cls.record_files(session, records)
+            for file_object in file_objects:
+                results[indexes[file_object.path]]["file"] = file_object
+        return results
+
+    @classmethod
+    async def get_download_link(
+        cls,
+        path: str,
+        etag: Optional[str] = None,
+        object_key: Optional[str] = None,
+    ) -> str:
+        """Получить ссылку для скачивания поменяв в ней хост наружу.
+
+        Подписанная ссылка переиспользуется, пока не истекла заданная
+        доля ее времени жизни и не изменилась версия объекта (etag).
+        Подпись считается локально общим клиентом, без запросов к S3.
+        Если объект хранится не по пути файла (blob), в ссылку
+        подставляется имя файла для скачивания.
+        """
+        cache_key = (cls.s3_bucket_name, path)
+        cached_link = await cls.download_links_cache.get(cache_key)
+        if cached_link is not None and cached_link[0] == etag:
+            return cached_link[1]
+
+        object_key = object_key or path
         download_link = await cls.s3_client.get_download_url(
-            cls.s3_bucket_name, path
+            cls.s3_bucket_name,
+            object_key,
+            filename=(os.path.basename(path) if object_key != path else None),
         )
 
-        parsed_link = urllib.parse.urlparse(download_link)
+        download_link = cls.to_external_link(download_link)
+        await cls.download_links_cache.set(cache_key, (etag, download_link))
+        return download_link
+
+    @staticmethod
+    def to_external_link(link: str) -> str:
+        """Заменить в подписанной ссылке хост хранилища на внешний."""
+        parsed_link = urllib.parse.urlparse(link)
         new_parsed_url = parsed_link._replace(
             netloc=f"{settings.host}:{settings.s3_port}"
         )
         return urllib.parse.urlunparse(new_parsed_url)
+
+    @classmethod
+    async def get_upload_link(
+        cls,
+        session: AsyncSession,
+        path: str,
+        email: str,
+        size: Optional[int] = None,
+    ) -> dict:
+        """Получить ссылку для загрузки файла напрямую в хранилище.
+
+        Содержимое не проходит через сервис: клиент загружает его
+        запросом PUT по ссылке, а затем подтверждает загрузку через
+        complete_direct_upload. Объект загружается под уникальным ключом
+        загрузки, а не по пути файла, поэтому сохраненный файл с тем же
+        путем не меняется до подтверждения. Если размер известен
+        заранее, квота проверяется до загрузки, а размер подписывается в
+        ссылке (Content-Length), и хранилище не примет другой объем.
+        """
+        path = cls.prepare_path_by_user(path.strip("/"), email)
+        if size is not None:
+            await UsageService.check_quota(session, email, size, [path])
+        upload_id = uuid.uuid4()
+        upload = DirectUpload(
+            id=upload_id,
+            account_id=email,
+            path=path,
+            object_key=cls.staging_key(upload_id),
+            size=size,
+        )
+        session.add(upload)
+        await session.commit()
+        upload_link = await cls.s3_client.get_upload_url(
+            cls.s3_bucket_name,
+            upload.object_key,
+            settings.upload_url_lifetime,
+            content_length=size,
+        )
+        return {
+            "id": upload.id,
+            "path": path,
+            "upload_link": cls.to_external_link(upload_link),
+            "expires_in": settings.upload_url_lifetime,
+        }
+
+    @classmethod
+    async def complete_direct_upload(
+        cls, session: AsyncSession, upload_id: uuid.UUID, email: str
+    ) -> Optional[File]:
+        """Сохранить в БД файл, загруженный по подписанной ссылке.
+
+        Размер и ETag берутся из метаданных объекта (HEAD), соединение
+        с БД на это время не держится. Содержимое не читается сервисом,
+        поэтому файл хранится под ключом загрузки, а не как blob. Если
+        загрузки или объекта нет, возвращается None. Загрузка удаляется
+        в той же транзакции, в которой сохраняется файл, поэтому
+        повторное подтверждение ничего не меняет. Загрузка, не
+        поместившаяся в квоту, удаляется вместе со своим объектом.
+        """
+        upload = await session.get(DirectUpload, upload_id)
+        await session.commit()
+        if upload is None or upload.account_id != email:
+            return None
+        exists, meta = await cls.s3_client.object_exists(
+            cls.s3_bucket_name, upload.object_key
+        )
+        if not exists:
+            return None
+        try:
+            await UsageService.check_quota(
+                session, email, meta["ContentLength"], [upload.path]
+            )
+        except QuotaExceededError:
+            # удаляется только объект этой загрузки, файл по тому же пути
+            # хранится под другим ключом и не меняется
+            result = await session.execute(
+                delete(DirectUpload)
+                .where(DirectUpload.id == upload.id)
+                .returning(DirectUpload.object_key)
+            )
+            keys = result.scalars().all()
+            if keys:
+                await job_queue.enqueue(
+                    DELETE_OBJECTS_JOB, {"keys": keys}, session=session
+                )
+            await session.commit()
+            raise
+
+        result = await session.execute(
+            delete(DirectUpload)
+            .where(DirectUpload.id == upload.id)
+            .returning(DirectUpload.id)
+        )
+        if result.scalar_one_or_none() is None:
+            # загрузку уже подтвердил параллельный запрос или удалил сборщик
+            await session.rollback()
+            return None
+        (file_object,) = await cls.record_files(
+            session,
+            [
+                FileRecord(
+                    path=upload.path,
+                    account_id=email,
+                    name=os.path.basename(upload.path),
+                    size=meta["ContentLength"],
+                    etag=meta["ETag"],
+                    object_key=upload.object_key,
+                )
+            ],
+        )
+        return file_object
+
+    @classmethod
+    async def reap_direct_uploads(cls, limit: int = 1000) -> int:
+        """Удалить загрузки напрямую, не подтвержденные за upload_session_ttl.
+
+        Строки удаляются запросом с SKIP LOCKED, объекты удаляет фоновая
+        задача, поставленная в той же транзакции.
+        """
+        stale_before = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=settings.upload_session_ttl
+        )
+        stale = (
+            select(DirectUpload.id)
+            .where(DirectUpload.created_at < stale_before)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with async_session() as session:
+            result = await session.execute(
+                delete(DirectUpload)
+                .where(DirectUpload.id.in_(stale.scalar_subquery()))
+                .returning(DirectUpload.object_key)
+            )
+            keys = result.scalars().all()
+            if keys:
+                await job_queue.enqueue(
+                    DELETE_OBJECTS_JOB, {"keys": keys}, session=session
+                )
+            await session.commit()
+
+        if keys:
+            logger.info(f"Удалено неподтвержденных загрузок: {len(keys)}")
+        return len(keys)
+
+    @classmethod
+    async def invalidate_download_link(cls, path: str) -> None:
+        """Сбросить закэшированную ссылку после изменения объекта."""
+        await cls.download_links_cache.delete((cls.s3_bucket_name, path))
+
+
+@job_queue.register(DELETE_OBJECTS_JOB)
+async def delete_objects(keys: List[str]) -> None:
+    """Удалить из хранилища объекты, на которые больше нет ссылок."""
+    async with async_session() as session:
+        failed = await FilesService.delete_unreferenced_objects(session, keys)
+    if failed:
+        raise RuntimeError(f"Не удалено объектов: {len(failed)}")
+
+
+@job_queue.register(DELETE_FOLDER_JOB)
+async def delete_folder(owner: str, folder: str) -> None:
+    """Удалить оставшиеся файлы папки пачками."""
+    while True:
+        async with async_session() as session:
+            deleted = await FilesService.delete_folder_batch(
+                session, owner, folder
+            )
+        if deleted < settings.delete_batch_size:
+            break
@@ -0,0 +1,188 @@
+import posixpath
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import String, any_, bindparam, delete, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import get_settings
+from src.core.metrics import SERVICE_LATENCY, instrument
+from src.models.file import File
+from src.models.folder import Folder
+from src.services.pagination import (
+    InvalidCursorError,
+    decode_cursor,
+    encode_cursor,
+)
+
+settings = get_settings()
+
+FOLDER_ENTRY = "folder"
+FILE_ENTRY = "file"
+
+
+@instrument(SERVICE_LATENCY, service="folders")
+class FoldersService:
+    """Дерево папок пользователей для просмотра папки по уровням.
+
+    У каждого файла хранится папка, в которой он лежит (files.folder),
+    а у каждой папки - счетчики всех вложенных файлов. Содержимое
+    папки читается по индексам (folders.parent и files.folder, path),
+    поэтому его стоимость не зависит от числа файлов глубже.
+    """
+
+    @staticmethod
+    def get_folder(path: str) -> str:
+        """Получить папку, в которой непосредственно лежит файл."""
+        return posixpath.dirname(path)
+
+    @staticmethod
+    def get_parent(folder: str) -> Optional[str]:
+        """Получить родительскую папку, у корня пользователя ее нет."""
+        return posixpath.dirname(folder) or None
+
+    @classmethod
+    def get_ancestors(cls, folder: str) -> List[str]:
+        """Получить папку и все папки, в которые она вложена."""
+        ancestors = []
+        while folder:
+            ancestors.append(folder)
+            folder = cls.get_parent(folder)
+        return ancestors
+
+    @classmethod
+    async def apply(
+        cls,
+        session: AsyncSession,
+        deltas: Dict[Tuple[str, str], Tuple[int, int]],
+    ) -> None:
+        """Изменить счетчики папок без commit.
+
+        deltas - словарь (account_id, папка файла) -> (изменение байт,
+        изменение числа файлов). Изменение применяется к папке и всем
+        папкам выше нее одним запросом, папки без файлов удаляются.
+        """
+        folders: Dict[str, Tuple[str, int, int]] = {}
+        for (account_id, folder), (size, files_count) in deltas.items():
+            if (size, files_count) == (0, 0):
+                continue
+            for ancestor in cls.get_ancestors(folder):
+                _, folder_size, folder_count = folders.get(
+                    ancestor, (account_id, 0, 0)
+                )
+                folders[ancestor] = (
+                    account_id,
+                    folder_size + size,
+                    folder_count + files_count,
+                )
+        if not folders:
+            return
+
+        query = insert(Folder).values(
+            [
+                {
+                    "path": path,
+                    "account_id": folders[path][0],
+                    "parent": cls.get_parent(path),
+                    "size": folders[path][1],
+                    "files_count": folders[path][2],
+                }
+                # одинаковый порядок строк не дает транзакциям
+                # заблокировать друг друга
+                for path in sorted(folders)
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[Folder.path],
+            set_={
+                "size": Folder.size + query.excluded.size,
+                "files_count": Folder.files_count + query.excluded.files_count,
+            },
+        )
+        await session.execute(query)
+        if any(files_count < 0 for _, _, files_count in folders.values()):
+            paths = list(folders)
+            await session.execute(
+                delete(Folder).where(
+                    Folder.path
+                    == any_(bindparam("paths", paths, ARRAY(String))),
+                    Folder.files_count <= 0,
+                )
+            )
+
+    @classmethod
+    async def list_folder(
+        cls,
+        session: AsyncSession,
+        owner: str,
+        folder: str = "",
+        limit: int = settings.files_page_size,
+        cursor: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Получить содержимое папки владельца постранично.
+
+        Сначала по имени идут вложенные папки с числом и размером всех
+        файлов в них, затем файлы, лежащие непосредственно в папке.
+        Курсор - вид и путь последней записи страницы. Если папки нет,
+        возвращается None, корневая папка пользователя без файлов
+        возвращается пустой.
+        """
+        folder = folder.strip("/")
+        path = f"{owner}/{folder}" if folder else owner
+        current = await session.get(Folder, path)
+        if current is None and not folder:
+            current = Folder(
+                path=path, account_id=owner, files_count=0, size=0
+            )
+        if current is None or current.account_id != owner:
+            return None
+
+        kind, last_path = FOLDER_ENTRY, ""
+        if cursor:
+            kind, last_path = decode_cursor(cursor, size=2)
+            if kind not in (FOLDER_ENTRY, FILE_ENTRY):
+                raise InvalidCursorError(f"Некорректный курсор: {cursor}")
+
+        items = []
+        if kind == FOLDER_ENTRY:
+            query = (
+                select(Folder.path, Folder.files_count, Folder.size)
+                .where(Folder.parent == path, Folder.path > last_path)
+                .order_by(Folder.path)
+                .limit(limit + 1)
+            )
+            result = await session.execute(query)
+            items = [
+                {
+                    "type": FOLDER_ENTRY,
+                    "name": posixpath.basename(row.path),
+                    "path": row.path,
+                    "size": row.size,
+                    "files_count": row.files_count,
+                }
+                for row in result
+            ]
+            last_path = ""
+        if len(items) <= limit:
+            query = (
+                select(
+                    File.id, File.path, File.name, File.size, File.created_ad
+                )
+                .where(File.folder == path, File.path > last_path)
+                .order_by(File.path)
+                .limit(limit + 1 - len(items))
+            )
+            result = await session.execute(query)
+            items += [{"type": FILE_ENTRY, **row._mapping} for row in result]
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1]["type"], items[-1]["path"])
+        return {
+            "path": path,
+            "files_count": current.files_count,
+            "size": current.size,
+            "items": items,
+            "next_cursor": next_cursor,
+        }
@@ -0,0 +1,26 @@
+import base64
+from typing import Any, List
+
+import orjson
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(*values: Any) -> str:
+    """Закодировать значения ключа последней записи страницы в курсор."""
+    payload = orjson.dumps(values, default=str)
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Раскодировать курсор в список значений ключа."""
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as err:
+        raise InvalidCursorError(f"Некорректный курсор: {cursor}") from err
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError(f"Некорректный курсор: {cursor}")
+    return values
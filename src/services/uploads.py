@@ -0,0 +1,403 @@
+import datetime
+import os
+import uuid
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.clients.s3 import s3_client
+from src.core.config import get_settings
+from src.core.jobs import job_queue
+from src.core.log import get_logger
+from src.core.metrics import SERVICE_LATENCY, instrument
+from src.db.db import async_session
+from src.models.file import File
+from src.models.upload import UploadSession
+from src.services.files import DELETE_OBJECTS_JOB, FileRecord, FilesService
+from src.services.usage import UsageService
+
+settings = get_settings()
+logger = get_logger()
+
+# ограничение протокола S3 на число частей одной загрузки
+MAX_PARTS_COUNT = 10000
+UPLOADING = "uploading"
+# части собираются в объект, повторная сборка сначала проверяет объект
+COMPLETING = "completing"
+
+
+class UploadSessionError(ValueError):
+    pass
+
+
+@instrument(SERVICE_LATENCY, service="uploads")
+class UploadsService:
+    """Загрузка файлов по частям с возможностью продолжить после обрыва.
+
+    Каждой загрузке соответствует S3 multipart upload под уникальным
+    ключом загрузки, поэтому сохраненный файл с тем же путем не
+    меняется до сборки. Клиент загружает части по смещению в файле в
+    любом порядке и параллельно, список уже загруженных частей берется
+    из хранилища, а не из БД.
+    """
+
+    s3_client = s3_client
+    s3_bucket_name = settings.s3_bucket_name
+    part_size = settings.s3_multipart_part_size
+
+    @staticmethod
+    def object_key(upload: UploadSession) -> str:
+        """Получить ключ объекта загрузки, старые загрузки идут по пути."""
+        return upload.object_key or upload.path
+
+    @staticmethod
+    def parts_count(size: int, part_size: int) -> int:
+        """Получить число частей файла."""
+        return -(-size // part_size)
+
+    @classmethod
+    def part_bounds(
+        cls, upload: UploadSession, offset: int
+    ) -> Tuple[int, int]:
+        """Получить номер и ожидаемый размер части по ее смещению."""
+        if offset % upload.part_size or not 0 <= offset < upload.size:
+            raise UploadSessionError(
+                f"Смещение должно быть кратно {upload.part_size} "
+                f"и меньше размера файла {upload.size}"
+            )
+        part_number = offset // upload.part_size + 1
+        return part_number, min(upload.part_size, upload.size - offset)
+
+    @staticmethod
+    async def read_part(stream: AsyncIterator[bytes], size: int) -> bytes:
+        """Прочитать тело запроса с частью, проверив ее размер.
+
+        Чтение прерывается, как только тело оказалось больше части.
+        """
+        data = bytearray()
+        async for chunk in stream:
+            data.extend(chunk)
+            if len(data) > size:
+                break
+        if len(data) != size:
+            raise UploadSessionError(f"Размер части должен быть {size} байт")
+        return bytes(data)
+
+    @classmethod
+    async def create_session(
+        cls, session: AsyncSession, email: str, path: str, size: int
+    ) -> UploadSession:
+        """Начать загрузку файла по частям.
+
+        Квота проверяется по заявленному размеру до загрузки частей.
+        """
+        if not FilesService.is_file_path(path):
+            raise UploadSessionError("Путь должен заканчиваться именем файла")
+        if cls.parts_count(size, cls.part_size) > MAX_PARTS_COUNT:
+            raise UploadSessionError(
+                f"Файл больше {MAX_PARTS_COUNT * cls.part_size} байт"
+            )
+
+        path = FilesService.prepare_path_by_user(path.strip("/"), email)
+        await UsageService.check_quota(session, email, size, [path])
+        id = uuid.uuid4()
+        object_key = FilesService.staging_key(id)
+        upload_id = await cls.s3_client.create_multipart_upload(
+            cls.s3_bucket_name, object_key
+        )
+        upload = UploadSession(
+            id=id,
+            account_id=email,
+            path=path,
+            object_key=object_key,
+            status=UPLOADING,
+            name=os.path.basename(path),
+            upload_id=upload_id,
+            size=size,
+            part_size=cls.part_size,
+        )
+        session.add(upload)
+        await session.commit()
+        return upload
+
+    @classmethod
+    async def get_session(
+        cls, session: AsyncSession, email: str, id: uuid.UUID
+    ) -> Optional[UploadSession]:
+        """Получить загрузку пользователя."""
+        query = select(UploadSession).where(
+            UploadSession.id == id, UploadSession.account_id == email
+        )
+        result = await session.execute(query)
+        return result.scalar_one_or_none()
+
+    @classmethod
+    async def touch_session(
+        cls, session: AsyncSession, email: str, id: uuid.UUID
+    ) -> Optional[UploadSession]:
+        """Получить загрузку пользователя, отметив ее как активную.
+
+        Транзакция сразу завершается, чтобы не держать соединение с БД,
+        пока часть передается в хранилище.
+        """
+        query = (
+            update(UploadSession)
+            .where(UploadSession.id == id, UploadSession.account_id == email)
+            .values(updated_at=datetime.datetime.utcnow())
+            .returning(UploadSession)
+        )
+        result = await session.execute(query)
+        upload = result.scalar_one_or_none()
+        await session.commit()
+        return upload
+
+    @classmethod
+    async def upload_part(
+        cls, upload: UploadSession, offset: int, data: bytes
+    ) -> dict:
+        """Загрузить часть файла по ее смещению."""
+        part_number, _ = cls.part_bounds(upload, offset)
+        etag = await cls.s3_client.upload_part(
+            cls.s3_bucket_name,
+            cls.object_key(upload),
+            upload.upload_id,
+            part_number,
+            data,
+        )
+        return {
+            "part_number": part_number,
+            "offset": offset,
+            "size": len(data),
+            "etag": etag,
+        }
+
+    @classmethod
+    async def get_part_upload_link(
+        cls, upload: UploadSession, offset: int
+    ) -> dict:
+        """Получить ссылку для загрузки части напрямую в хранилище.
+
+        Размер части проверяется при сборке файла.
+        """
+        part_number, size = cls.part_bounds(upload, offset)
+        upload_link = await cls.s3_client.get_upload_part_url(
+            cls.s3_bucket_name,
+            cls.object_key(upload),
+            upload.upload_id,
+            part_number,
+            settings.upload_url_lifetime,
+        )
+        return {
+            "part_number": part_number,
+            "offset": offset,
+            "size": size,
+            "upload_link": FilesService.to_external_link(upload_link),
+            "expires_in": settings.upload_url_lifetime,
+        }
+
+    @classmethod
+    async def get_parts(cls, upload: UploadSession) -> List[dict]:
+        """Получить уже загруженные части файла из хранилища."""
+        parts = await cls.s3_client.list_parts(
+            cls.s3_bucket_name, cls.object_key(upload), upload.upload_id
+        )
+        return [
+            {
+                "part_number": part["PartNumber"],
+                "offset": (part["PartNumber"] - 1) * upload.part_size,
+                "size": part["Size"],
+                "etag": part["ETag"],
+            }
+            for part in sorted(parts, key=lambda part: part["PartNumber"])
+        ]
+
+    @classmethod
+    async def get_status(cls, upload: UploadSession) -> dict:
+        """Получить состояние загрузки."""
+        parts = await cls.get_parts(upload)
+        return {
+            "id": upload.id,
+            "path": upload.path,
+            "size": upload.size,
+            "part_size": upload.part_size,
+            "parts_count": cls.parts_count(upload.size, upload.part_size),
+            "uploaded_size": sum(part["size"] for part in parts),
+            "parts": parts,
+        }
+
+    @classmethod
+    async def check_parts(cls, upload: UploadSession) -> List[dict]:
+        """Получить загруженные части, проверив, что загружены все."""
+        parts = await cls.get_parts(upload)
+        expected = [
+            cls.part_bounds(upload, offset)
+            for offset in range(0, upload.size, upload.part_size)
+        ]
+        uploaded = [(part["part_number"], part["size"]) for part in parts]
+        if uploaded != expected:
+            missing = sorted(set(expected) - set(uploaded))
+            raise UploadSessionError(
+                "Загружены не все части файла: "
+                f"{[part_number for part_number, _ in missing]}"
+            )
+        return parts
+
+    @classmethod
+    async def assemble(
+        cls, session: AsyncSession, upload: UploadSession
+    ) -> str:
+        """Собрать объект из частей в хранилище и получить его ETag.
+
+        Перед сборкой загрузка отмечается как собираемая и транзакция
+        завершается, чтобы не держать соединение с БД, пока хранилище
+        собирает объект. Если прошлая сборка успела собрать объект, но
+        файл не был сохранен, объект берется из хранилища (HEAD).
+        """
+        object_key = cls.object_key(upload)
+        if upload.status == COMPLETING:
+            exists, meta = await cls.s3_client.object_exists(
+                cls.s3_bucket_name, object_key
+            )
+            if exists:
+                return meta["ETag"]
+
+        parts = await cls.check_parts(upload)
+        await session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload.id)
+            .values(status=COMPLETING, updated_at=datetime.datetime.utcnow())
+        )
+        await session.commit()
+        response = await cls.s3_client.complete_multipart_upload(
+            cls.s3_bucket_name,
+            object_key,
+            upload.upload_id,
+            [
+                {"ETag": part["etag"], "PartNumber": part["part_number"]}
+                for part in parts
+            ],
+        )
+        return response["ETag"]
+
+    @classmethod
+    async def complete(
+        cls, session: AsyncSession, email: str, id: uuid.UUID
+    ) -> Optional[File]:
+        """Собрать файл из загруженных частей и сохранить его в БД.
+
+        Сборка повторяема: если сохранить файл не удалось, повторный
+        запрос найдет собранный объект. Загрузка удаляется в той же
+        транзакции, в которой сохраняется информация о файле, поэтому
+        повторный запрос после сборки получит 404.
+        """
+        upload = await cls.get_session(session, email, id)
+        await session.commit()
+        if upload is None:
+            return None
+
+        etag = await cls.assemble(session, upload)
+        result = await session.execute(
+            delete(UploadSession)
+            .where(UploadSession.id == upload.id)
+            .returning(UploadSession.id)
+        )
+        if result.scalar_one_or_none() is None:
+            # файл уже сохранил параллельный запрос или загрузку отменили
+            await session.rollback()
+            return None
+        # содержимое собирается в хранилище, хеш на сервере не считается,
+        # поэтому файл хранится под ключом загрузки, а не как blob
+        (file_object,) = await FilesService.record_files(
+            session,
+            [
+                FileRecord(
+                    path=upload.path,
+                    account_id=email,
+                    name=upload.name,
+                    size=upload.size,
+                    etag=etag,
+                    object_key=upload.object_key,
+                )
+            ],
+        )
+        return file_object
+
+    @classmethod
+    async def delete_sessions(cls, session: AsyncSession, *criteria) -> list:
+        """Удалить загрузки и отменить их multipart загрузки.
+
+        Объекты загрузок, которые уже собирались, удаляет фоновая
+        задача, поставленная в той же транзакции.
+        """
+        result = await session.execute(
+            delete(UploadSession)
+            .where(*criteria)
+            .returning(
+                UploadSession.path,
+                UploadSession.object_key,
+                UploadSession.upload_id,
+                UploadSession.status,
+            )
+        )
+        uploads = result.all()
+        keys = [
+            upload.object_key
+            for upload in uploads
+            if upload.object_key and upload.status == COMPLETING
+        ]
+        if keys:
+            await job_queue.enqueue(
+                DELETE_OBJECTS_JOB, {"keys": keys}, session=session
+            )
+        await session.commit()
+
+        for upload in uploads:
+            await cls.abort_multipart_upload(
+                upload.object_key or upload.path, upload.upload_id
+            )
+        return uploads
+
+    @classmethod
+    async def abort(
+        cls, session: AsyncSession, email: str, id: uuid.UUID
+    ) -> bool:
+        """Отменить загрузку и удалить загруженные части."""
+        uploads = await cls.delete_sessions(
+            session, UploadSession.id == id, UploadSession.account_id == email
+        )
+        return bool(uploads)
+
+    @classmethod
+    async def abort_multipart_upload(cls, key: str, upload_id: str) -> None:
+        """Отменить multipart загрузку, залогировав ошибку хранилища."""
+        try:
+            await cls.s3_client.abort_multipart_upload(
+                cls.s3_bucket_name, key, upload_id
+            )
+        except Exception as err:
+            logger.error(f"Не удалось отменить загрузку {key}: {err}")
+
+    @classmethod
+    async def reap_stale_sessions(cls, limit: int = 1000) -> int:
+        """Отменить загрузки без активности дольше upload_session_ttl.
+
+        Строки удаляются запросом с SKIP LOCKED, поэтому сборщики разных
+        процессов не мешают друг другу.
+        """
+        stale_before = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=settings.upload_session_ttl
+        )
+        stale = (
+            select(UploadSession.id)
+            .where(UploadSession.updated_at < stale_before)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with async_session() as session:
+            uploads = await cls.delete_sessions(
+                session, UploadSession.id.in_(stale.scalar_subquery())
+            )
+        if uploads:
+            logger.info(f"Отменено брошенных загрузок: {len(uploads)}")
+        return len(uploads)
@@ -0,0 +1,120 @@
+import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import String, any_, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import get_settings
+from src.core.metrics import SERVICE_LATENCY, instrument
+from src.models.file import File
+from src.models.usage import UserUsage
+
+settings = get_settings()
+
+
+class QuotaExceededError(Exception):
+    pass
+
+
+@instrument(SERVICE_LATENCY, service="usage")
+class UsageService:
+    """Учет занятого пользователями места и проверка квоты.
+
+    Счетчики в user_usage изменяются на разницу в тех же транзакциях,
+    в которых добавляются, перезаписываются и удаляются файлы.
+    """
+
+    @staticmethod
+    async def apply(
+        session: AsyncSession, deltas: Dict[str, Tuple[int, int]]
+    ) -> None:
+        """Изменить счетчики одним запросом без commit.
+
+        deltas - словарь account_id -> (изменение байт, изменение
+        числа файлов).
+        """
+        deltas = {
+            account_id: delta
+            for account_id, delta in deltas.items()
+            if delta != (0, 0)
+        }
+        if not deltas:
+            return
+
+        query = insert(UserUsage).values(
+            [
+                {
+                    "account_id": account_id,
+                    "used_bytes": deltas[account_id][0],
+                    "files_count": deltas[account_id][1],
+                    "updated_at": datetime.datetime.utcnow(),
+                }
+                # одинаковый порядок строк не дает транзакциям
+                # заблокировать друг друга
+                for account_id in sorted(deltas)
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[UserUsage.account_id],
+            set_={
+                "used_bytes": UserUsage.used_bytes + query.excluded.used_bytes,
+                "files_count": UserUsage.files_count
+                + query.excluded.files_count,
+                "updated_at": query.excluded.updated_at,
+            },
+        )
+        await session.execute(query)
+
+    @classmethod
+    async def get_usage(cls, session: AsyncSession, email: str) -> dict:
+        """Получить занятое пользователем место."""
+        query = select(UserUsage.used_bytes, UserUsage.files_count).where(
+            UserUsage.account_id == email
+        )
+        usage = (await session.execute(query)).one_or_none()
+        used_bytes, files_count = usage or (0, 0)
+        return {
+            "used_bytes": used_bytes,
+            "files_count": files_count,
+            "quota_bytes": settings.storage_quota or None,
+        }
+
+    @classmethod
+    async def check_quota(
+        cls,
+        session: AsyncSession,
+        email: str,
+        size: int,
+        paths: List[str] = (),
+    ) -> None:
+        """Проверить, что size новых байт поместятся в квоту.
+
+        Файлы по путям paths будут перезаписаны, их размер вычитается
+        из занятого места. Проверка не блокирует счетчик, поэтому
+        параллельные загрузки могут немного превысить квоту.
+        """
+        if not settings.storage_quota:
+            return
+
+        used_bytes = (
+            select(UserUsage.used_bytes)
+            .where(UserUsage.account_id == email)
+            .scalar_subquery()
+        )
+        replaced_bytes = (
+            select(func.coalesce(func.sum(File.size), 0))
+            .where(
+                File.account_id == email,
+                File.path
+                == any_(bindparam("paths", list(paths), ARRAY(String))),
+            )
+            .scalar_subquery()
+        )
+        query = select(func.coalesce(used_bytes, 0) - replaced_bytes)
+        used = (await session.execute(query)).scalar_one()
+        if used + size > settings.storage_quota:
+            raise QuotaExceededError(
+                f"Превышена квота хранилища: занято {used} из "
+                f"{settings.storage_quota} байт, файлы занимают {size} байт"
+            )
@@ -1,11 +1,23 @@
-from passlib.hash import bcrypt
+from typing import Union
+
 from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.cache import CacheBackend, MemoryCache
+from src.core.config import get_settings
+from src.core.metrics import SERVICE_LATENCY, instrument
+from src.core.security import hash_password
 from src.models.user import User
 
+settings = get_settings()
+
 
+@instrument(SERVICE_LATENCY, service="users")
 class UserService:
+    # кэш пользователей для авторизации, может быть заменен общим кэшем
+    cache: CacheBackend = MemoryCache(
+        maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl
+    )
 
     @classmethod
     async def get_user_by_email(
@@ -15,11 +27,37 @@ class UserService:
         result = await session.execute(query)
         return result.scalar_one_or_none()
 
+    @classmethod
+    async def get_cached_user(
+        cls, session: AsyncSession, email: str
+    ) -> Union[User, None]:
+        """Получить пользователя из кэша, а при промахе - из БД.
+
+        В кэше хранятся только поля пользователя, а не объект сессии,
+        поэтому его можно вынести в общее хранилище.
+        """
+        user_data = await cls.cache.get(email)
+        if user_data is not None:
+            return User(**user_data)
+
+        user = await cls.get_user_by_email(session=session, email=email)
+        if user is not None:
+            await cls.cache.set(
+                email, {"email": user.email, "password": user.password}
+            )
+        return user
+
+    @classmethod
+    async def invalidate_cached_user(cls, email: str) -> None:
+        """Удалить пользователя из кэша после изменения его данных."""
+        await cls.cache.delete(email)
+
     @classmethod
     async def user_register(cls, session: AsyncSession, register_data):
         query = insert(User).values(
             email=register_data.email,
-            password=bcrypt.hash(register_data.password),
+            password=await hash_password(register_data.password),
         )
         await session.execute(query)
         await session.commit()
+        await cls.invalidate_cached_user(register_data.email)
@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 import sqlalchemy
 from alembic import command
@@ -17,9 +19,11 @@ SYNC_DB_DRIVER = "postgresql"
 
 
 def get_sync_database_url():
-    settings.db_host = TEST_DB_HOST
-    settings.db_driver = SYNC_DB_DRIVER
-    return str(settings.db_url)
+    # общий объект настроек не меняем: его использует приложение
+    sync_settings = settings.copy(
+        update={"db_host": TEST_DB_HOST, "db_driver": SYNC_DB_DRIVER}
+    )
+    return str(sync_settings.db_url)
 
 
 @pytest.fixture(scope="session")
@@ -44,8 +48,19 @@ def cleanup_after_test(sync_engine):
     session = sessionmaker(sync_engine)
     with session() as sync_session:
         # удаляя каскадно users мы удаляем и его файлы
-        sync_session.execute(text("""TRUNCATE TABLE users CASCADE"""))
+        sync_session.execute(
+            text("""TRUNCATE TABLE users, blobs, jobs CASCADE""")
+        )
         sync_session.commit()
+    clear_caches()
+
+
+def clear_caches():
+    from src.services.files import FilesService
+    from src.services.user import UserService
+
+    asyncio.run(UserService.cache.clear())
+    asyncio.run(FilesService.download_links_cache.clear())
 
 
 @pytest.fixture(autouse=True, scope="session")
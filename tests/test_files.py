@@ -1,20 +1,43 @@
+import asyncio
+import datetime
+import hashlib
+import io
 import os
-from unittest.mock import AsyncMock
+import zipfile
+from unittest.mock import AsyncMock, MagicMock
 
+import pytest
+from botocore.exceptions import ClientError
 from passlib.handlers.bcrypt import bcrypt
+from pydantic.v1 import ValidationError
 
 from src.clients.s3 import S3Client
-from src.core.config import get_settings
+from src.core.config import S3_MIN_PART_SIZE, Settings, get_settings
 from src.data_classes.files import FileItem
 from src.data_classes.users import UserRegisterData
+from src.db.db import async_session
+from src.models.blob import Blob
 from src.models.file import File
+from src.models.folder import Folder
+from src.models.job import Job
+from src.models.upload import DirectUpload
+from src.models.usage import UserUsage
 from src.models.user import User
-from src.services.files import FilesService
+from src.services.blobs import BlobService
+from src.services.files import (
+    DELETE_FOLDER_JOB,
+    DELETE_OBJECTS_JOB,
+    FileRecord,
+    FilesService,
+    delete_folder,
+)
+from src.services.files import delete_objects as delete_objects_job
+from src.services.pagination import encode_cursor
 
 settings = get_settings()
 
 
-def test_upload_file(client, monkeypatch, cleanup_after_test):
+def test_upload_file(client, monkeypatch, cleanup_after_test, sync_session):
     # для начала надо зарегистрировать пользователя
     test_email = "test@test.com"
     password = "string"
@@ -31,71 +54,213 @@ def test_upload_file(client, monkeypatch, cleanup_after_test):
     assert response.status_code == 200
     response_json = response.json()
     headers = {"Authorization": f"Bearer {response_json['access_token']}"}
-    mock_response_data_one = {
-        "ResponseMetadata": {
-            "RequestId": "17B512C61013C9CB",
-            "HTTPStatusCode": 200,
-            "HTTPHeaders": {},
-            "RetryAttempts": 0,
-        },
-        "ContentLength": 5,
-    }
-    mock_response_data_two = {
-        "ResponseMetadata": {
-            "RequestId": "17B512C61013C9CB",
-            "HTTPStatusCode": 200,
-            "HTTPHeaders": {},
-            "RetryAttempts": 0,
-        },
-        "ContentLength": 100,
-    }
-    object_exist_mock = AsyncMock()
-    # первая обращение в minio возвращает, то что объект не создан и нет метадаты
-    # второе обращение говорит, что объект существует и возвращает метадату
-    object_exist_mock.side_effect = [
-        (False, {}),
-        (True, mock_response_data_one),
-        (True, mock_response_data_one),
-        (True, mock_response_data_two),
-    ]
     put_object = AsyncMock()
-    monkeypatch.setattr(S3Client, "object_exists", object_exist_mock)
-    # мокаем запись объекта в хранилище минио, put_object ничего не возвращает
+    put_object.return_value = {"ETag": '"first-etag"'}
+    object_exists = AsyncMock()
+    # метаданные объекта не запрашиваются, размер считается при загрузке
+    monkeypatch.setattr(S3Client, "object_exists", object_exists)
+    # мокаем запись объекта в хранилище минио
     monkeypatch.setattr(S3Client, "put_object", put_object)
     filename = "example.txt"
     example_filepath = os.path.join(settings.tests_dir, filename)
     path = "temp"
     with open(example_filepath, "rb") as file:
-        response = client.post(
-            "files/upload",
-            files={"file": (filename, file.read())},
-            data={"path": path},
-            headers=headers,
-        )
+        content = file.read()
+    response = client.post(
+        "files/upload",
+        files={"file": (filename, content)},
+        data={"path": path},
+        headers=headers,
+    )
     assert response.status_code == 201
     response_json = response.json()
     assert response_json["name"] == filename
     assert response_json["path"] == f"{test_email}/{path}/{filename}"
     assert response_json["is_downloadable"] is True
-    assert response_json["size"] == mock_response_data_one["ContentLength"]
+    assert response_json["size"] == len(content)
+    first_id = response_json["id"]
     # попробуем перезаписать тот же самый файл, но уже большего размера
-    put_object = AsyncMock()
-    # мокаем запись объекта в хранилище минио, put_object ничего не возвращает
-    monkeypatch.setattr(S3Client, "put_object", put_object)
-    path = "temp"
-    with open(example_filepath, "rb") as file:
-        response = client.post(
-            "files/upload",
-            files={"file": (filename, file.read())},
-            data={"path": path},
-            headers=headers,
-        )
+    put_object.return_value = {"ETag": '"second-etag"'}
+    bigger_content = content * 20
+    response = client.post(
+        "files/upload",
+        files={"file": (filename, bigger_content)},
+        data={"path": path},
+        headers=headers,
+    )
     assert response.status_code == 201
     response_json = response.json()
+    assert response_json["id"] == first_id
     assert response_json["name"] == filename
     assert response_json["path"] == f"{test_email}/{path}/{filename}"
     assert response_json["is_downloadable"] is True
-    assert response_json["size"] == mock_response_data_two["ContentLength"]
+    assert response_json["size"] == len(bigger_content)
+    assert put_object.await_count == 2
+    object_exists.assert_not_awaited()
+    # содержимое хранится по хешу, старый blob остался без ссылок
+    first_blob = sync_session.get(Blob, hashlib.sha256(content).hexdigest())
+    second_blob = sync_session.get(
+        Blob, hashlib.sha256(bigger_content).hexdigest()
+    )
+    assert first_blob.ref_count == 0
+    assert first_blob.released_at is not None
+    assert second_blob.ref_count == 1
+    _, object_name, _ = put_object.await_args.args
+    assert object_name == BlobService.blob_key(second_blob.digest)
+    # такое же содержимое по другому пути не загружается повторно
+    response = client.post(
+        "files/upload",
+        files={"file": ("copy.txt", bigger_content)},
+        data={"path": "other"},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    assert response.json()["size"] == len(bigger_content)
+    assert put_object.await_count == 2
+    sync_session.refresh(second_blob)
+    assert second_blob.ref_count == 2
+
+
+def test_upload_files_batch(
+    client, monkeypatch, cleanup_after_test, sync_session
+):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    put_object = AsyncMock(return_value={"ETag": '"batch-etag"'})
+    monkeypatch.setattr(S3Client, "put_object", put_object)
+
+    response = client.post(
+        "files/upload/batch",
+        files=[
+            ("files", ("a.txt", b"same")),
+            ("files", ("sub/b.txt", b"same")),
+            ("files", ("c.txt", b"other")),
+            ("files", ("../escape.txt", b"bad")),
+            ("files", ("c.txt", b"last")),
+        ],
+        data={"path": "sync"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [item["path"] for item in items] == [
+        f"{test_email}/sync/a.txt",
+        f"{test_email}/sync/sub/b.txt",
+        f"{test_email}/sync/c.txt",
+        None,
+        f"{test_email}/sync/c.txt",
+    ]
+    assert items[0]["file"]["size"] == 4
+    assert items[1]["file"]["is_downloadable"] is True
+    # из двух файлов с одним путем сохраняется последний
+    assert items[2]["file"] is None and items[2]["error"]
+    assert items[3]["file"] is None and items[3]["error"]
+    assert items[4]["file"]["size"] == 4
+    # одинаковое содержимое загружается в хранилище один раз
+    assert put_object.await_count == 2
+    blob = sync_session.get(Blob, hashlib.sha256(b"same").hexdigest())
+    assert blob.ref_count == 2
+
+    settings_copy = settings.copy(update={"upload_batch_max_files": 1})
+    monkeypatch.setattr("src.api.v1.files.settings", settings_copy)
+    response = client.post(
+        "files/upload/batch",
+        files=[("files", ("a.txt", b"1")), ("files", ("b.txt", b"2"))],
+        headers=headers,
+    )
+    assert response.status_code == 422
+
+
+def test_record_same_path_concurrently(cleanup_after_test, sync_session):
+    test_email = "test@test.com"
+    sync_session.add(User(email=test_email, password="-"))
+    sync_session.commit()
+    path = f"{test_email}/retry/a.txt"
+    records = [
+        FileRecord(
+            path=path,
+            account_id=test_email,
+            name="a.txt",
+            size=len(content),
+            etag='"etag"',
+            blob_digest=hashlib.sha256(content).hexdigest(),
+        )
+        for content in (b"first", b"second!")
+    ]
+
+    async def record(file_record):
+        async with async_session() as session:
+            return await FilesService.record_files(session, [file_record])
+
+    async def run():
+        # повтор запроса клиентом: две загрузки нового пути одновременно
+        return await asyncio.gather(*map(record, records))
+
+    (first,), (second,) = asyncio.run(run())
+    assert first.id == second.id
+    file_object = sync_session.get(File, first.id)
+    blobs = {
+        record.blob_digest: sync_session.get(Blob, record.blob_digest)
+        for record in records
+    }
+    # ссылка есть только у содержимого, оставшегося в записи о файле
+    assert [
+        blob.ref_count
+        for digest, blob in blobs.items()
+        if digest != file_object.blob_digest
+    ] == [0]
+    assert blobs[file_object.blob_digest].ref_count == 1
+    # файл учтен в занятом месте и счетчиках папок один раз
+    usage = sync_session.get(UserUsage, test_email)
+    assert (usage.used_bytes, usage.files_count) == (file_object.size, 1)
+    for folder in (test_email, f"{test_email}/retry"):
+        folder = sync_session.get(Folder, folder)
+        assert (folder.size, folder.files_count) == (file_object.size, 1)
+
+
+def test_overwrite_path_keyed_file_concurrently(
+    cleanup_after_test, sync_session, monkeypatch
+):
+    test_email = "test@test.com"
+    sync_session.add(User(email=test_email, password="-"))
+    path = f"{test_email}/old/a.txt"
+    # файл, загруженный до blob, лежит в хранилище по своему пути
+    sync_session.add(
+        File(account_id=test_email, path=path, name="a.txt", size=3)
+    )
+    sync_session.commit()
+    records = [
+        FileRecord(
+            path=path,
+            account_id=test_email,
+            name="a.txt",
+            size=len(content),
+            etag='"etag"',
+            blob_digest=hashlib.sha256(content).hexdigest(),
+        )
+        for content in (b"first", b"second!")
+    ]
+
+    async def record(file_record):
+        async with async_session() as session:
+            return await FilesService.record_files(session, [file_record])
+
+    async def run():
+        await asyncio.gather(*map(record, records))
+
+    asyncio.run(run())
+    # старый объект заменен один раз, и удалить его нужно один раз
+    (job,) = sync_session.query(Job).filter_by(name=DELETE_OBJECTS_JOB)
+    assert job.payload == {"keys": [path]}
+    delete_objects = AsyncMock(return_value=[])
+    monkeypatch.setattr(S3Client, "delete_objects", delete_objects)
+    asyncio.run(delete_objects_job(**job.payload))
+    delete_objects.assert_awaited_once_with(settings.s3_bucket_name, [path])
 
 
 def test_get_files(client, cleanup_after_test, sync_session):
@@ -122,7 +287,9 @@ def test_get_files(client, cleanup_after_test, sync_session):
     # получаем все созданные файлы из БД и создаем словарь
     # который потом сравниваем с ответом
     dict_all_files_from_db = []
-    all_files_from_db = sync_session.query(File).all()
+    all_files_from_db = (
+        sync_session.query(File).order_by(File.created_ad, File.id).all()
+    )
     for file_object in all_files_from_db:
         dict_all_files_from_db.append(
             FileItem.model_validate(
@@ -139,7 +306,142 @@ def test_get_files(client, cleanup_after_test, sync_session):
     headers = {"Authorization": f"Bearer {response_json['access_token']}"}
     response = client.get("/files/files", headers=headers)
     response_json = response.json()
-    assert response_json == dict_all_files_from_db
+    assert response_json["items"] == dict_all_files_from_db
+    assert response_json["next_cursor"] is None
+    # проходим по страницам, передавая курсор из предыдущего ответа
+    paged_files = []
+    params = {"limit": 4}
+    while True:
+        response = client.get("/files/files", headers=headers, params=params)
+        assert response.status_code == 200
+        response_json = response.json()
+        assert len(response_json["items"]) <= 4
+        paged_files.extend(response_json["items"])
+        if response_json["next_cursor"] is None:
+            break
+        params["cursor"] = response_json["next_cursor"]
+    assert paged_files == dict_all_files_from_db
+    # фильтр по папке пользователя выполняется в запросе
+    response = client.get(
+        "/files/files", headers=headers, params={"prefix": "other"}
+    )
+    assert response.json()["items"] == []
+    for cursor in ("broken", encode_cursor("not-a-date", "nope")):
+        response = client.get(
+            "/files/files", headers=headers, params={"cursor": cursor}
+        )
+        assert response.status_code == 422
+
+
+def test_search_files(client, cleanup_after_test, sync_session):
+    test_email = "test@test.com"
+    another_email = "test_another@test.com"
+    test_pass = "testpass"
+    for email in (test_email, another_email):
+        sync_session.add(User(email=email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    files = [
+        ("docs/Report_2023.pdf", 300, datetime.datetime(2023, 5, 1)),
+        ("docs/report_2024.PDF", 100, datetime.datetime(2024, 5, 1)),
+        ("docs/notes.txt", 50, datetime.datetime(2024, 6, 1)),
+        ("photos/report.jpg", 500, datetime.datetime(2024, 7, 1)),
+        ("photos/100%_done.png", 200, datetime.datetime(2024, 8, 1)),
+    ]
+    for path, size, created_ad in files:
+        sync_session.add(
+            File(
+                account_id=test_email,
+                path=f"{test_email}/{path}",
+                folder=os.path.dirname(f"{test_email}/{path}"),
+                name=os.path.basename(path),
+                size=size,
+                created_ad=created_ad,
+            )
+        )
+    sync_session.add(
+        File(
+            account_id=another_email,
+            path=f"{another_email}/docs/report.pdf",
+            name="report.pdf",
+            size=1,
+        )
+    )
+    # файл без размера не ломает пагинацию по размеру
+    sync_session.add(
+        File(
+            account_id=test_email,
+            path=f"{test_email}/docs/unknown.bin",
+            name="unknown.bin",
+        )
+    )
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def search(**params):
+        response = client.get("/files/search", params=params, headers=headers)
+        assert response.status_code == 200
+        return [item["name"] for item in response.json()["items"]]
+
+    # по умолчанию сначала новые, чужие файлы не находятся
+    assert search(name="REPORT") == [
+        "report.jpg",
+        "report_2024.PDF",
+        "Report_2023.pdf",
+    ]
+    assert search(extension="pdf", sort="name", order="asc") == [
+        "Report_2023.pdf",
+        "report_2024.PDF",
+    ]
+    assert search(prefix="rep", folder="photos") == ["report.jpg"]
+    assert search(path="docs/", min_size=60, max_size=300) == [
+        "report_2024.PDF",
+        "Report_2023.pdf",
+    ]
+    assert search(created_from="2024-06-01", created_to="2024-08-01") == [
+        "report.jpg",
+        "notes.txt",
+    ]
+    # спецсимволы LIKE ищутся как обычные символы
+    assert search(name="%_") == ["100%_done.png"]
+
+    # пагинация по ключу сортировки
+    names, cursor = [], None
+    while True:
+        params = {"sort": "size", "order": "asc", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/files/search", params=params, headers=headers)
+        assert response.status_code == 200
+        names += [item["size"] for item in response.json()["items"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert names == [50, 100, 200, 300, 500]
+    response = client.get(
+        "/files/search",
+        params={"sort": "size", "limit": 2},
+        headers=headers,
+    )
+    cursor = response.json()["next_cursor"]
+    # курсор другой сортировки не принимается
+    response = client.get(
+        "/files/search",
+        params={"sort": "name", "cursor": cursor},
+        headers=headers,
+    )
+    assert response.status_code == 422
+    # как и значение ключа не того типа
+    file_id = "00000000-0000-0000-0000-000000000000"
+    for sort, value in (("size", "100"), ("size", True), ("name", 1)):
+        cursor = encode_cursor(f"{sort}:desc", value, file_id)
+        response = client.get(
+            "/files/search",
+            params={"sort": sort, "cursor": cursor},
+            headers=headers,
+        )
+        assert response.status_code == 422
 
 
 def test_get_download_link(
@@ -196,6 +498,8 @@ def test_get_download_link(
         response_json["download_link"]
         == f"{settings.s3_protocol}://{settings.host}:{settings.s3_port}/{filename}"
     )
+    # повторная ссылка на тот же объект берется из кэша, без подписи
+    assert get_download_link.await_count == 1
     # создадим нового пользователя авторизуемся и попробуем скачать тот же файл
     # создаем тестового юзера через БД
     test_email = "test_another@test.com"
@@ -216,3 +520,893 @@ def test_get_download_link(
     assert response.status_code == 403
     response_json = response.json()
     assert response_json == "У вас нет прав на скачивания этого файла"
+
+
+class FakeClientContext:
+    def __init__(self, client):
+        self.client = client
+
+    async def __aenter__(self):
+        return self.client
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def make_fake_s3_client():
+    client = AsyncMock()
+    client.exceptions.NoSuchBucket = type("NoSuchBucket", (Exception,), {})
+    client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+    client.put_object.return_value = {"ETag": '"single"'}
+    client.upload_part.side_effect = lambda **kwargs: {
+        "ETag": f'"{kwargs["PartNumber"]}"'
+    }
+    client.complete_multipart_upload.return_value = {"ETag": '"final"'}
+    return client
+
+
+async def parts_iterator(parts):
+    for part in parts:
+        yield part
+
+
+def make_s3_client(client):
+    s3_client = S3Client(logger=MagicMock(), endpoint="http://s3:9000")
+    s3_client.session = MagicMock()
+    s3_client.session.create_client.return_value = FakeClientContext(client)
+    return s3_client
+
+
+def test_s3_client_is_reused():
+    # все вызовы используют один клиент, созданный при первом обращении
+    client = make_fake_s3_client()
+    s3_client = make_s3_client(client)
+
+    async def run():
+        await s3_client.put_object("bucket", "first.txt", b"1")
+        await s3_client.put_object("bucket", "second.txt", b"2")
+        await s3_client.close()
+
+    asyncio.run(run())
+
+    s3_client.session.create_client.assert_called_once()
+    assert client.put_object.await_count == 2
+    assert s3_client._client is None
+
+
+def test_upload_stream_multipart():
+    # файл из нескольких частей загружается через multipart upload
+    client = make_fake_s3_client()
+    s3_client = make_s3_client(client)
+    parts = [b"a" * 10, b"b" * 10, b"c" * 3]
+
+    response = asyncio.run(
+        s3_client.upload_stream(
+            "bucket", "test@test.com/file.bin", parts_iterator(parts)
+        )
+    )
+
+    assert response == {"ETag": '"final"', "ContentLength": 23}
+    assert client.upload_part.await_count == len(parts)
+    complete_kwargs = client.complete_multipart_upload.await_args.kwargs
+    assert complete_kwargs["MultipartUpload"]["Parts"] == [
+        {"ETag": '"1"', "PartNumber": 1},
+        {"ETag": '"2"', "PartNumber": 2},
+        {"ETag": '"3"', "PartNumber": 3},
+    ]
+    client.abort_multipart_upload.assert_not_awaited()
+
+
+def test_upload_stream_aborts_on_error():
+    # при ошибке загрузки части multipart загрузка отменяется
+    client = make_fake_s3_client()
+    client.upload_part.side_effect = [{"ETag": '"1"'}, RuntimeError("boom")]
+    s3_client = make_s3_client(client)
+
+    try:
+        asyncio.run(
+            s3_client.upload_stream(
+                "bucket", "file.bin", parts_iterator([b"a", b"b"])
+            )
+        )
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("Ошибка загрузки должна пробрасываться")
+
+    client.abort_multipart_upload.assert_awaited_once_with(
+        Bucket="bucket", Key="file.bin", UploadId="upload-id"
+    )
+    client.complete_multipart_upload.assert_not_awaited()
+
+
+def test_multipart_part_size_minimum():
+    # хранилище не примет части меньше 5 МБ, кроме последней
+    values = settings.dict()
+    values["s3_multipart_part_size"] = 1024 * 1024
+    with pytest.raises(ValidationError):
+        Settings(**values)
+    values["s3_multipart_part_size"] = S3_MIN_PART_SIZE
+    assert Settings(**values).s3_multipart_part_size == S3_MIN_PART_SIZE
+
+
+def test_reap_orphan_blobs(cleanup_after_test, sync_session, monkeypatch):
+    released_at = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=settings.blob_orphan_grace_period + 1
+    )
+    digests = [hashlib.sha256(str(n).encode()).hexdigest() for n in range(3)]
+    for digest in digests:
+        sync_session.add(
+            Blob(
+                digest=digest,
+                size=1,
+                etag='"etag"',
+                ref_count=0,
+                released_at=released_at,
+            )
+        )
+    sync_session.commit()
+    # объект, который хранилище не удалило, остается до следующего запуска
+    delete_objects = AsyncMock(return_value=[BlobService.blob_key(digests[1])])
+    monkeypatch.setattr(S3Client, "delete_objects", delete_objects)
+
+    async def run():
+        async with async_session() as session:
+            # загрузка того же содержимого занимает blob до сборщика
+            await BlobService.claim(session, {digests[2]: 1})
+            await session.commit()
+            live = await BlobService.get_live_blobs(session, digests)
+            assert list(live) == [digests[2]]
+        return await BlobService.reap_orphans()
+
+    assert asyncio.run(run()) == [digests[0]]
+    _, keys = delete_objects.await_args.args
+    assert sorted(keys) == sorted(BlobService.blob_key(d) for d in digests[:2])
+    sync_session.expire_all()
+    assert sync_session.get(Blob, digests[0]) is None
+    assert sync_session.get(Blob, digests[1]) is not None
+    assert sync_session.get(Blob, digests[2]).released_at > released_at
+
+
+def test_delete_objects_batches():
+    # ключи удаляются пачками по 1000, возвращаются не удаленные
+    client = make_fake_s3_client()
+    client.delete_objects.side_effect = [
+        {"Errors": [{"Key": "key-5", "Code": "AccessDenied"}]},
+        {},
+        {},
+    ]
+    s3_client = make_s3_client(client)
+    keys = [f"key-{num}" for num in range(2500)]
+
+    failed = asyncio.run(s3_client.delete_objects("bucket", keys))
+
+    assert failed == ["key-5"]
+    assert client.delete_objects.await_count == 3
+    batches = [
+        call.kwargs["Delete"]["Objects"]
+        for call in client.delete_objects.await_args_list
+    ]
+    assert [len(batch) for batch in batches] == [1000, 1000, 500]
+    assert batches[2][-1] == {"Key": "key-2499"}
+
+
+def test_download_link_cache(monkeypatch):
+    get_download_url = AsyncMock(
+        return_value=f"http://{settings.s3_host}:{settings.s3_port}/file"
+    )
+    monkeypatch.setattr(S3Client, "get_download_url", get_download_url)
+    path = "test@test.com/cached/file.txt"
+
+    async def run():
+        await FilesService.download_links_cache.clear()
+        first_link = await FilesService.get_download_link(path, etag='"a"')
+        second_link = await FilesService.get_download_link(path, etag='"a"')
+        assert first_link == second_link
+        assert get_download_url.await_count == 1
+        # новая версия объекта получает новую ссылку
+        await FilesService.get_download_link(path, etag='"b"')
+        assert get_download_url.await_count == 2
+        # после перезаписи файла ссылка подписывается заново
+        await FilesService.invalidate_download_link(path)
+        await FilesService.get_download_link(path, etag='"b"')
+        assert get_download_url.await_count == 3
+        await FilesService.download_links_cache.clear()
+
+    asyncio.run(run())
+
+
+def test_download_files_batch(
+    client, cleanup_after_test, sync_session, monkeypatch
+):
+    # создаем двух пользователей и их файлы через БД
+    test_email = "test@test.com"
+    another_email = "test_another@test.com"
+    test_pass = "testpass"
+    for email in (test_email, another_email):
+        sync_session.add(User(email=email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    own_files = []
+    for num in range(1, 3 + 1):
+        file_object = File(
+            account_id=test_email,
+            path=f"{test_email}/test/example{num}.txt",
+            size=num,
+            name=f"example{num}.txt",
+        )
+        sync_session.add(file_object)
+        own_files.append(file_object)
+    foreign_file = File(
+        account_id=another_email,
+        path=f"{another_email}/test/example.txt",
+        size=1,
+        name="example.txt",
+    )
+    sync_session.add(foreign_file)
+    sync_session.commit()
+
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    get_download_url = AsyncMock(
+        return_value=f"http://{settings.s3_host}:{settings.s3_port}/file"
+    )
+    monkeypatch.setattr(S3Client, "get_download_url", get_download_url)
+
+    items = [
+        own_files[0].path,
+        str(own_files[1].id),
+        own_files[2].path,
+        foreign_file.path,
+        f"{test_email}/test/missing.txt",
+        "not-a-path",
+    ]
+    response = client.post(
+        "/files/download/batch", headers=headers, json={"items": items}
+    )
+    assert response.status_code == 200
+    results = response.json()["items"]
+    assert [result["item"] for result in results] == items
+    expected_link = f"http://{settings.host}:{settings.s3_port}/file"
+    for result in results[:3]:
+        assert result["download_link"] == expected_link
+        assert result["error"] is None
+    assert results[3]["error"] == "У вас нет прав на скачивания этого файла"
+    for result in results[4:]:
+        assert result["download_link"] is None
+        assert result["error"] == (
+            "Не правильно указан путь или идентификатор файла"
+        )
+    assert get_download_url.await_count == 3
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+        self.closed = False
+
+    async def read(self, size):
+        return self.data.read(size)
+
+    def close(self):
+        self.closed = True
+
+
+def test_delete_files(client, cleanup_after_test, sync_session, monkeypatch):
+    test_email = "test@test.com"
+    another_email = "test_another@test.com"
+    test_pass = "testpass"
+    for email in (test_email, another_email):
+        sync_session.add(User(email=email, password=bcrypt.hash(test_pass)))
+    digest = hashlib.sha256(b"content").hexdigest()
+    sync_session.add(Blob(digest=digest, ref_count=2, size=7, etag='"e"'))
+    sync_session.commit()
+    own_files = []
+    for num in range(1, 6 + 1):
+        file_object = File(
+            account_id=test_email,
+            path=f"{test_email}/test/example{num}.txt",
+            size=7,
+            name=f"example{num}.txt",
+            blob_digest=digest if num <= 2 else None,
+        )
+        sync_session.add(file_object)
+        own_files.append(file_object)
+    foreign_file = File(
+        account_id=another_email,
+        path=f"{another_email}/test/example.txt",
+        size=1,
+        name="example.txt",
+    )
+    sync_session.add(foreign_file)
+    sync_session.commit()
+
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    delete_objects = AsyncMock(return_value=[])
+    monkeypatch.setattr(S3Client, "delete_objects", delete_objects)
+
+    response = client.delete(
+        "/files/delete", params={"path": own_files[0].path}, headers=headers
+    )
+    assert response.status_code == 204
+    # содержимое blob удаляет сборщик, когда на него не останется ссылок
+    delete_objects.assert_not_awaited()
+    response = client.delete(
+        "/files/delete", params={"path": foreign_file.path}, headers=headers
+    )
+    assert response.status_code == 403
+    response = client.delete(
+        "/files/delete", params={"path": own_files[0].path}, headers=headers
+    )
+    assert response.status_code == 422
+
+    response = client.post(
+        "/files/delete/batch",
+        json={
+            "items": [
+                str(own_files[1].id),
+                own_files[2].path,
+                foreign_file.path,
+                "not-a-path",
+            ]
+        },
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert [item["error"] is None for item in response.json()["items"]] == [
+        True,
+        True,
+        False,
+        False,
+    ]
+    # объекты, лежащие по пути файла, удаляются одним запросом
+    delete_objects.assert_awaited_once_with(
+        settings.s3_bucket_name, [own_files[2].path]
+    )
+    blob = sync_session.get(Blob, digest)
+    sync_session.refresh(blob)
+    assert blob.ref_count == 0
+    assert blob.released_at is not None
+
+    # корень пользователя этим запросом не удаляется
+    for params in ({}, {"path": ""}, {"path": "/"}):
+        response = client.delete(
+            "/files/delete/folder", params=params, headers=headers
+        )
+        assert response.status_code == 422
+    assert sync_session.query(File).filter_by(account_id=test_email).count()
+
+    # большая папка дочищается фоновой задачей
+    monkeypatch.setattr(
+        "src.services.files.settings",
+        settings.copy(update={"delete_batch_size": 2}),
+    )
+    response = client.delete(
+        "/files/delete/folder", params={"path": "test"}, headers=headers
+    )
+    assert response.status_code == 202
+    assert response.json() == {"deleted": 2, "completed": False}
+    job = sync_session.query(Job).filter_by(name=DELETE_FOLDER_JOB).one()
+    asyncio.run(delete_folder(**job.payload))
+    remaining = sync_session.query(File).filter_by(account_id=test_email)
+    assert remaining.count() == 0
+    assert sync_session.get(File, foreign_file.id) is not None
+    response = client.delete(
+        "/files/delete/folder", params={"path": "test"}, headers=headers
+    )
+    assert response.status_code == 422
+
+
+def test_delete_unreferenced_objects(
+    cleanup_after_test, sync_session, monkeypatch
+):
+    test_email = "test@test.com"
+    sync_session.add(User(email=test_email, password="-"))
+    sync_session.commit()
+    path = f"{test_email}/a.txt"
+    # пока ключи ждали удаления, по ним снова сохранили файлы
+    sync_session.add(
+        File(account_id=test_email, path=path, name="a.txt", size=1)
+    )
+    sync_session.add(
+        File(
+            account_id=test_email,
+            path=f"{test_email}/b.txt",
+            name="b.txt",
+            size=1,
+            object_key="uploads/b",
+        )
+    )
+    sync_session.commit()
+    delete_objects = AsyncMock(return_value=[])
+    monkeypatch.setattr(S3Client, "delete_objects", delete_objects)
+    keys = [path, "uploads/b", f"{test_email}/gone.txt", "uploads/gone"]
+
+    async def run():
+        async with async_session() as session:
+            return await FilesService.delete_unreferenced_objects(
+                session, keys
+            )
+
+    assert asyncio.run(run()) == []
+    delete_objects.assert_awaited_once_with(
+        settings.s3_bucket_name, [f"{test_email}/gone.txt", "uploads/gone"]
+    )
+
+
+def test_download_folder(
+    client, cleanup_after_test, sync_session, monkeypatch
+):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    contents = {
+        f"{test_email}/test/example1.txt": b"first",
+        f"{test_email}/test/nested/example2.txt": b"second" * 1000,
+        f"{test_email}/test2/example3.txt": b"other folder",
+    }
+    for path, content in contents.items():
+        sync_session.add(
+            File(
+                account_id=test_email,
+                path=path,
+                size=len(content),
+                name=os.path.basename(path),
+            )
+        )
+    sync_session.commit()
+
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def get_object(self, bucket_name, object_name, **params):
+        return {"Body": FakeBody(contents[object_name])}
+
+    monkeypatch.setattr(S3Client, "get_object", get_object)
+    response = client.get(
+        "/files/download/folder", headers=headers, params={"path": "test"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    # в архив попадают только файлы папки, пути относительно нее
+    assert sorted(archive.namelist()) == [
+        "example1.txt",
+        "nested/example2.txt",
+    ]
+    assert archive.read("nested/example2.txt") == b"second" * 1000
+
+    response = client.get(
+        "/files/download/folder", headers=headers, params={"path": "missing"}
+    )
+    assert response.status_code == 422
+
+
+def test_direct_upload(client, cleanup_after_test, sync_session, monkeypatch):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    get_upload_url = AsyncMock(
+        return_value=f"http://{settings.s3_host}:{settings.s3_port}/upload"
+    )
+    monkeypatch.setattr(S3Client, "get_upload_url", get_upload_url)
+    object_exists = AsyncMock(return_value=(False, {}))
+    monkeypatch.setattr(S3Client, "object_exists", object_exists)
+    path = "direct/file.bin"
+
+    response = client.post(
+        "/files/upload/direct", headers=headers, json={"path": path}
+    )
+    assert response.status_code == 200
+    response_json = response.json()
+    upload_id = response_json["id"]
+    assert response_json["path"] == f"{test_email}/{path}"
+    assert response_json["upload_link"] == (
+        f"http://{settings.host}:{settings.s3_port}/upload"
+    )
+    # объект загружается под ключом загрузки, а не по пути файла
+    staging_key = f"uploads/{upload_id}"
+    _, object_name, _ = get_upload_url.await_args.args
+    assert object_name == staging_key
+    # пока объект не загружен, подтвердить загрузку нельзя
+    response = client.post(
+        "/files/upload/direct/complete",
+        headers=headers,
+        json={"id": upload_id},
+    )
+    assert response.status_code == 422
+    # размер и etag берутся из метаданных объекта в хранилище
+    object_exists.return_value = (
+        True,
+        {"ContentLength": 100500, "ETag": '"direct"'},
+    )
+    response = client.post(
+        "/files/upload/direct/complete",
+        headers=headers,
+        json={"id": upload_id},
+    )
+    assert response.status_code == 201
+    response_json = response.json()
+    assert response_json["path"] == f"{test_email}/{path}"
+    assert response_json["size"] == 100500
+    _, object_name = object_exists.await_args.args
+    assert object_name == staging_key
+    file_object = sync_session.get(File, response_json["id"])
+    assert file_object.etag == '"direct"'
+    assert file_object.blob_digest is None
+    assert file_object.object_key == staging_key
+    assert sync_session.get(DirectUpload, upload_id) is None
+    # повторное подтверждение ничего не меняет
+    response = client.post(
+        "/files/upload/direct/complete",
+        headers=headers,
+        json={"id": upload_id},
+    )
+    assert response.status_code == 422
+
+    # неподтвержденную загрузку удаляет сборщик вместе с объектом
+    response = client.post(
+        "/files/upload/direct", headers=headers, json={"path": path}
+    )
+    stale_id = response.json()["id"]
+    sync_session.query(DirectUpload).filter_by(id=stale_id).update(
+        {
+            "created_at": datetime.datetime.utcnow()
+            - datetime.timedelta(seconds=settings.upload_session_ttl + 1)
+        }
+    )
+    sync_session.commit()
+    assert asyncio.run(FilesService.reap_direct_uploads()) == 1
+    assert sync_session.get(DirectUpload, stale_id) is None
+    job = sync_session.query(Job).filter_by(name=DELETE_OBJECTS_JOB).one()
+    assert job.payload == {"keys": [f"uploads/{stale_id}"]}
+
+
+def test_direct_upload_over_quota_keeps_file(
+    client, cleanup_after_test, sync_session, monkeypatch
+):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    monkeypatch.setattr(
+        S3Client, "get_upload_url", AsyncMock(return_value="http://s3/up")
+    )
+    object_exists = AsyncMock(
+        return_value=(True, {"ContentLength": 10, "ETag": '"first"'})
+    )
+    monkeypatch.setattr(S3Client, "object_exists", object_exists)
+    monkeypatch.setattr(
+        "src.services.usage.settings",
+        settings.copy(update={"storage_quota": 50}),
+    )
+
+    def upload_direct():
+        response = client.post(
+            "/files/upload/direct",
+            headers=headers,
+            json={"path": "direct/file.bin"},
+        )
+        upload_id = response.json()["id"]
+        response = client.post(
+            "/files/upload/direct/complete",
+            headers=headers,
+            json={"id": upload_id},
+        )
+        return upload_id, response
+
+    first_id, response = upload_direct()
+    assert response.status_code == 201
+    file_id = response.json()["id"]
+    # перезапись файла больше квоты отклоняется
+    object_exists.return_value = (
+        True,
+        {"ContentLength": 100, "ETag": '"second"'},
+    )
+    second_id, response = upload_direct()
+    assert response.status_code == 413
+
+    file_object = sync_session.get(File, file_id)
+    assert file_object.object_key == f"uploads/{first_id}"
+    assert (file_object.size, file_object.etag) == (10, '"first"')
+    assert sync_session.get(DirectUpload, second_id) is None
+    # удаляется только объект отклоненной загрузки
+    (job,) = sync_session.query(Job).filter_by(name=DELETE_OBJECTS_JOB)
+    assert job.payload == {"keys": [f"uploads/{second_id}"]}
+
+
+def test_storage_usage_and_quota(
+    client, cleanup_after_test, sync_session, monkeypatch
+):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    put_object = AsyncMock(return_value={"ETag": '"etag"'})
+    monkeypatch.setattr(S3Client, "put_object", put_object)
+    monkeypatch.setattr(S3Client, "delete_objects", AsyncMock(return_value=[]))
+
+    response = client.get("/files/usage", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "used_bytes": 0,
+        "files_count": 0,
+        "quota_bytes": None,
+    }
+    for content in (b"1" * 10, b"2" * 30):
+        response = client.post(
+            "files/upload",
+            files={"file": ("a.txt", content)},
+            data={"path": "quota"},
+            headers=headers,
+        )
+        assert response.status_code == 201
+    response = client.post(
+        "files/upload/batch",
+        files=[("files", ("b.txt", b"3" * 5)), ("files", ("c.txt", b"4"))],
+        data={"path": "quota"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    # перезапись файла учитывается как разница размеров
+    response = client.get("/files/usage", headers=headers)
+    assert response.json()["used_bytes"] == 36
+    assert response.json()["files_count"] == 3
+
+    monkeypatch.setattr(
+        "src.services.usage.settings",
+        settings.copy(update={"storage_quota": 50}),
+    )
+    put_object.reset_mock()
+    response = client.post(
+        "files/upload",
+        files={"file": ("d.txt", b"5" * 20)},
+        data={"path": "quota"},
+        headers=headers,
+    )
+    assert response.status_code == 413
+    put_object.assert_not_awaited()
+    # при перезаписи с квотой сравнивается только разница размеров:
+    # a.txt растет с 30 до 40 байт, и это укладывается в квоту
+    response = client.post(
+        "files/upload",
+        files={"file": ("a.txt", b"6" * 40)},
+        data={"path": "quota"},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    response = client.post(
+        "/files/upload/direct",
+        headers=headers,
+        json={"path": "quota/big.bin", "size": 100},
+    )
+    assert response.status_code == 413
+    response = client.post(
+        "/files/uploads",
+        headers=headers,
+        json={"path": "quota/big.bin", "size": 100},
+    )
+    assert response.status_code == 413
+
+    response = client.delete(
+        "/files/delete/folder", params={"path": "quota"}, headers=headers
+    )
+    assert response.status_code == 200
+    response = client.get("/files/usage", headers=headers)
+    assert response.json() == {
+        "used_bytes": 0,
+        "files_count": 0,
+        "quota_bytes": 50,
+    }
+
+
+def test_list_folder(client, cleanup_after_test, sync_session, monkeypatch):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    put_object = AsyncMock(return_value={"ETag": '"etag"'})
+    monkeypatch.setattr(S3Client, "put_object", put_object)
+    monkeypatch.setattr(S3Client, "delete_objects", AsyncMock(return_value=[]))
+    # у пользователя без файлов корневая папка пустая
+    response = client.get("/files/ls", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "path": test_email,
+        "files_count": 0,
+        "size": 0,
+        "items": [],
+        "next_cursor": None,
+    }
+    response = client.get(
+        "/files/ls", params={"path": "docs"}, headers=headers
+    )
+    assert response.status_code == 422
+
+    response = client.post(
+        "files/upload/batch",
+        files=[
+            ("files", ("top.txt", b"1")),
+            ("files", ("docs/a.txt", b"22")),
+            ("files", ("docs/b.txt", b"333")),
+            ("files", ("docs/deep/c.txt", b"4444")),
+            ("files", ("photos/d.jpg", b"55555")),
+        ],
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    response = client.get("/files/ls", headers=headers)
+    assert response.status_code == 200
+    listing = response.json()
+    assert listing["path"] == test_email
+    assert (listing["files_count"], listing["size"]) == (5, 15)
+    assert [
+        (item["type"], item["name"], item["files_count"], item["size"])
+        for item in listing["items"]
+    ] == [
+        ("folder", "docs", 3, 9),
+        ("folder", "photos", 1, 5),
+        ("file", "top.txt", None, 1),
+    ]
+    assert listing["next_cursor"] is None
+
+    # папки и файлы листаются одной последовательностью страниц
+    names, cursor = [], None
+    while True:
+        params = {"path": "docs", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/files/ls", params=params, headers=headers)
+        assert response.status_code == 200
+        names += [item["name"] for item in response.json()["items"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert names == ["deep", "a.txt", "b.txt"]
+
+    # перезапись и удаление меняют счетчики всех папок выше
+    response = client.post(
+        "files/upload",
+        files={"file": ("c.txt", b"4")},
+        data={"path": "docs/deep"},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    response = client.delete(
+        "/files/delete",
+        params={"path": f"{test_email}/docs/a.txt"},
+        headers=headers,
+    )
+    assert response.status_code == 204
+    response = client.get(
+        "/files/ls", params={"path": "docs"}, headers=headers
+    )
+    assert (response.json()["files_count"], response.json()["size"]) == (2, 4)
+    response = client.get("/files/ls", headers=headers)
+    assert (response.json()["files_count"], response.json()["size"]) == (4, 10)
+
+    # пустая папка исчезает вместе с последним файлом
+    response = client.delete(
+        "/files/delete/folder", params={"path": "docs"}, headers=headers
+    )
+    assert response.status_code == 200
+    response = client.get(
+        "/files/ls", params={"path": "docs"}, headers=headers
+    )
+    assert response.status_code == 422
+    response = client.get("/files/ls", headers=headers)
+    assert [item["name"] for item in response.json()["items"]] == [
+        "photos",
+        "top.txt",
+    ]
+
+
+def test_download_file_proxy(
+    client, cleanup_after_test, sync_session, monkeypatch
+):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    content = b"0123456789" * 100
+    file_object = File(
+        account_id=test_email,
+        path=f"{test_email}/media/video.mp4",
+        size=len(content),
+        name="video.mp4",
+        etag='"v1"',
+    )
+    sync_session.add(file_object)
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def get_object(self, bucket_name, object_name, **params):
+        assert object_name == file_object.path
+        if "Range" not in params:
+            return {"Body": FakeBody(content), "ContentLength": len(content)}
+        start, end = params["Range"].removeprefix("bytes=").split("-")
+        if int(start) >= len(content):
+            raise ClientError({"Error": {"Code": "InvalidRange"}}, "GetObject")
+        data = content[int(start) : int(end) + 1]
+        return {
+            "Body": FakeBody(data),
+            "ContentLength": len(data),
+            "ContentRange": f"bytes {start}-{end}/{len(content)}",
+        }
+
+    monkeypatch.setattr(S3Client, "get_object", get_object)
+    url = "/files/download/proxy"
+    params = {"path": file_object.path}
+
+    response = client.get(url, headers=headers, params=params)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["etag"] == '"v1"'
+    assert response.headers["content-type"] == "video/mp4"
+    last_modified = response.headers["last-modified"]
+
+    response = client.get(
+        url, headers={**headers, "Range": "bytes=10-19"}, params=params
+    )
+    assert response.status_code == 206
+    assert response.content == content[10:20]
+    assert response.headers["content-range"] == "bytes 10-19/1000"
+    # If-Range с другой версией файла отдает файл целиком
+    response = client.get(
+        url,
+        headers={**headers, "Range": "bytes=10-19", "If-Range": '"v0"'},
+        params=params,
+    )
+    assert response.status_code == 200
+    assert response.content == content
+    response = client.get(
+        url, headers={**headers, "Range": "bytes=5000-5001"}, params=params
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1000"
+    # условные запросы не читают объект из хранилища
+    for condition in (
+        {"If-None-Match": '"v1"'},
+        {"If-Modified-Since": last_modified},
+    ):
+        response = client.get(
+            url, headers={**headers, **condition}, params=params
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+    response = client.get(
+        url, headers={**headers, "If-None-Match": '"v0"'}, params=params
+    )
+    assert response.status_code == 200
+
+    another_email = "test_another@test.com"
+    sync_session.add(
+        User(email=another_email, password=bcrypt.hash(test_pass))
+    )
+    sync_session.commit()
+    request = {"username": another_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = client.get(url, headers=headers, params=params)
+    assert response.status_code == 403
@@ -0,0 +1,113 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.jobs import JobQueue, MemoryJobBackend, PostgresJobBackend
+
+
+def test_job_retries_with_backoff():
+    backend = MemoryJobBackend()
+    queue = JobQueue(backend, max_attempts=3, retry_delay=0, poll_interval=1)
+    calls = []
+
+    @queue.register("flaky")
+    async def flaky(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise RuntimeError("boom")
+
+    async def run():
+        await queue.enqueue("flaky", {"value": 1})
+        for _ in range(3):
+            (job,) = await backend.fetch(10)
+            await queue.run_job(job)
+        assert await backend.fetch(10) == []
+
+    asyncio.run(run())
+    assert calls == [1, 1, 1]
+    assert backend.failed == {}
+    # задержка растет экспоненциально и ограничена сверху
+    queue = JobQueue(backend, retry_delay=1, retry_delay_max=5)
+    assert [queue.get_retry_delay(n) for n in range(1, 6)] == [1, 2, 4, 5, 5]
+
+
+def test_job_fails_after_max_attempts():
+    backend = MemoryJobBackend()
+    queue = JobQueue(backend, max_attempts=2, retry_delay=0)
+
+    async def run():
+        await queue.enqueue("unknown", {})
+        for _ in range(2):
+            (job,) = await backend.fetch(10)
+            await queue.run_job(job)
+
+    asyncio.run(run())
+    assert backend.pending == {}
+    (job,) = backend.failed.values()
+    assert job.name == "unknown"
+    assert job.attempts == 2
+
+
+def test_job_workers_run_concurrently():
+    queue = JobQueue(MemoryJobBackend(), poll_interval=10)
+    running = []
+    done = []
+
+    @queue.register("slow")
+    async def slow(number):
+        running.append(number)
+        await asyncio.sleep(0.1)
+        done.append(number)
+
+    async def run():
+        queue.start(concurrency=4)
+        for number in range(4):
+            await queue.enqueue("slow", {"number": number})
+        # постановка задачи будит обработчики, не дожидаясь опроса
+        await asyncio.sleep(0.3)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert sorted(done) == [0, 1, 2, 3]
+
+
+def test_memory_job_backend_waits_for_commit():
+    backend = MemoryJobBackend()
+
+    async def run():
+        async with AsyncSession() as session:
+            await session.begin()
+            await backend.enqueue("task", {"key": "rolled back"}, session)
+            await session.rollback()
+            assert await backend.fetch(10) == []
+
+            await session.begin()
+            await backend.enqueue("task", {"key": "committed"}, session)
+            # задача в транзакции не видна до commit
+            assert await backend.fetch(10) == []
+            await session.commit()
+        (job,) = await backend.fetch(10)
+        assert job.payload == {"key": "committed"}
+        assert backend.deferred == {}
+
+    asyncio.run(run())
+
+
+def test_postgres_job_backend(cleanup_after_test):
+    backend = PostgresJobBackend()
+
+    async def run():
+        await backend.enqueue("task", {"key": "value"})
+        (job,) = await backend.fetch(10)
+        assert job.name == "task"
+        assert job.payload == {"key": "value"}
+        assert job.attempts == 1
+        # выбранная задача арендована и недоступна другим обработчикам
+        assert await backend.fetch(10) == []
+        await backend.retry(job, delay=0, error="boom")
+        (job,) = await backend.fetch(10)
+        assert job.attempts == 2
+        await backend.complete(job)
+        assert await backend.fetch(10) == []
+
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+import os
+from unittest.mock import MagicMock
+
+from src import __main__ as entrypoint
+from src.core.config import get_settings
+
+settings = get_settings()
+
+
+def test_serve(monkeypatch):
+    run = MagicMock()
+    monkeypatch.setattr(entrypoint.uvicorn, "run", run)
+
+    # по умолчанию процессов по числу ядер, с uvloop и httptools
+    monkeypatch.setattr(
+        entrypoint,
+        "config",
+        settings.copy(
+            update={
+                "app_reload": False,
+                "app_workers": 0,
+                "graceful_shutdown_timeout": 30,
+            }
+        ),
+    )
+    entrypoint.serve()
+    (app,), kwargs = run.call_args
+    assert app == "main:app"
+    assert kwargs["workers"] == os.cpu_count()
+    assert kwargs["loop"] == "uvloop"
+    assert kwargs["http"] == "httptools"
+    assert kwargs["timeout_graceful_shutdown"] == 30
+    assert "reload" not in kwargs
+
+    # в режиме разработки один процесс, который перезапускается
+    monkeypatch.setattr(
+        entrypoint,
+        "config",
+        settings.copy(update={"app_reload": True, "app_workers": 4}),
+    )
+    entrypoint.serve()
+    (app,), kwargs = run.call_args
+    assert app == "main:app"
+    assert kwargs["reload"] is True
+    assert kwargs["loop"] == "asyncio"
+    assert "workers" not in kwargs
+    assert "http" not in kwargs
+    assert "timeout_graceful_shutdown" not in kwargs
+    assert run.call_count == 2
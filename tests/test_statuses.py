@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from src.core.config import get_settings
+from src.core.log import get_logger, request_id_var
+
+
+def test_db_pool_status(client):
+    response = client.get("/ping/db-pool")
+    assert response.status_code == 200
+    response_json = response.json()
+    for key in ("connects", "checkouts", "timeouts", "wait_seconds_total"):
+        assert key in response_json
+
+
+def test_ping_checks_run_concurrently_and_are_cached(client, monkeypatch):
+    from src.api.v1 import statuses
+
+    calls = []
+
+    async def check_db():
+        calls.append("db")
+        await asyncio.sleep(0.1)
+        return True
+
+    async def check_minio():
+        calls.append("minio")
+        # зависшее хранилище не блокирует пробу дольше таймаута
+        await asyncio.sleep(10)
+        return True
+
+    monkeypatch.setattr(statuses, "check_db", check_db)
+    monkeypatch.setattr(statuses, "check_minio", check_minio)
+    monkeypatch.setattr(statuses.settings, "health_check_timeout", 0.2)
+    asyncio.run(statuses.health_cache.clear())
+
+    start_time = time.perf_counter()
+    response = client.get("/ping")
+    elapsed = time.perf_counter() - start_time
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["db"].endswith("milliseconds")
+    assert response_json["minio"] is None
+    # проверки идут параллельно: общее время меньше суммы таймаутов
+    assert elapsed < 1
+    # повторная проба берет результат из кэша
+    response = client.get("/ping")
+    assert response.json() == response_json
+    assert calls == ["db", "minio"]
+    asyncio.run(statuses.health_cache.clear())
+
+
+def test_metrics(client):
+    client.get("/ping/db-pool")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # маршрут попадает в метку шаблоном пути
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/ping/db-pool",status="200"}'
+    ) in response.text
+    for name in (
+        "s3_operation_duration_seconds",
+        "service_call_duration_seconds",
+        "storage_uploaded_bytes_total",
+        "db_pool_checkouts_total",
+    ):
+        assert name in response.text
+
+
+def test_request_id(client):
+    response = client.get("/ping/db-pool", headers={"X-Request-ID": "abc"})
+    assert response.headers["x-request-id"] == "abc"
+    # без заголовка идентификатор создается сервисом
+    response = client.get("/ping/db-pool")
+    assert len(response.headers["x-request-id"]) == 32
+
+
+def test_get_logger_configures_once():
+    records = []
+    logger = get_logger()
+    handler_id = logger.add(
+        records.append, format="{extra[request_id]} {message}"
+    )
+    # повторные вызовы не добавляют и не сбрасывают обработчики
+    get_logger()
+    token = request_id_var.set("request-1")
+    get_logger().info("hello")
+    request_id_var.reset(token)
+    logger.remove(handler_id)
+    assert records == ["request-1 hello\n"]
+
+
+def test_migrations_check(client):
+    from migrations.utils import check_revision
+    from src.db.db import engine
+
+    # тестовая БД мигрирована до последней ревизии, проверка проходит
+    asyncio.run(check_revision(engine))
+    # настройки читаются один раз на процесс
+    assert get_settings() is get_settings()
@@ -0,0 +1,206 @@
+import asyncio
+import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+from passlib.handlers.bcrypt import bcrypt
+
+from src.clients.s3 import S3Client
+from src.models.file import File
+from src.models.upload import UploadSession
+from src.models.user import User
+from src.services.files import FilesService
+from src.services.uploads import UploadsService
+
+
+class FakeMultipartStorage:
+    """Multipart загрузки хранилища в памяти."""
+
+    def __init__(self):
+        self.uploads = {}
+        self.completed = {}
+        self.aborted = []
+
+    async def create_multipart_upload(self, bucket_name, object_name):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {}
+        return upload_id
+
+    async def upload_part(
+        self, bucket_name, object_name, upload_id, part_number, data
+    ):
+        self.uploads[upload_id][part_number] = data
+        return f'"{part_number}"'
+
+    async def list_parts(self, bucket_name, object_name, upload_id):
+        return [
+            {"PartNumber": number, "Size": len(data), "ETag": f'"{number}"'}
+            for number, data in self.uploads[upload_id].items()
+        ]
+
+    async def complete_multipart_upload(
+        self, bucket_name, object_name, upload_id, parts
+    ):
+        data = self.uploads.pop(upload_id)
+        self.completed[object_name] = b"".join(
+            data[part["PartNumber"]] for part in parts
+        )
+        return {"ETag": '"complete-3"'}
+
+    async def object_exists(self, bucket_name, object_name):
+        if object_name in self.completed:
+            return True, {"ETag": '"complete-3"'}
+        return False, {}
+
+    async def abort_multipart_upload(
+        self, bucket_name, object_name, upload_id
+    ):
+        self.uploads.pop(upload_id, None)
+        self.aborted.append(upload_id)
+
+
+def test_resumable_upload(
+    client, cleanup_after_test, sync_session, monkeypatch
+):
+    test_email = "test@test.com"
+    test_pass = "testpass"
+    sync_session.add(User(email=test_email, password=bcrypt.hash(test_pass)))
+    sync_session.commit()
+    request = {"username": test_email, "password": test_pass}
+    response = client.post("/auth", data=request)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    storage = FakeMultipartStorage()
+    for method in (
+        "create_multipart_upload",
+        "upload_part",
+        "list_parts",
+        "complete_multipart_upload",
+        "abort_multipart_upload",
+        "object_exists",
+    ):
+        monkeypatch.setattr(S3Client, method, getattr(storage, method))
+    monkeypatch.setattr(UploadsService, "part_size", 10)
+    content = b"0123456789abcdefghijKLMNO"
+
+    response = client.post(
+        "/files/uploads",
+        headers=headers,
+        json={"path": "big/file.bin", "size": len(content)},
+    )
+    assert response.status_code == 201
+    upload = response.json()
+    assert upload["part_size"] == 10
+    assert upload["parts_count"] == 3
+    url = f"/files/uploads/{upload['id']}"
+
+    # части загружаются в любом порядке
+    for offset in (20, 10):
+        response = client.put(
+            url,
+            headers=headers,
+            params={"offset": offset},
+            content=content[offset : offset + 10],
+        )
+        assert response.status_code == 200
+        assert response.json()["part_number"] == offset // 10 + 1
+    # смещение должно быть кратно размеру части, размер части - точным
+    response = client.put(
+        url, headers=headers, params={"offset": 5}, content=content[5:15]
+    )
+    assert response.status_code == 422
+    response = client.put(
+        url, headers=headers, params={"offset": 0}, content=content[:9]
+    )
+    assert response.status_code == 422
+    # собрать файл без первой части нельзя
+    response = client.post(f"{url}/complete", headers=headers)
+    assert response.status_code == 422
+    # после обрыва клиент узнает, какие части уже загружены
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["uploaded_size"] == 15
+    assert [part["offset"] for part in response.json()["parts"]] == [10, 20]
+
+    # часть можно загрузить и напрямую в хранилище по ссылке
+    get_upload_part_url = AsyncMock(return_value="http://s3:9000/part")
+    monkeypatch.setattr(S3Client, "get_upload_part_url", get_upload_part_url)
+    response = client.get(f"{url}/link", headers=headers, params={"offset": 0})
+    assert response.status_code == 200
+    assert response.json()["part_number"] == 1
+    assert response.json()["size"] == 10
+    response = client.put(
+        url, headers=headers, params={"offset": 0}, content=content[:10]
+    )
+    assert response.status_code == 200
+    # объект собирается под ключом загрузки, а не под путем файла;
+    # если сохранить файл не удалось, повторный запрос найдет объект
+    record_files = FilesService.record_files
+    monkeypatch.setattr(
+        FilesService, "record_files", AsyncMock(side_effect=OSError)
+    )
+    with pytest.raises(OSError):
+        client.post(f"{url}/complete", headers=headers)
+    object_key = f"uploads/{upload['id']}"
+    assert storage.completed == {object_key: content}
+    sync_session.expire_all()
+    assert sync_session.get(UploadSession, upload["id"]).status == (
+        "completing"
+    )
+    monkeypatch.setattr(FilesService, "record_files", record_files)
+    response = client.post(f"{url}/complete", headers=headers)
+    assert response.status_code == 200
+    file_item = response.json()
+    assert file_item["path"] == f"{test_email}/big/file.bin"
+    assert file_item["size"] == len(content)
+    file_object = sync_session.get(File, file_item["id"])
+    assert file_object.object_key == object_key
+    assert file_object.etag == '"complete-3"'
+    assert file_object.blob_digest is None
+    assert sync_session.get(UploadSession, upload["id"]) is None
+    response = client.post(f"{url}/complete", headers=headers)
+    assert response.status_code == 404
+
+    # отмененная загрузка удаляет части в хранилище
+    response = client.post(
+        "/files/uploads",
+        headers=headers,
+        json={"path": "big/other.bin", "size": 5},
+    )
+    url = f"/files/uploads/{response.json()['id']}"
+    response = client.delete(url, headers=headers)
+    assert response.status_code == 204
+    assert storage.aborted == ["upload-2"]
+    response = client.get(url, headers=headers)
+    assert response.status_code == 404
+
+    # брошенные загрузки отменяет сборщик
+    response = client.post(
+        "/files/uploads",
+        headers=headers,
+        json={"path": "big/stale.bin", "size": 5},
+    )
+    stale_upload = sync_session.get(UploadSession, response.json()["id"])
+    stale_upload.updated_at = datetime.datetime(2000, 1, 1)
+    sync_session.commit()
+    assert asyncio.run(UploadsService.reap_stale_sessions()) == 1
+    assert storage.aborted == ["upload-2", "upload-3"]
+
+
+def test_list_parts_pagination():
+    client = AsyncMock()
+    client.list_parts.side_effect = [
+        {
+            "Parts": [{"PartNumber": 1}],
+            "IsTruncated": True,
+            "NextPartNumberMarker": 1,
+        },
+        {"Parts": [{"PartNumber": 2}], "IsTruncated": False},
+    ]
+    s3_client = S3Client(logger=None, endpoint="http://s3:9000")
+    s3_client._client = client
+
+    parts = asyncio.run(s3_client.list_parts("bucket", "file.bin", "id"))
+
+    assert parts == [{"PartNumber": 1}, {"PartNumber": 2}]
+    assert client.list_parts.await_args.kwargs["PartNumberMarker"] == 1
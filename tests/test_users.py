@@ -1,4 +1,13 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock
+
+from src.api.v1.auth import load_user
+from src.core.cache import MemoryCache
+from src.core.security import hash_password, verify_password
 from src.data_classes.users import UserRegisterData
+from src.models.user import User
+from src.services.user import UserService
 
 
 def test_user_registration(client, cleanup_after_test):
@@ -30,3 +39,85 @@ def test_user_login(client, cleanup_after_test):
     json_response = response.json()
     assert "access_token" in json_response
     assert "token_type" in json_response
+
+
+def test_memory_cache_lru_and_ttl(monkeypatch):
+    cache = MemoryCache(maxsize=2, ttl=10)
+    now = 100.0
+    monkeypatch.setattr("src.core.cache.time.monotonic", lambda: now)
+
+    async def run():
+        nonlocal now
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        # обращение к "a" делает его последним использованным
+        assert await cache.get("a") == 1
+        await cache.set("c", 3)
+        assert await cache.get("b") is None
+        assert len(cache) == 2
+        now += 11
+        assert await cache.get("a") is None
+        assert await cache.get("c") is None
+
+    asyncio.run(run())
+
+
+def test_load_user_is_cached(monkeypatch):
+    test_email = "cached@test.com"
+    get_user_by_email = AsyncMock(
+        return_value=User(email=test_email, password="hash")
+    )
+    monkeypatch.setattr(UserService, "get_user_by_email", get_user_by_email)
+    monkeypatch.setattr(
+        "src.api.v1.auth.async_session",
+        MagicMock(
+            return_value=MagicMock(
+                __aenter__=AsyncMock(), __aexit__=AsyncMock(return_value=False)
+            )
+        ),
+    )
+
+    async def run():
+        await UserService.cache.clear()
+        first_user = await load_user(test_email)
+        second_user = await load_user(test_email)
+        assert first_user.email == second_user.email == test_email
+        assert get_user_by_email.await_count == 1
+        await UserService.invalidate_cached_user(test_email)
+        await load_user(test_email)
+        assert get_user_by_email.await_count == 2
+        await UserService.cache.clear()
+
+    asyncio.run(run())
+
+
+def test_password_hashing_runs_in_worker_threads(monkeypatch):
+    # хеши считаются в пуле потоков, а не в потоке event loop; как это
+    # сказывается на задержках, измеряет benchmarks/login_storm.py
+    threads = []
+
+    def record_thread(*args):
+        threads.append(threading.current_thread().name)
+        return "hash"
+
+    monkeypatch.setattr(
+        "src.core.security.password_hasher",
+        MagicMock(hash=MagicMock(side_effect=record_thread)),
+    )
+    monkeypatch.setattr(
+        "src.core.security.bcrypt",
+        MagicMock(verify=MagicMock(side_effect=record_thread)),
+    )
+
+    async def run():
+        password_hashes = await asyncio.gather(
+            *(hash_password(f"password{num}") for num in range(4))
+        )
+        assert password_hashes == ["hash"] * 4
+        assert await verify_password("password0", password_hashes[0])
+        return threading.current_thread().name
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 5
+    assert loop_thread not in threads
+    assert all(name.startswith("password-hash") for name in threads)